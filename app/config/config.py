@@ -8,12 +8,81 @@ class Settings(BaseSettings):
     BASE_PATH: Optional[str] = ""
     ORG_NAME: Optional[str] = ""
     DATABASE_PATH: Optional[str] = ""
+    # "tinydb" keeps the policies in DATABASE_PATH, "sqlite" in an indexed SQLite file,
+    # next to DATABASE_PATH unless POLICY_SQLITE_PATH is set, migrated from DATABASE_PATH on first use
+    POLICY_STORE: Optional[str] = "tinydb"
+    POLICY_SQLITE_PATH: Optional[str] = ""
     TEST_DATABASE_PATH: Optional[str] = ""
     OPAL_SERVER_DATA_URL: Optional[str] = ""
     ENVIRONMENT: Optional[str] = "production"
 
     GITHUB_ACCESS_TOKEN: Optional[str] = ""
 
+    # PROVIDERS
+    GITLAB_URL: Optional[str] = "https://gitlab.com"
+    GITHUB_API_URL: Optional[str] = "https://api.github.com"
+    # Seconds to wait for a provider to verify a token
+    PROVIDER_TIMEOUT: Optional[float] = 10
+
+    # OUTBOUND HTTP CLIENT
+    HTTP_TIMEOUT: Optional[float] = 30
+    HTTP_MAX_CONNECTIONS: Optional[int] = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: Optional[int] = 20
+
+    # TOKEN VERIFICATION CACHE, in seconds
+    TOKEN_CACHE_TTL: Optional[float] = 300
+    TOKEN_CACHE_NEGATIVE_TTL: Optional[float] = 10
+    TOKEN_CACHE_SIZE: Optional[int] = 4096
+
+    # REPOSITORY LISTINGS, in seconds
+    # Served from memory for REPO_CACHE_TTL, then refreshed in the background until REPO_CACHE_STALE_TTL
+    REPO_CACHE_TTL: Optional[float] = 60
+    REPO_CACHE_STALE_TTL: Optional[float] = 3600
+    REPO_CACHE_SIZE: Optional[int] = 1024
+    REPO_PAGE_SIZE: Optional[int] = 100
+    REPO_MAX_PAGES: Optional[int] = 10
+
+    # PROVIDER CLIENTS, reused per repository and token for CLIENT_POOL_TTL seconds
+    CLIENT_POOL_SIZE: Optional[int] = 64
+    CLIENT_POOL_TTL: Optional[float] = 600
+
+    # EXECUTOR POOLS
+    GIT_POOL_SIZE: Optional[int] = 4
+    GIT_POOL_QUEUE: Optional[int] = 64
+    # TinyDB rewrites the whole file on every change, so storage work is serialised by default
+    STORAGE_POOL_SIZE: Optional[int] = 1
+    STORAGE_POOL_QUEUE: Optional[int] = 256
+    COMPUTE_POOL_SIZE: Optional[int] = 2
+    COMPUTE_POOL_QUEUE: Optional[int] = 64
+
+    # GITHUB WORKING COPIES
+    # "worktree" commits from a sparse checkout, "objects" builds the commits in a shared bare repository
+    GIT_PUBLISH_ENGINE: Optional[str] = "worktree"
+    GIT_CLONE_DEPTH: Optional[int] = 1
+    GIT_CLONE_POOL_SIZE: Optional[int] = 16
+    # Megabytes the working copies may use together
+    GIT_CLONE_DISK_BUDGET: Optional[int] = 512
+
+    # PUBLISHING, in seconds
+    # Mutations of a repository within the window are published in one commit
+    PUBLISH_DEBOUNCE: Optional[float] = 0.25
+    PUBLISH_MAX_DELAY: Optional[float] = 2
+    # Answer mutations with 202 and a job id instead of waiting for the push,
+    # the job status is recorded under BASE_PATH/jobs so every worker can answer for it
+    PUBLISH_ASYNC: Optional[bool] = False
+    PUBLISH_JOB_HISTORY: Optional[int] = 1000
+
+    # REGO COMPILATION
+    REGO_FRAGMENT_CACHE_SIZE: Optional[int] = 1024
+    REGO_OPTIMIZE: Optional[bool] = False
+    REGO_PATH_LOOKUP: Optional[bool] = False
+    REGO_INDEXED_DATASOURCES: Optional[bool] = False
+    # "single" writes every policy to auth.rego, "sharded" writes one module per policy
+    REGO_OUTPUT_MODE: Optional[str] = "single"
+
+    # PATH TRIES of the /overlaps and /grants checks, kept per owner and repository
+    PATH_TRIE_CACHE_SIZE: Optional[int] = 256
+
     # POSTGRES CONNECTION
     HOST: Optional[str] = ""
     PASSWORD: Optional[str] = ""
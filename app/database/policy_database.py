@@ -1,7 +1,20 @@
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Iterator, Optional
+
 from fastapi import HTTPException
-from tinydb import Query, TinyDB
 
 from app.config.config import settings
+from app.database.policy_store import (
+    Mutation,
+    NameTaken,
+    PolicyStore,
+    TinyDBStore,
+    open_store,
+    repo_key,
+)
+from app.utils.path_trie import PathTrie, PathTrieCache
 
 
 class PolicyDatabase:
@@ -9,14 +22,15 @@ class PolicyDatabase:
     Performs all CRUD operations on the policy
     """
 
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str = None, backend: PolicyStore = None):
         """
         Initializes the database class with base arguments
 
         :param database_url: the url of the policy database (tinydb)
+        :param backend: the storage backend, a TinyDB store of database_url by default
         """
-        self.database = TinyDB(database_url)
-        self.store = Query()
+        self.backend = backend or TinyDBStore(database_url)
+        self.path_tries = PathTrieCache(settings.PATH_TRIE_CACHE_SIZE)
 
     def get_policy(self, policy_name: str, owner: str) -> dict:
         """Returns the policy with the given name and owner
@@ -25,9 +39,7 @@ class PolicyDatabase:
         :param owner: the user that writes the policy
         :returns: the policy with the given name and owner
         """
-        policy = self.database.get(
-            (self.store.name == policy_name) & (self.store.owner == owner)
-        )
+        policy = self.backend.get(policy_name, owner)
         if policy:
             return policy
         return {}
@@ -39,12 +51,19 @@ class PolicyDatabase:
         :param owner: the user that writes the policy
         :returns: the policy that was added to the database
         """
-        if self.exists(policy["name"], owner):
-            raise HTTPException(
-                status_code=409, detail="Rules with the same name already exist"
-            )
-        self.database.insert(policy)
-        return policy
+        return self.insert_policy(policy, owner).policy
+
+    def insert_policy(self, policy: dict, owner: str) -> Mutation:
+        """Adds a policy to the database if it doesn't exist, in a single pass over the store
+
+        :param policy: the policy to add to the database
+        :param owner: the user that writes the policy
+        :returns: the policy that was added
+        """
+        mutation = self.backend.add(policy, owner)
+        if mutation is None:
+            raise HTTPException(status_code=409, detail="Policy already exists")
+        return mutation
 
     def update_policy(self, policy_name: str, policy: dict, owner: str) -> None:
         """Identify the policy with the given name and owner and update it
@@ -55,11 +74,23 @@ class PolicyDatabase:
 
         :returns: None
         """
-        policy = self.get_policy(policy_name, owner)
+        self.backend.update(policy_name, owner, policy)
 
-        self.database.update(
-            policy, (self.store.name == policy_name) & (self.store.owner == owner)
-        )
+    def modify_policy(self, policy_name: str, fields: dict, owner: str) -> Mutation:
+        """Identify the policy with the given name and owner and update it, in a single pass over the store
+
+        :param policy_name: the name to identify the policy
+        :param fields: the fields to update the old policy with
+        :param owner: the user that writes the policy
+        :returns: the updated policy and the policy before the update
+        """
+        try:
+            mutation = self.backend.modify(policy_name, owner, fields)
+        except NameTaken:
+            raise HTTPException(status_code=409, detail="Policy already exists")
+        if mutation is None:
+            raise HTTPException(status_code=404, detail="Policy not found")
+        return mutation
 
     def exists(self, policy_name: str, owner: str) -> bool:
         """Checks if a policy with the given name and owner exists
@@ -69,9 +100,7 @@ class PolicyDatabase:
 
         :returns: True if the policy exists, False otherwise
         """
-        doc = self.database.get(
-            (self.store.name == policy_name) & (self.store.owner == owner)
-        )
+        doc = self.backend.get(policy_name, owner)
         is_exist = True if doc else False
         return is_exist
 
@@ -80,11 +109,20 @@ class PolicyDatabase:
 
         :param policy_name: the name to identify the policy
         :param owner: the user that writes the policy"""
-        self.database.remove(
-            (self.store.name == policy_name)
-            & (self.store.owner == owner)
-            & (self.store.repo_url == repo_url)
-        )
+        self.backend.remove(policy_name, owner, repo_url)
+
+    def remove_policy(self, policy_name: str, owner: str, repo_url: str) -> Mutation:
+        """Identify the policy with the given name and owner and delete it, in a single pass over the store
+
+        :param policy_name: the name to identify the policy
+        :param owner: the user that writes the policy
+        :param repo_url: the url of the repository the policy is pushed to
+        :returns: the deleted policy
+        """
+        mutation = self.backend.discard(policy_name, owner, repo_url)
+        if mutation is None:
+            raise HTTPException(status_code=404, detail="Policy not found")
+        return mutation
 
     def get_policies(self, owner: str) -> list:
         """Returns all the policies of the given owner
@@ -92,10 +130,55 @@ class PolicyDatabase:
         :param owner: the user that writes the policy
         :return: all the policies of the given owner
         """
-        return self.database.search((self.store.owner == owner))
-        policies = self.database.search(self.store.owner == owner)
-        return policies
+        return self.backend.by_owner(owner)
+
+    def get_repo_policies(self, owner: str, repo_url: str) -> list:
+        """Returns the policies of the given owner that are pushed to the given repository
+
+        :param owner: the user that writes the policy
+        :param repo_url: the url of the repository the policies are pushed to
+        :return: the policies of the given owner in the given repository
+        """
+        return self.backend.by_repo(owner, repo_url)
+
+    @contextmanager
+    def path_trie(self, owner: str, repo_url: str = None) -> Iterator[PathTrie]:
+        """Use the path trie of the policies of the given owner, kept across requests
+        and brought up to date with the policies written since it was last used
+
+        :param owner: the user that writes the policy
+        :param repo_url: only index the policies pushed to this repository, when given
+        :returns: the trie, to be used within the block only
+        """
+        # Read before the policies, so a write in between syncs the trie again next time
+        version = self.backend.version()
+        if repo_url:
+            key = (owner, repo_key(repo_url))
+            load = partial(self.backend.by_repo, owner, repo_url)
+        else:
+            key = (owner, None)
+            load = partial(self.backend.by_owner, owner)
+        with self.path_tries.use(key, version, load) as trie:
+            yield trie
+
+
+_database: Optional[PolicyDatabase] = None
+_database_lock = threading.Lock()
 
 
 def get_db() -> PolicyDatabase:
-    return PolicyDatabase(settings.DATABASE_PATH)
+    """
+    Returns the policy database of the worker, opened on first use and shared by every request.
+    The backend notices the writes of other workers, see TinyDBStore.
+    """
+    global _database
+    with _database_lock:
+        if _database is None:
+            _database = PolicyDatabase(
+                backend=open_store(
+                    settings.POLICY_STORE,
+                    settings.DATABASE_PATH,
+                    settings.POLICY_SQLITE_PATH,
+                )
+            )
+    return _database
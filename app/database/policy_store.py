@@ -0,0 +1,561 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional
+
+from tinydb import Query, TinyDB
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, the store is then only safe within a single worker
+    fcntl = None
+
+
+def repo_key(repo_url: Optional[str]) -> str:
+    """Normalizes a repository url, so the same repository always maps to the same partition
+
+    :param repo_url: the url of the repository the policy is pushed to
+    :returns: the url without trailing slash and .git suffix
+    """
+    return (repo_url or "").strip().rstrip("/").removesuffix(".git")
+
+
+class NameTaken(Exception):
+    """Raised by a write that would give a policy the name of another policy of its owner"""
+
+
+class Mutation(NamedTuple):
+    """The outcome of a write"""
+
+    # The policy as stored after the write, or as it was before it was removed
+    policy: dict
+    # The policy before the write, None for an insert
+    previous: Optional[dict]
+
+
+class PolicyStore(ABC):
+    """
+    The storage backend of PolicyDatabase, holding the policy documents
+    """
+
+    @abstractmethod
+    def get(self, policy_name: str, owner: str) -> Optional[dict]:
+        """Returns the first policy with the given name and owner, None if there is none"""
+
+    @abstractmethod
+    def insert(self, policy: dict) -> None:
+        """Stores a new policy"""
+
+    @abstractmethod
+    def update(self, policy_name: str, owner: str, fields: dict) -> None:
+        """Merges fields into the policies with the given name and owner"""
+
+    @abstractmethod
+    def remove(self, policy_name: str, owner: str, repo_url: str) -> None:
+        """Removes the policies with the given name, owner and repository url"""
+
+    @abstractmethod
+    def by_owner(self, owner: str) -> list:
+        """Returns the policies of the given owner, in insertion order"""
+
+    @abstractmethod
+    def by_repo(self, owner: str, repo_url: str) -> list:
+        """Returns the policies of the given owner pushed to the given repository, in insertion order"""
+
+    @abstractmethod
+    def all(self) -> list:
+        """Returns every policy, in insertion order"""
+
+    def version(self) -> Any:
+        """Returns a value that changes on every write, including those of other workers, None if the store can't tell"""
+        return None
+
+    # The compound operations below answer a route with a single pass over the store,
+    # the backends override them to run in one transaction
+
+    def add(self, policy: dict, owner: str) -> Optional[Mutation]:
+        """Stores a new policy, unless the owner has one with the same name
+
+        :returns: the policy, None if the name is taken
+        """
+        if self.get(policy["name"], owner) is not None:
+            return None
+        self.insert(policy)
+        return Mutation(policy, None)
+
+    def modify(self, policy_name: str, owner: str, fields: dict) -> Optional[Mutation]:
+        """Merges fields into the first policy with the given name and owner
+
+        :returns: the updated policy and the policy before the update, None if there is no such policy
+        :raises NameTaken: if fields rename the policy to the name of another policy of the owner
+        """
+        previous = self.get(policy_name, owner)
+        if previous is None:
+            return None
+        name = fields.get("name", policy_name)
+        if name != policy_name and self.get(name, owner) is not None:
+            raise NameTaken(name)
+        self.update(policy_name, owner, fields)
+        policy = {**previous, **fields}
+        return Mutation(policy, previous)
+
+    def discard(
+        self, policy_name: str, owner: str, repo_url: str
+    ) -> Optional[Mutation]:
+        """Removes the policies with the given name, owner and repository url
+
+        :returns: the first policy removed, None if no policy has the name, owner and repository url
+        """
+        policy = next(
+            (
+                policy
+                for policy in self.by_owner(owner)
+                if policy.get("name") == policy_name
+                and policy.get("repo_url") == repo_url
+            ),
+            None,
+        )
+        if policy is None:
+            return None
+        self.remove(policy_name, owner, repo_url)
+        return Mutation(policy, policy)
+
+
+class _Snapshot:
+    """The policies of a TinyDB file as last read, indexed by owner, name and repository"""
+
+    def __init__(self, signature: tuple, policies: list) -> None:
+        self.signature = signature
+        self.policies = policies
+        self.by_owner: Dict[str, list] = {}
+        self.by_name: Dict[tuple, dict] = {}
+        self.by_repo: Dict[tuple, list] = {}
+        for policy in policies:
+            owner = policy.get("owner")
+            self.by_owner.setdefault(owner, []).append(policy)
+            self.by_name.setdefault((owner, policy.get("name")), policy)
+            key = (owner, repo_key(policy.get("repo_url")))
+            self.by_repo.setdefault(key, []).append(policy)
+
+
+class TinyDBStore(PolicyStore):
+    """
+    Keeps the policies in a TinyDB JSON file.
+
+    The file is parsed once into an in-memory snapshot indexed by owner, and parsed again
+    only when it changed, e.g after a write from another worker.
+    Writes rewrite the whole file under an exclusive lock of the lock file next to it,
+    reads of the file take a shared lock, so workers never see a partly written file.
+    Every write also appends a byte to the lock file, whose size is then a generation counter
+    that catches the writes a coarse mtime would miss.
+    """
+
+    def __init__(self, database_url: str) -> None:
+        """
+        :param database_url: the path of the JSON file
+        """
+        self.database_url = database_url
+        self.reads = 0
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = threading.RLock()
+        self._lock_file = open(f"{database_url}.lock", "a")
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _signature(self) -> tuple:
+        generation = os.fstat(self._lock_file.fileno()).st_size
+        try:
+            stat = os.stat(self.database_url)
+        except FileNotFoundError:
+            return (generation,)
+        return generation, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def snapshot(self) -> _Snapshot:
+        """
+        Get the policies, parsing the file again only if it changed since it was last parsed
+
+        :returns: the policies, indexed by owner, name and repository
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.signature != self._signature():
+                with self._file_lock(exclusive=False):
+                    signature = self._signature()
+                    # A TinyDB instance caches query results and document ids,
+                    # which other workers' writes make stale, so none is kept open
+                    with TinyDB(self.database_url) as database:
+                        policies = database.all()
+                self._snapshot = _Snapshot(signature, policies)
+                self.reads += 1
+            return self._snapshot
+
+    def _write(self, operation: Callable[[TinyDB], None]) -> None:
+        with self._lock, self._file_lock(exclusive=True):
+            with TinyDB(self.database_url) as database:
+                operation(database)
+            self._lock_file.write("\n")
+            self._lock_file.flush()
+            self._snapshot = None
+
+    def _transact(
+        self, mutate: Callable[[Dict[str, dict]], Optional[Mutation]]
+    ) -> Optional[Mutation]:
+        """
+        Read the file once, change its documents in memory and write it once.
+        The snapshot is rebuilt from the written documents, so the next read doesn't parse the file.
+
+        :param mutate: changes the documents, keyed by document id, None leaves the file untouched
+        :returns: what mutate returned
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            with TinyDB(self.database_url) as database:
+                data = database.storage.read() or {}
+                table = data.setdefault(database.default_table_name, {})
+                mutation = mutate(table)
+                if mutation is None:
+                    return None
+                database.storage.write(data)
+            self._lock_file.write("\n")
+            self._lock_file.flush()
+            self._snapshot = _Snapshot(self._signature(), list(table.values()))
+        return mutation
+
+    @staticmethod
+    def _find(table: Dict[str, dict], policy_name: str, owner: str) -> Optional[str]:
+        return next(
+            (
+                doc_id
+                for doc_id, policy in table.items()
+                if policy.get("name") == policy_name and policy.get("owner") == owner
+            ),
+            None,
+        )
+
+    def add(self, policy: dict, owner: str) -> Optional[Mutation]:
+        def mutate(table: Dict[str, dict]) -> Optional[Mutation]:
+            if self._find(table, policy["name"], owner) is not None:
+                return None
+            doc_id = str(max(map(int, table), default=0) + 1)
+            table[doc_id] = dict(policy)
+            return Mutation(dict(policy), None)
+
+        return self._transact(mutate)
+
+    def modify(self, policy_name: str, owner: str, fields: dict) -> Optional[Mutation]:
+        def mutate(table: Dict[str, dict]) -> Optional[Mutation]:
+            doc_id = self._find(table, policy_name, owner)
+            if doc_id is None:
+                return None
+            name = fields.get("name", policy_name)
+            if name != policy_name and self._find(table, name, owner) is not None:
+                raise NameTaken(name)
+            previous = table[doc_id]
+            # As TinyDB's update, every policy with the name and owner gets the fields
+            for key, policy in table.items():
+                if policy.get("name") == policy_name and policy.get("owner") == owner:
+                    table[key] = {**policy, **fields}
+            return Mutation(dict(table[doc_id]), dict(previous))
+
+        return self._transact(mutate)
+
+    def discard(
+        self, policy_name: str, owner: str, repo_url: str
+    ) -> Optional[Mutation]:
+        def mutate(table: Dict[str, dict]) -> Optional[Mutation]:
+            keys = [
+                key
+                for key, stored in table.items()
+                if stored.get("name") == policy_name
+                and stored.get("owner") == owner
+                and stored.get("repo_url") == repo_url
+            ]
+            if not keys:
+                return None
+            policy = dict(table[keys[0]])
+            for key in keys:
+                del table[key]
+            return Mutation(policy, policy)
+
+        return self._transact(mutate)
+
+    def get(self, policy_name: str, owner: str) -> Optional[dict]:
+        policy = self.snapshot().by_name.get((owner, policy_name))
+        return dict(policy) if policy is not None else None
+
+    def insert(self, policy: dict) -> None:
+        self._write(lambda database: database.insert(policy))
+
+    def update(self, policy_name: str, owner: str, fields: dict) -> None:
+        store = Query()
+        self._write(
+            lambda database: database.update(
+                fields, (store.name == policy_name) & (store.owner == owner)
+            )
+        )
+
+    def remove(self, policy_name: str, owner: str, repo_url: str) -> None:
+        store = Query()
+        self._write(
+            lambda database: database.remove(
+                (store.name == policy_name)
+                & (store.owner == owner)
+                & (store.repo_url == repo_url)
+            )
+        )
+
+    # The snapshot is shared, callers get their own copy of every policy
+    def by_owner(self, owner: str) -> list:
+        return [dict(policy) for policy in self.snapshot().by_owner.get(owner, [])]
+
+    def by_repo(self, owner: str, repo_url: str) -> list:
+        policies = self.snapshot().by_repo.get((owner, repo_key(repo_url)), [])
+        return [dict(policy) for policy in policies]
+
+    def all(self) -> list:
+        return [dict(policy) for policy in self.snapshot().policies]
+
+    def version(self) -> tuple:
+        return self.snapshot().signature
+
+    def close(self) -> None:
+        self._lock_file.close()
+
+
+class SQLiteStore(PolicyStore):
+    """
+    Keeps the policies in an embedded SQLite database, as JSON documents
+    indexed on (owner, name) and (owner, normalized repository url).
+    Every write is a transaction that touches only the rows it changes.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS policies (
+            id INTEGER PRIMARY KEY,
+            owner TEXT,
+            name TEXT,
+            repo_url TEXT,
+            repo_key TEXT NOT NULL,
+            document TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS policies_owner_name ON policies (owner, name)",
+        "CREATE INDEX IF NOT EXISTS policies_owner_repo ON policies (owner, repo_key)",
+    )
+
+    def __init__(self, database_url: str) -> None:
+        """
+        :param database_url: the path of the SQLite file
+        """
+        # Requests use the store from the storage pool threads, one at a time under the lock
+        self.connection = sqlite3.connect(database_url, check_same_thread=False)
+        self._lock = threading.Lock()
+        # data_version only changes on the commits of other connections, this one counts its own
+        self._writes = 0
+        with self._lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+
+    @staticmethod
+    def _row(policy: dict) -> tuple:
+        return (
+            policy.get("owner"),
+            policy.get("name"),
+            policy.get("repo_url"),
+            repo_key(policy.get("repo_url")),
+            json.dumps(policy),
+        )
+
+    def _select(self, where: str, *args) -> list:
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT document FROM policies WHERE {where} ORDER BY id", args
+            ).fetchall()
+        return [json.loads(document) for document, in rows]
+
+    def get(self, policy_name: str, owner: str) -> Optional[dict]:
+        policies = self._select("owner = ? AND name = ?", owner, policy_name)
+        return policies[0] if policies else None
+
+    def insert(self, policy: dict) -> None:
+        self.insert_many([policy])
+
+    def insert_many(self, policies: list) -> None:
+        """Stores policies in a single transaction"""
+        with self._lock, self.connection:
+            self._writes += 1
+            self.connection.executemany(
+                "INSERT INTO policies (owner, name, repo_url, repo_key, document) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [self._row(policy) for policy in policies],
+            )
+
+    def update(self, policy_name: str, owner: str, fields: dict) -> None:
+        self.modify(policy_name, owner, fields)
+
+    def remove(self, policy_name: str, owner: str, repo_url: str) -> None:
+        with self._lock, self.connection:
+            self._writes += 1
+            self.connection.execute(
+                "DELETE FROM policies WHERE owner = ? AND name = ? AND repo_url = ?",
+                (owner, policy_name, repo_url),
+            )
+
+    def by_owner(self, owner: str) -> list:
+        return self._select("owner = ?", owner)
+
+    def by_repo(self, owner: str, repo_url: str) -> list:
+        return self._select("owner = ? AND repo_key = ?", owner, repo_key(repo_url))
+
+    def _transaction(
+        self, mutate: Callable[[sqlite3.Connection], Optional[Mutation]]
+    ) -> Optional[Mutation]:
+        # IMMEDIATE takes the write lock before the first read, so the check and the write are atomic
+        with self._lock, self.connection:
+            self._writes += 1
+            self.connection.execute("BEGIN IMMEDIATE")
+            return mutate(self.connection)
+
+    @staticmethod
+    def _first(connection: sqlite3.Connection, policy_name: str, owner: str) -> tuple:
+        return connection.execute(
+            "SELECT id, document FROM policies WHERE owner = ? AND name = ? "
+            "ORDER BY id LIMIT 1",
+            (owner, policy_name),
+        ).fetchone()
+
+    def add(self, policy: dict, owner: str) -> Optional[Mutation]:
+        def mutate(connection: sqlite3.Connection) -> Optional[Mutation]:
+            if self._first(connection, policy["name"], owner) is not None:
+                return None
+            connection.execute(
+                "INSERT INTO policies (owner, name, repo_url, repo_key, document) "
+                "VALUES (?, ?, ?, ?, ?)",
+                self._row(policy),
+            )
+            return Mutation(dict(policy), None)
+
+        return self._transaction(mutate)
+
+    def modify(self, policy_name: str, owner: str, fields: dict) -> Optional[Mutation]:
+        def mutate(connection: sqlite3.Connection) -> Optional[Mutation]:
+            first = self._first(connection, policy_name, owner)
+            if first is None:
+                return None
+            name = fields.get("name", policy_name)
+            if name != policy_name and self._first(connection, name, owner) is not None:
+                raise NameTaken(name)
+            rows = connection.execute(
+                "SELECT id, document FROM policies WHERE owner = ? AND name = ?",
+                (owner, policy_name),
+            ).fetchall()
+            for row_id, document in rows:
+                connection.execute(
+                    "UPDATE policies SET owner = ?, name = ?, repo_url = ?, "
+                    "repo_key = ?, document = ? WHERE id = ?",
+                    (*self._row({**json.loads(document), **fields}), row_id),
+                )
+            previous = json.loads(first[1])
+            return Mutation({**previous, **fields}, previous)
+
+        return self._transaction(mutate)
+
+    def discard(
+        self, policy_name: str, owner: str, repo_url: str
+    ) -> Optional[Mutation]:
+        def mutate(connection: sqlite3.Connection) -> Optional[Mutation]:
+            first = connection.execute(
+                "SELECT document FROM policies WHERE owner = ? AND name = ? AND repo_url = ? "
+                "ORDER BY id LIMIT 1",
+                (owner, policy_name, repo_url),
+            ).fetchone()
+            if first is None:
+                return None
+            connection.execute(
+                "DELETE FROM policies WHERE owner = ? AND name = ? AND repo_url = ?",
+                (owner, policy_name, repo_url),
+            )
+            policy = json.loads(first[0])
+            return Mutation(policy, policy)
+
+        return self._transaction(mutate)
+
+    def all(self) -> list:
+        return self._select("1")
+
+    def version(self) -> tuple:
+        with self._lock:
+            (data_version,) = self.connection.execute("PRAGMA data_version").fetchone()
+            return data_version, self._writes
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def migrate_tinydb(json_path: str, store: SQLiteStore) -> int:
+    """
+    Copy every policy of a TinyDB JSON file into a SQLite store, in a single transaction
+
+    :param json_path: the path of the TinyDB file
+    :param store: the store to copy the policies to, expected to be empty
+    :returns: the number of policies copied
+    """
+    source = TinyDBStore(json_path)
+    policies = source.all()
+    source.close()
+    store.insert_many([dict(policy) for policy in policies])
+    return len(policies)
+
+
+def open_store(backend: str, database_url: str, sqlite_path: str = None) -> PolicyStore:
+    """
+    Open the storage backend of the policies.
+    A new SQLite database is filled from the TinyDB file at database_url, once.
+
+    :param backend: "tinydb" or "sqlite"
+    :param database_url: the path of the TinyDB file
+    :param sqlite_path: the path of the SQLite file, next to the TinyDB file by default
+    :returns: the store
+    """
+    if backend != "sqlite":
+        return TinyDBStore(database_url)
+
+    sqlite_path = sqlite_path or f"{os.path.splitext(database_url)[0]}.sqlite"
+    if not os.path.exists(sqlite_path) and os.path.exists(database_url):
+        # Workers starting together migrate one at a time, the others find the database in place
+        with open(f"{sqlite_path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(sqlite_path):
+                    _migrate(database_url, sqlite_path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return SQLiteStore(sqlite_path)
+
+
+def _migrate(database_url: str, sqlite_path: str) -> None:
+    # Filled aside and moved in place, so a failed migration is tried again on the next start
+    migrating = f"{sqlite_path}.migrating"
+    for path in (migrating, f"{migrating}-wal", f"{migrating}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    store = SQLiteStore(migrating)
+    migrate_tinydb(database_url, store)
+    store.close()
+    os.replace(migrating, sqlite_path)
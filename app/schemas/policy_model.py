@@ -1,11 +1,60 @@
-from typing import Dict, List, Optional, Union
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
-class RuleObject(BaseModel):
-    command: str
-    properties: Dict[str, Union[str, List[str], Dict[str, Union[str, List[str]]]]]
+class InputPropEqualsProperties(BaseModel):
+    input_property: str
+    value: Union[List[str], str]
+    exceptional_value: Optional[str]
+
+
+class InputPropInProperties(BaseModel):
+    input_property: str
+    datasource_name: str
+    datasource_loop_variable: Optional[str]
+
+
+class AllowFullAccessProperties(BaseModel):
+    input_property: str
+    value: str
+
+
+class AllowIfObjectInDatabaseProperties(BaseModel):
+    datasource_name: str
+    datasource_variables: List[str] = Field(..., min_items=1)
+
+
+class InputPropEqualsRule(BaseModel):
+    command: Literal["input_prop_equals"]
+    properties: InputPropEqualsProperties
+
+
+class InputPropInRule(BaseModel):
+    command: Literal["input_prop_in"]
+    properties: InputPropInProperties
+
+
+class AllowFullAccessRule(BaseModel):
+    command: Literal["allow_full_access"]
+    properties: AllowFullAccessProperties
+
+
+class AllowIfObjectInDatabaseRule(BaseModel):
+    command: Literal["allow_if_object_in_database"]
+    properties: AllowIfObjectInDatabaseProperties
+
+
+# The command of a rule object selects the schema its properties are validated against
+RuleObject = Annotated[
+    Union[
+        InputPropEqualsRule,
+        InputPropInRule,
+        AllowFullAccessRule,
+        AllowIfObjectInDatabaseRule,
+    ],
+    Field(discriminator="command"),
+]
 
 
 class RequestObject(BaseModel):
@@ -200,3 +249,50 @@ class UpdateRequestObject(BaseModel):
                 ],
             }
         }
+
+
+class DatasourceIndexRequest(BaseModel):
+    """The objects of the datasources the indexed data document is built from"""
+
+    datasources: Dict[str, List[Dict[str, Any]]]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "datasources": {
+                    "usergroups": [
+                        {"name": "admin", "groupname": "EDITOR_ATAC"},
+                        {"name": "r-scheele", "groupname": "VIEWER"},
+                    ],
+                    "items": [{"company": "geobeyond"}],
+                }
+            }
+        }
+
+
+class EvaluationRequest(BaseModel):
+    """Sample decisions to evaluate against the stored policies, without pushing them to OPA"""
+
+    inputs: List[Dict[str, Any]]
+    data: Dict[str, Any] = {}
+    repo_url: Optional[str] = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "repo_url": "https://github.com/r-scheele/opal-policy-example",
+                "inputs": [
+                    {
+                        "request_path": ["v1", "collections", "lakes", ""],
+                        "request_method": "GET",
+                        "groupname": "admin",
+                    },
+                    {
+                        "request_path": ["v1", "collections", "obs"],
+                        "request_method": "GET",
+                        "company": "geobeyond",
+                    },
+                ],
+                "data": {"items": [{"company": "geobeyond"}]},
+            }
+        }
@@ -1,10 +1,23 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from gitlab.exceptions import GitlabAuthenticationError
 from starlette.middleware.cors import CORSMiddleware
 
+from app.server.auth.authorize_token import bearer_token, invalidate_token
 from app.server.auth.get_token import router as auth_router
+from app.server.executors import (
+    ExecutorSaturated,
+    compute_pool,
+    git_pool,
+    storage_pool,
+)
+from app.server.http_client import close_http_client, start_http_client
 from app.server.routes.data import router as data_router
+from app.server.routes.jobs import router as jobs_router
+from app.server.routes.metrics import router as metrics_router
 from app.server.routes.policy import router as api_router
 from app.server.routes.repo import router as user_router
+from app.server.services.client_pool import client_pool
 
 app = FastAPI(
     swagger_ui_parameters={"syntaxHighlight.theme": "obsidian"},
@@ -23,8 +36,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_event_handler("startup", start_http_client)
+app.add_event_handler("shutdown", close_http_client)
+app.add_event_handler("shutdown", git_pool.shutdown)
+app.add_event_handler("shutdown", storage_pool.shutdown)
+app.add_event_handler("shutdown", compute_pool.shutdown)
+
+
+@app.exception_handler(GitlabAuthenticationError)
+async def gitlab_authentication_error(
+    request: Request, exc: GitlabAuthenticationError
+) -> JSONResponse:
+    """The token was revoked or expired since it was verified, so stop trusting it"""
+    invalidate_token(request)
+    token = bearer_token(request)
+    if token:
+        client_pool.invalidate(token)
+    return JSONResponse(
+        status_code=401, content={"detail": "Invalid token or expired token."}
+    )
+
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated(request: Request, exc: ExecutorSaturated) -> JSONResponse:
+    """Shed load instead of queueing more blocking work than the pools are sized for"""
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"}
+    )
+
 
 app.include_router(auth_router)
 app.include_router(api_router)
 app.include_router(user_router)
 app.include_router(data_router)
+app.include_router(metrics_router)
+app.include_router(jobs_router)
@@ -1,10 +1,15 @@
-from typing import Any
+import asyncio
+from typing import Any, Optional
 from urllib.parse import urljoin
 
-import requests as r
+import httpx
 from fastapi import HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from app.config.config import settings
+from app.server.auth.token_cache import token_cache
+from app.server.http_client import get_http_client
+
 
 class TokenBearer(HTTPBearer):
     """This class is used to authenticate a user with a token in the Authorization header."""
@@ -21,38 +26,147 @@ class TokenBearer(HTTPBearer):
                 raise HTTPException(
                     status_code=403, detail="Invalid authentication scheme."
                 )
-            if not self.verify_token(credentials.credentials)[0]:
+            verified, user = await self.verify_token(credentials.credentials)
+            if not verified:
                 raise HTTPException(
                     status_code=403, detail="Invalid token or expired token."
                 )
-            return self.verify_token(credentials.credentials)[1]
+            return user
         else:
             raise HTTPException(status_code=403, detail="Invalid authorization code.")
 
-    def verify_token(
+    async def verify_token(
         self, token: str
     ) -> tuple[bool, Any] | tuple[bool, dict[str, str]]:
 
         """
-        Authenticate a user.
+        Authenticate a user, reusing the outcome of a recent verification of the same token.
+        The provider that accepted the token last time is asked first, otherwise both are asked at once.
 
         :param token: the access token to authenticate the user
         :returns: a tuple with the authentication status and the user data
         """
 
-        gitlab_url = urljoin("https://gitlab.com", f"/api/v4/user?access_token={token}")
-        gitlab_res = r.get(gitlab_url)
-        if gitlab_res.status_code == 200:
-            response = {"token": token, "login": gitlab_res.json()["username"]}
-            return True, response
+        cached = token_cache.get(token)
+        if cached is not None:
+            login = cached[1]
+        else:
+            hint = token_cache.provider(token)
+            provider, login, statuses = None, None, {}
+            if hint in PROBES:
+                provider, login, statuses = await probe_providers(token, [hint])
+            if login is None:
+                others = [name for name in PROBES if name != hint]
+                provider, login, more = await probe_providers(token, others)
+                statuses.update(more)
+
+            # Only remember rejections the providers are sure about, not their outages
+            if login is not None:
+                token_cache.set(token, True, login)
+                token_cache.set_provider(token, provider)
+            elif all(status < 500 for status in statuses.values()):
+                token_cache.set(token, False)
 
-        github_url, github_headers = "https://api.github.com/user", {
-            "Authorization": f"token {token}"
-        }
-        github_res = r.get(github_url, headers=github_headers)
-        if github_res.status_code == 200:
-            response = {"token": token, "login": github_res.json()["login"]}
-            return True, response
+        if login is not None:
+            return True, {"token": token, "login": login}
 
         # If the user is not valid, return an error message.
         return False, {"error": "Invalid token."}
+
+
+async def gitlab_login(token: str) -> tuple[Optional[str], int]:
+    """
+    Ask GitLab who the token belongs to.
+
+    :param token: the access token to authenticate the user
+    :returns: the username if GitLab accepted the token, and the status code
+    """
+    gitlab_url = urljoin(settings.GITLAB_URL, f"/api/v4/user?access_token={token}")
+    gitlab_res = await get_http_client().get(
+        gitlab_url, timeout=settings.PROVIDER_TIMEOUT
+    )
+    if gitlab_res.status_code == 200:
+        return gitlab_res.json()["username"], 200
+    return None, gitlab_res.status_code
+
+
+async def github_login(token: str) -> tuple[Optional[str], int]:
+    """
+    Ask GitHub who the token belongs to.
+
+    :param token: the access token to authenticate the user
+    :returns: the username if GitHub accepted the token, and the status code
+    """
+    github_url, github_headers = f"{settings.GITHUB_API_URL}/user", {
+        "Authorization": f"token {token}"
+    }
+    github_res = await get_http_client().get(
+        github_url, headers=github_headers, timeout=settings.PROVIDER_TIMEOUT
+    )
+    if github_res.status_code == 200:
+        return github_res.json()["login"], 200
+    return None, github_res.status_code
+
+
+PROBES = {"gitlab": gitlab_login, "github": github_login}
+
+
+async def probe(provider: str, token: str) -> tuple[Optional[str], int]:
+    try:
+        return await PROBES[provider](token)
+    except httpx.HTTPError:
+        # An unreachable provider is an outage, not a rejection
+        return None, 503
+
+
+async def probe_providers(
+    token: str, providers: list
+) -> tuple[Optional[str], Optional[str], dict]:
+    """
+    Ask the providers concurrently, the first one to accept the token wins and the others are cancelled.
+
+    :param token: the access token to authenticate the user
+    :param providers: the names of the providers to ask
+    :returns: the provider and username that won, and the status codes of the providers that answered
+    """
+    tasks = {
+        asyncio.create_task(probe(provider, token)): provider for provider in providers
+    }
+    statuses = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                login, status = task.result()
+                statuses[tasks[task]] = status
+                if login is not None:
+                    return tasks[task], login, statuses
+    finally:
+        for task in pending:
+            task.cancel()
+    return None, None, statuses
+
+
+def bearer_token(request: Request) -> Optional[str]:
+    """
+    Read the access token of a request, if it carries one
+
+    :param request: the incoming request
+    :returns: the token of the Authorization header
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return token if scheme == "Bearer" and token else None
+
+
+def invalidate_token(request: Request) -> None:
+    """
+    Forget the cached identity of a request's token, once a downstream call rejects it
+
+    :param request: the incoming request
+    """
+    token = bearer_token(request)
+    if token:
+        token_cache.invalidate(token)
@@ -1,8 +1,8 @@
-import json
-
-import requests as rest_client
 from fastapi import APIRouter
 
+from app.config.config import settings
+from app.server.http_client import get_http_client
+
 router = APIRouter(tags=["Token"])
 
 
@@ -12,8 +12,8 @@ async def get_token_from_gitlab(
 ) -> dict:
     """Get the authorization token from GitLab."""
 
-    res = rest_client.post(
-        f"https://gitlab.com/oauth/token",
+    res = await get_http_client().post(
+        f"{settings.GITLAB_URL}/oauth/token",
         data={
             "client_id": client_id,
             "client_secret": client_secret,
@@ -28,9 +28,9 @@ async def get_token_from_gitlab(
 
 
 @router.get("/github/token")
-def get_token_from_github(code: str, client_id: str, client_secret: str) -> dict:
+async def get_token_from_github(code: str, client_id: str, client_secret: str) -> dict:
     """Get the authorization token from GitHub"""
-    res = rest_client.post(
+    res = await get_http_client().post(
         url="https://github.com/login/oauth/access_token",
         headers={"Accept": "application/json"},
         data={
@@ -39,6 +39,6 @@ def get_token_from_github(code: str, client_id: str, client_secret: str) -> dict
             "code": code,
         },
     )
-    res = json.loads(res.text)
+    res = res.json()
     access_token, expires_in = res["access_token"], res["expires_in"]
     return {"access_token": access_token, "expires_in": expires_in}
@@ -0,0 +1,131 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Optional, Tuple
+
+from app.config.config import settings
+
+
+def token_key(token: str) -> str:
+    """
+    Hash an access token, so raw tokens are never kept in memory as cache keys
+
+    :param token: the access token
+    :returns: the sha256 hex digest of the token
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """Keeps verified identities in memory with a TTL, a size bound and LRU eviction"""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        negative_ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param maxsize: the maximum number of tokens kept
+        :param ttl: seconds a verified identity is trusted for
+        :param negative_ttl: seconds a rejected token is remembered for
+        :param clock: the monotonic clock the expiry times are read from
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, bool, Optional[str]]]" = (
+            OrderedDict()
+        )
+        # The provider each token was last verified against, kept past the TTL as a hint
+        self._providers: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, token: str) -> Optional[Tuple[bool, Optional[str]]]:
+        """
+        Look a token up
+
+        :param token: the access token
+        :returns: (valid, login) if the token was verified recently, None otherwise
+        """
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, token: str, valid: bool, login: Optional[str] = None) -> None:
+        """
+        Remember the outcome of a verification
+
+        :param token: the access token
+        :param valid: whether a provider accepted the token
+        :param login: the username the token belongs to
+        """
+        if self.maxsize <= 0:
+            return
+        expires = self.clock() + (self.ttl if valid else self.negative_ttl)
+        key = token_key(token)
+        with self._lock:
+            self._entries[key] = (expires, valid, login)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        """
+        Forget a token, e.g once a downstream call rejects it with a 401
+
+        :param token: the access token
+        """
+        with self._lock:
+            self._entries.pop(token_key(token), None)
+
+    def provider(self, token: str) -> Optional[str]:
+        """
+        :param token: the access token
+        :returns: the provider that last accepted the token, if any
+        """
+        with self._lock:
+            return self._providers.get(token_key(token))
+
+    def set_provider(self, token: str, provider: str) -> None:
+        """
+        Remember which provider accepted a token, so it is asked first next time
+
+        :param token: the access token
+        :param provider: the provider that accepted it, gitlab or github
+        """
+        if self.maxsize <= 0:
+            return
+        key = token_key(token)
+        with self._lock:
+            self._providers[key] = provider
+            self._providers.move_to_end(key)
+            while len(self._providers) > self.maxsize:
+                self._providers.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._providers.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_SIZE,
+    settings.TOKEN_CACHE_TTL,
+    settings.TOKEN_CACHE_NEGATIVE_TTL,
+)
@@ -0,0 +1,120 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+from typing import Any, Callable
+
+from app.config.config import settings
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when a pool already has as many queued tasks as it accepts"""
+
+
+class BoundedExecutor:
+    """A thread pool that keeps blocking work off the event loop, with a bounded queue"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int) -> None:
+        """
+        :param name: the name of the pool, used for its threads and metrics
+        :param max_workers: the number of tasks run at once
+        :param max_queue: the number of tasks allowed to wait for a worker
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.peak_queued = 0
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        """
+        Queue a blocking call
+
+        :param fn: the function to call in the pool
+        :returns: the future of its result
+        :raises ExecutorSaturated: if the queue is full
+        """
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(f"The {self.name} pool is saturated")
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        return self._executor.submit(self._run, partial(fn, *args, **kwargs))
+
+    async def run(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Call a blocking function in the pool and wait for it without blocking the event loop
+
+        :param fn: the function to call in the pool
+        :returns: what the function returned
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _run(self, call: Callable) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            result = call()
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        else:
+            with self._lock:
+                self.completed += 1
+            return result
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def metrics(self) -> dict:
+        """
+        :returns: the queue depth and saturation of the pool, for sizing it under load
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "max_queue": self.max_queue,
+                "peak_queued": self.peak_queued,
+                "saturation": self.active / self.max_workers,
+                "queue_saturation": self.queued / self.max_queue
+                if self.max_queue
+                else 1.0,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+# Clones, fetches and pushes, and the GitLab API calls that commit policies
+git_pool = BoundedExecutor("git", settings.GIT_POOL_SIZE, settings.GIT_POOL_QUEUE)
+
+# TinyDB file I/O and postgres queries
+storage_pool = BoundedExecutor(
+    "storage", settings.STORAGE_POOL_SIZE, settings.STORAGE_POOL_QUEUE
+)
+
+
+# Policy compilation and evaluation, CPU bound work kept off the event loop
+compute_pool = BoundedExecutor(
+    "compute", settings.COMPUTE_POOL_SIZE, settings.COMPUTE_POOL_QUEUE
+)
+
+
+def executor_metrics() -> dict:
+    return {
+        pool.name: pool.metrics() for pool in (git_pool, storage_pool, compute_pool)
+    }
@@ -0,0 +1,57 @@
+import asyncio
+import importlib.util
+from typing import Optional
+
+import httpx
+
+from app.config.config import settings
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package, installed with httpx[http2]"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Create the client every outbound GitHub and GitLab call goes through
+
+    :returns: an async client with keep-alive pools and timeouts
+    """
+    return httpx.AsyncClient(
+        http2=http2_available(),
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the application wide client, creating it on first use.
+    Pooled connections belong to the event loop they were opened on,
+    so a client is never shared across event loops.
+
+    :returns: the shared async client
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client, _client_loop = create_http_client(), loop
+    return _client
+
+
+async def start_http_client() -> None:
+    get_http_client()
+
+
+async def close_http_client() -> None:
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client, _client_loop = None, None
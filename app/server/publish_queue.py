@@ -0,0 +1,312 @@
+import contextlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, List, Optional
+
+from app.config.config import settings
+from app.server.executors import BoundedExecutor, git_pool, storage_pool
+from app.utils.write_rego import publish
+
+
+QUEUED, COMPILING, PUSHING, DONE, FAILED = (
+    "queued",
+    "compiling",
+    "pushing",
+    "done",
+    "failed",
+)
+
+
+def job_path(jobs_path: str, job_id: str) -> Optional[str]:
+    """
+    :returns: the file the status of a job is recorded in, None if the id can't be one of a job
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+        return None
+    return os.path.join(jobs_path, f"{job_id}.json")
+
+
+class PublishJob:
+    """A handle on the publish that will carry a policy mutation to the repository"""
+
+    def __init__(
+        self, repo: Hashable, owner: Optional[str] = None, jobs_path: str = None
+    ) -> None:
+        """
+        :param repo: identifies the repository
+        :param owner: the user the job status is shown to
+        :param jobs_path: the directory the status is recorded in for the other workers, None to keep it in memory
+        """
+        self.id = uuid.uuid4().hex
+        self.repo = repo
+        self.owner = owner
+        self.path = job_path(jobs_path, self.id) if jobs_path else None
+        self.future: Future = Future()
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        # When the job entered each status
+        self.timings: Dict[str, float] = {QUEUED: time.time()}
+        self._save_lock = threading.Lock()
+
+    def set_status(self, status: str, error: Exception = None) -> None:
+        self.status = status
+        self.timings[status] = time.time()
+        if error is not None:
+            self.error = str(error) or type(error).__name__
+        self.save()
+
+    def save(self) -> None:
+        """Record the current status in the job file, replaced at once so readers never see half of it"""
+        if self.path is None:
+            return
+        # The status is read under the lock, so a slower save never overwrites a newer one
+        with self._save_lock:
+            record = {**self.as_dict(), "owner": self.owner}
+            directory = os.path.dirname(self.path)
+            os.makedirs(directory, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(record, file)
+            os.replace(temporary, self.path)
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """
+        Block until the mutation is published
+
+        :param timeout: seconds to wait for, forever if None
+        :raises: the error the publish failed with
+        """
+        self.future.result(timeout)
+
+    def as_dict(self) -> dict:
+        """
+        :returns: the status of the job, when it entered each status and how long the publish took
+        """
+        started = self.timings[QUEUED]
+        finished = self.timings.get(DONE, self.timings.get(FAILED))
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "timings": dict(self.timings),
+            "duration": finished - started if finished else None,
+        }
+
+
+class _Batch:
+    """The mutations of a repository waiting to be published together"""
+
+    def __init__(self, first_mutation: float) -> None:
+        self.first_mutation = first_mutation
+        self.jobs: List[PublishJob] = []
+        self.load: Optional[Callable[[], list]] = None
+        self.options: dict = {}
+        self.timer: Optional[threading.Timer] = None
+
+
+class PublishQueue:
+    """
+    Debounces the policy mutations of every repository and publishes them in one commit.
+
+    Each mutation restarts the window of its repository, up to max_delay after the first one,
+    then the latest policies of the repository are compiled and pushed once for the whole batch.
+    Publishes of the same repository never overlap: a batch flushed while its repository is
+    being published waits, without holding a worker, and is submitted when that publish ends.
+
+    The jobs are kept in memory. With a jobs directory their status is also recorded there,
+    so any worker sharing the directory can answer for a job enqueued in another worker.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        max_delay: float,
+        publisher: Callable[..., None] = publish,
+        executor: BoundedExecutor = git_pool,
+        storage: BoundedExecutor = storage_pool,
+        history: int = 1000,
+        jobs_path: Optional[str] = None,
+    ) -> None:
+        """
+        :param window: seconds without a mutation before a repository is published
+        :param max_delay: seconds after its first mutation a repository is published at the latest
+        :param publisher: compiles and pushes the policies of a repository
+        :param executor: the pool the publishes run in
+        :param storage: the pool the policies are loaded in
+        :param history: the number of jobs kept for status lookups, by this worker
+        :param jobs_path: the directory the status of the jobs is shared in, None to keep it in memory
+        """
+        self.window = window
+        self.max_delay = max_delay
+        self.publisher = publisher
+        self.executor = executor
+        self.storage = storage
+        self.batches = 0
+        self.history = history
+        self.jobs_path = jobs_path
+        self._jobs: "OrderedDict[str, PublishJob]" = OrderedDict()
+        self._pending: Dict[Hashable, _Batch] = {}
+        # The repositories being published, with the batch waiting for the publish to end
+        self._running: Dict[Hashable, Optional[_Batch]] = {}
+        self._lock = threading.Lock()
+
+    def enqueue(
+        self,
+        repo: Hashable,
+        load: Callable[[], list],
+        owner: Optional[str] = None,
+        **options,
+    ) -> PublishJob:
+        """
+        Schedule the publish of a repository after a mutation of its policies
+
+        :param repo: identifies the repository, e.g (provider, owner, repo url)
+        :param load: returns the current policies of the repository, called when the batch is published
+        :param owner: the user the job status is shown to
+        :param options: the arguments of the publisher besides the policies,
+            the ones of the latest mutation are used for the batch
+        :returns: the job handle of the mutation
+        """
+        job = PublishJob(repo, owner, self.jobs_path)
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                expired.append(self._jobs.popitem(last=False)[1])
+            batch = self._pending.get(repo)
+            if batch is None:
+                batch = self._pending[repo] = _Batch(now)
+            batch.jobs.append(job)
+            batch.load, batch.options = load, options
+
+            if batch.timer is not None:
+                batch.timer.cancel()
+            delay = min(self.window, batch.first_mutation + self.max_delay - now)
+            batch.timer = threading.Timer(max(delay, 0), self._flush, (repo, batch))
+            batch.timer.daemon = True
+            batch.timer.start()
+        job.save()
+        # Every worker removes the records of the jobs it no longer keeps
+        for old_job in expired:
+            if old_job.path is not None:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(old_job.path)
+        return job
+
+    def _flush(self, repo: Hashable, batch: _Batch) -> None:
+        with self._lock:
+            # A later mutation rescheduled the batch
+            if self._pending.get(repo) is not batch or batch.timer is not (
+                threading.current_thread()
+            ):
+                return
+            del self._pending[repo]
+            if repo in self._running:
+                waiting = self._running[repo]
+                if waiting is None:
+                    self._running[repo] = batch
+                else:
+                    # The waiting batch loads the policies when it runs, one publish carries both
+                    waiting.jobs.extend(batch.jobs)
+                    waiting.load, waiting.options = batch.load, batch.options
+                return
+            self._running[repo] = None
+        self._submit(repo, batch)
+
+    def _submit(self, repo: Hashable, batch: _Batch) -> None:
+        with self._lock:
+            self.batches += 1
+        try:
+            self.executor.submit(self._publish, repo, batch)
+        except Exception as error:
+            self._finish(batch, error)
+            self._next(repo)
+
+    def _next(self, repo: Hashable) -> None:
+        """Submit the batch waiting for the repository, or mark it idle"""
+        with self._lock:
+            batch = self._running.get(repo)
+            if batch is None:
+                del self._running[repo]
+                return
+            self._running[repo] = None
+        self._submit(repo, batch)
+
+    def _publish(self, repo: Hashable, batch: _Batch) -> None:
+        try:
+            policies = self.storage.submit(batch.load).result()
+            self.publisher(
+                policies,
+                progress=lambda stage: self._progress(batch, stage),
+                **batch.options,
+            )
+        except Exception as error:
+            self._finish(batch, error)
+        else:
+            self._finish(batch)
+        finally:
+            self._next(repo)
+
+    @staticmethod
+    def _progress(batch: _Batch, stage: str) -> None:
+        for job in batch.jobs:
+            job.set_status(stage)
+
+    @staticmethod
+    def _finish(batch: _Batch, error: Exception = None) -> None:
+        for job in batch.jobs:
+            if error is None:
+                job.set_status(DONE)
+                job.future.set_result(None)
+            else:
+                job.set_status(FAILED, error)
+                job.future.set_exception(error)
+
+    def get_job(self, job_id: str) -> Optional[PublishJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def job_status(self, job_id: str) -> Optional[dict]:
+        """
+        Look the status of a job up, in this worker or in the jobs directory the workers share
+
+        :param job_id: the id of the job
+        :returns: the status of the job with its owner, None if no worker knows the job
+        """
+        job = self.get_job(job_id)
+        if job is not None:
+            return {**job.as_dict(), "owner": job.owner}
+        path = job_path(self.jobs_path, job_id) if self.jobs_path else None
+        if path is None:
+            return None
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(batch.jobs) for batch in self._pending.values())
+
+
+publish_queue = PublishQueue(
+    settings.PUBLISH_DEBOUNCE,
+    settings.PUBLISH_MAX_DELAY,
+    history=settings.PUBLISH_JOB_HISTORY,
+    # Only the 202 responses hand out job ids, the status is shared between the workers for them
+    jobs_path=os.path.join(settings.BASE_PATH or ".", "jobs")
+    if settings.PUBLISH_ASYNC
+    else None,
+)
@@ -0,0 +1,222 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+from fastapi import HTTPException
+
+from app.config.config import settings
+from app.server.auth.token_cache import token_cache, token_key
+from app.server.http_client import get_http_client
+
+
+class _Listing:
+    def __init__(self, value: list, fetched: float) -> None:
+        self.value = value
+        self.fetched = fetched
+
+
+class RepoCache:
+    """
+    Keeps the repository listing of every user in memory, stale while revalidate.
+
+    A listing younger than ttl is served as is. Past ttl, and up to stale_ttl,
+    it is still served right away while a background task fetches it again.
+    Past stale_ttl the request waits for the fetch.
+    Each page is fetched with the ETag it last had, so unchanged pages come back as 304.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        stale_ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param maxsize: the maximum number of listings kept, the page validators are bounded to four times as many
+        :param ttl: seconds a listing is served without fetching it again
+        :param stale_ttl: seconds a listing is served at all, refreshed in the background past ttl
+        :param clock: the monotonic clock the ages are read from
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._listings: "OrderedDict[Hashable, _Listing]" = OrderedDict()
+        self._validators: "OrderedDict[Tuple[Hashable, str], Tuple[str, Any, int]]" = (
+            OrderedDict()
+        )
+        self._loads: Dict[Hashable, asyncio.Task] = {}
+
+    async def get(self, key: Hashable, load: Callable[[], Awaitable[list]]) -> list:
+        """
+        Get the listing of a user
+
+        :param key: identifies the user, e.g (provider, token hash)
+        :param load: fetches the listing from the provider
+        :returns: the listing, possibly stale
+        """
+        listing = self._listings.get(key)
+        age = self.clock() - listing.fetched if listing else None
+        if listing is not None and age < self.stale_ttl:
+            self._listings.move_to_end(key)
+            if age < self.ttl:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                # Errors of background refreshes are dropped, the stale listing is kept
+                self._load(key, load).add_done_callback(
+                    lambda task: task.cancelled() or task.exception()
+                )
+            return listing.value
+
+        self.misses += 1
+        return await asyncio.shield(self._load(key, load))
+
+    def _load(self, key: Hashable, load: Callable[[], Awaitable[list]]) -> asyncio.Task:
+        """Start fetching a listing, unless a fetch of the same listing is in flight on this loop"""
+        task = self._loads.get(key)
+        if (
+            task is not None
+            and not task.done()
+            and task.get_loop() is asyncio.get_running_loop()
+        ):
+            return task
+
+        async def fetch() -> list:
+            value = await load()
+            self._listings[key] = _Listing(value, self.clock())
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.maxsize:
+                self._listings.popitem(last=False)
+            return value
+
+        task = self._loads[key] = asyncio.create_task(fetch())
+        task.add_done_callback(
+            lambda done: self._loads.get(key) is done and self._loads.pop(key)
+        )
+        return task
+
+    async def drain(self) -> None:
+        """Wait for the background refreshes of this loop, e.g before shutting down"""
+        loop = asyncio.get_running_loop()
+        tasks = [task for task in self._loads.values() if task.get_loop() is loop]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def validator(self, key: Hashable, url: str) -> Optional[Tuple[str, Any, int]]:
+        """
+        :param key: identifies the user
+        :param url: the url of the page, with its query
+        :returns: the ETag, body and page count the page was last fetched with
+        """
+        return self._validators.get((key, url))
+
+    def set_validator(
+        self, key: Hashable, url: str, etag: str, body: Any, pages: int
+    ) -> None:
+        self._validators[(key, url)] = (etag, body, pages)
+        self._validators.move_to_end((key, url))
+        while len(self._validators) > self.maxsize * 4:
+            self._validators.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._listings.pop(key, None)
+        for page in [page for page in self._validators if page[0] == key]:
+            del self._validators[page]
+
+    def clear(self) -> None:
+        self._listings.clear()
+        self._validators.clear()
+
+    def stats(self) -> dict:
+        return {
+            "listings": len(self._listings),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+repo_cache = RepoCache(
+    settings.REPO_CACHE_SIZE, settings.REPO_CACHE_TTL, settings.REPO_CACHE_STALE_TTL
+)
+
+
+def listing_key(provider: str, token: str) -> Tuple[str, str]:
+    return provider, token_key(token)
+
+
+def page_count(response: httpx.Response) -> int:
+    """
+    Read the number of pages of a listing from the first one
+
+    :param response: the first page
+    :returns: the page of the last Link, or X-Total-Pages, 1 if the listing fits in a page
+    """
+    last = response.links.get("last", {}).get("url")
+    if last:
+        return int(parse_qs(urlparse(last).query).get("page", ["1"])[0])
+    return int(response.headers.get("X-Total-Pages") or 1)
+
+
+async def fetch_page(
+    key: Hashable, token: str, url: str, params: dict, headers: dict
+) -> Tuple[Any, int]:
+    """
+    Fetch a page of a listing, conditionally on the ETag it last had
+
+    :param key: identifies the user
+    :param token: the access token, forgotten when the provider rejects it
+    :param url: the url of the listing
+    :param params: the query of the page
+    :param headers: the authorization headers of the provider
+    :returns: the body and the page count of the listing
+    """
+    page_url = str(httpx.URL(url, params=params))
+    cached = repo_cache.validator(key, page_url)
+    if cached is not None:
+        headers = {**headers, "If-None-Match": cached[0]}
+
+    res = await get_http_client().get(page_url, headers=headers)
+    if res.status_code == 304 and cached is not None:
+        repo_cache.not_modified += 1
+        return cached[1], cached[2]
+    if res.status_code == 401:
+        token_cache.invalidate(token)
+        repo_cache.invalidate(key)
+        raise HTTPException(status_code=401, detail="Invalid token or expired token.")
+    if res.status_code != 200:
+        raise HTTPException(status_code=res.status_code, detail=res.text)
+
+    body, pages = res.json(), page_count(res)
+    if res.headers.get("ETag"):
+        repo_cache.set_validator(key, page_url, res.headers["ETag"], body, pages)
+    return body, pages
+
+
+async def fetch_pages(
+    key: Hashable, token: str, url: str, params: dict, headers: dict
+) -> List[Any]:
+    """
+    Fetch every page of a listing, the first one tells how many there are
+    and the others are fetched concurrently
+
+    :returns: the bodies of the pages, in order
+    """
+    params = {**params, "per_page": settings.REPO_PAGE_SIZE}
+    first, pages = await fetch_page(key, token, url, {**params, "page": 1}, headers)
+    rest = await asyncio.gather(
+        *(
+            fetch_page(key, token, url, {**params, "page": page}, headers)
+            for page in range(2, min(pages, settings.REPO_MAX_PAGES) + 1)
+        )
+    )
+    return [first] + [body for body, _ in rest]
@@ -1,7 +1,11 @@
 from fastapi import APIRouter, Depends
 
 
+from app.database.policy_database import PolicyDatabase, get_db
+from app.schemas.policy_model import DatasourceIndexRequest
 from app.server.auth.authorize_token import TokenBearer
+from app.server.executors import storage_pool
+from app.utils.datasource_index import build_index_document
 
 router = APIRouter(tags=["Data Operations"])
 
@@ -16,4 +20,21 @@ async def get_data(dependencies=Depends(TokenBearer())) -> dict:
     query = data["sql_query"]
     res_key = query.split(" ")[-1].replace("gs_", "")
 
-    return {res_key: get_database().get_data(query)}
+    return {res_key: await storage_pool.run(lambda: get_database().get_data(query))}
+
+
+@router.post("/data/index")
+async def get_data_index(
+    request: DatasourceIndexRequest,
+    database: PolicyDatabase = Depends(get_db),
+    dependencies=Depends(TokenBearer()),
+) -> dict:
+    """
+    Build the indexed data document read by policies compiled with REGO_INDEXED_DATASOURCES,
+    to be published to OPA alongside the datasources it was built from.
+
+    :param request: the objects of every datasource
+    :returns: the data document, keyed by datasource and indexed fields
+    """
+    policies = await storage_pool.run(database.get_policies, dependencies["login"])
+    return build_index_document(policies, request.datasources)
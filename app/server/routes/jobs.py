@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.server.auth.authorize_token import TokenBearer
+from app.server.executors import storage_pool
+from app.server.publish_queue import publish_queue
+
+router = APIRouter(tags=["Publish Jobs"], prefix="/jobs")
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, dependencies=Depends(TokenBearer())) -> dict:
+    """
+    Get the status of a policy publish: queued, compiling, pushing, done or failed.
+    Any worker answers, whichever one the mutation was sent to.
+
+    :param job_id: the id returned with the 202 response of the mutation
+    :returns: the status of the job, with the time it entered each status
+    """
+    status = await storage_pool.run(publish_queue.job_status, job_id)
+    if status is None or status.pop("owner") != dependencies["login"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return status
@@ -0,0 +1,48 @@
+from fastapi import APIRouter
+
+from app.server.executors import executor_metrics
+from app.server.repo_cache import repo_cache
+from app.server.services.client_pool import client_pool
+from app.server.services.clone_pool import clone_pool
+
+router = APIRouter(tags=["Metrics"], prefix="/metrics")
+
+
+@router.get("/executors")
+async def get_executor_metrics() -> dict:
+    """
+    Get the queue depth and saturation of the git and storage pools.
+
+    :returns: the metrics of every pool, keyed by pool name
+    """
+    return executor_metrics()
+
+
+@router.get("/clones")
+async def get_clone_metrics() -> dict:
+    """
+    Get the number of clones, fetches and evictions of the GitHub working copies, and their disk usage.
+
+    :returns: the statistics of the clone pool
+    """
+    return clone_pool.stats()
+
+
+@router.get("/clients")
+async def get_client_metrics() -> dict:
+    """
+    Get the number of GitHub and GitLab clients kept, and the hits and misses of the client pool.
+
+    :returns: the statistics of the client pool
+    """
+    return client_pool.stats()
+
+
+@router.get("/repos")
+async def get_repo_cache_metrics() -> dict:
+    """
+    Get the fresh, stale and missed lookups of the repository listings, and the pages that came back unchanged.
+
+    :returns: the statistics of the repository cache
+    """
+    return repo_cache.stats()
@@ -1,22 +1,83 @@
+import asyncio
+
+from typing import Union
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
 
 from app.config.config import settings
-from app.database.policy_database import PolicyDatabase, get_db
-from app.schemas.policy_model import RequestObject, UpdateRequestObject
+from app.database.policy_database import PolicyDatabase, get_db, repo_key
+from app.schemas.policy_model import (
+    EvaluationRequest,
+    RequestObject,
+    UpdateRequestObject,
+)
 from app.server.auth.authorize_token import TokenBearer
-from app.server.services.gitlab import GitLabOperations
-from app.utils.write_rego import WriteRego
+from app.server.executors import compute_pool, git_pool, storage_pool
+from app.server.publish_queue import PublishJob, publish_queue
+from app.server.services.client_pool import gitlab_client
+from app.utils.evaluator import PolicyEvaluator
+from app.utils.path_trie import find_overlaps, split_path
 
 default_path = settings.BASE_PATH
 
 router = APIRouter(tags=["Policy Operations"], prefix="/policies")
 
 
+def schedule_publish(
+    database: PolicyDatabase,
+    provider: str,
+    dependencies: dict,
+    repo_url: str,
+    repo_id: int = None,
+) -> PublishJob:
+    """
+    Queue the publish of a repository after its policies changed in the database.
+    Mutations of the same repository within the debounce window share one commit.
+
+    :param database: the policy database, read when the batch is published
+    :param provider: github or gitlab
+    :param dependencies: the token bearer object
+    :param repo_url: the url of the repository
+    :param repo_id: the id of the repository, for gitlab
+    :returns: the job handle of the publish
+    """
+    user = dependencies["login"]
+    return publish_queue.enqueue(
+        (provider, user, repo_key(repo_url)),
+        lambda: database.get_repo_policies(user, repo_url),
+        owner=user,
+        access_token=dependencies["token"],
+        repo_url=repo_url,
+        username=user,
+        provider=provider,
+        repo_id=repo_id,
+    )
+
+
+async def published(job: PublishJob, message: str) -> Union[dict, JSONResponse]:
+    """
+    Answer a mutation once its repository is published,
+    or right away with the job id when PUBLISH_ASYNC is set
+
+    :param job: the job handle of the publish
+    :param message: what the mutation did
+    :returns: the response of the route
+    """
+    if settings.PUBLISH_ASYNC:
+        return JSONResponse(
+            status_code=202,
+            content={"status": 202, "message": message, "job_id": job.id},
+        )
+    await asyncio.wrap_future(job.future)
+    return {"status": 200, "message": message}
+
+
 @router.get("/")
 async def get_policies(
     database: PolicyDatabase = Depends(get_db), dependencies=Depends(TokenBearer())
 ) -> list:
-    return database.get_policies(dependencies["login"])
+    return await storage_pool.run(database.get_policies, dependencies["login"])
 
 
 @router.post("/")
@@ -27,46 +88,96 @@ async def write_policy(
     dependencies=Depends(TokenBearer()),
 ) -> dict:
     if provider == "gitlab":
-        rego_rule.repo_url = GitLabOperations(
-            rego_rule.repo_id, dependencies["token"]
-        ).repo_url_from_id()
+        gitlab = await git_pool.run(
+            gitlab_client, rego_rule.repo_id, dependencies["token"]
+        )
+        rego_rule.repo_url = gitlab.repo_url_from_id()
 
     rego_rule.owner = dependencies["login"]
     policy = rego_rule.dict()
 
-    if database.exists(rego_rule.name, dependencies["login"]):
-        raise HTTPException(status_code=409, detail="Policy already exists")
+    # The database is the source of truth, the repository is published from it.
+    # The name is checked and the policy stored in the same pass, 409 if the name is taken
+    await storage_pool.run(database.insert_policy, policy, dependencies["login"])
 
-    policies = database.get_policies(dependencies["login"])
-    policies.append(policy)
+    job = schedule_publish(
+        database, provider, dependencies, rego_rule.repo_url, rego_rule.repo_id
+    )
+    return await published(job, "Policy created successfully")
+
+
+@router.post("/evaluate")
+async def evaluate_policies(
+    request: EvaluationRequest,
+    database=Depends(get_db),
+    dependencies=Depends(TokenBearer()),
+) -> dict:
+    """
+    Evaluate sample inputs against the stored policies, as OPA would once they are pushed.
+    Only the policies of repo_url are evaluated when it is given.
+    """
+    user = dependencies["login"]
+    if request.repo_url:
+        policies = await storage_pool.run(
+            database.get_repo_policies, user, request.repo_url
+        )
+    else:
+        policies = await storage_pool.run(database.get_policies, user)
+
+    def evaluate() -> list:
+        return PolicyEvaluator(policies).evaluate_batch(request.inputs, request.data)
+
+    return {"results": await compute_pool.run(evaluate)}
 
-    # Write the policy to the database after successful push
-    if provider == "gitlab":
-        WriteRego(
-            access_token=dependencies["token"],
-            repo_url=rego_rule.repo_url,
-            username=dependencies["login"],
-            provider=provider,
-            repo_id=rego_rule.repo_id,
-        ).write_to_file(policies)
-        database.add_policy(policy, dependencies["login"])
 
-        return {"status": 200, "message": "Policy created successfully"}
+@router.post("/overlaps")
+async def check_overlaps(
+    rego_rule: RequestObject,
+    database=Depends(get_db),
+    dependencies=Depends(TokenBearer()),
+) -> dict:
+    """
+    Check which allow blocks of the stored policies grant request paths the new policy also grants.
+    Only the policies of the same repository are checked when repo_url is given.
+    """
+    policy = rego_rule.dict()
+
+    def overlaps() -> list:
+        with database.path_trie(dependencies["login"], rego_rule.repo_url) as trie:
+            return find_overlaps(trie, policy)
 
-    WriteRego(
-        dependencies["token"], policy["repo_url"], dependencies["login"], provider
-    ).write_to_file(policies)
+    return {"overlaps": await storage_pool.run(overlaps)}
 
-    database.add_policy(policy, dependencies["login"])
 
-    return {"status": 200, "message": "Policy created successfully"}
+@router.get("/grants")
+async def path_grants(
+    path: str,
+    repo_url: str = None,
+    database=Depends(get_db),
+    dependencies=Depends(TokenBearer()),
+) -> dict:
+    """
+    List the allow blocks whose request_path condition holds for a path, e.g /v1/collections/lakes/
+    """
+
+    def matches() -> list:
+        with database.path_trie(dependencies["login"], repo_url) as trie:
+            return trie.match(split_path(path))
+
+    grants = await storage_pool.run(matches)
+    return {
+        "policies": sorted({grant.policy for grant in grants}),
+        "grants": [{"policy": grant.policy, "rule": grant.rule} for grant in grants],
+    }
 
 
 @router.get("/{policy_id}")
 async def retrieve_policy(
     policy_id: str, database=Depends(get_db), dependencies=Depends(TokenBearer())
 ) -> dict:
-    stored_policy = database.get_policy(policy_id, dependencies["login"])
+    stored_policy = await storage_pool.run(
+        database.get_policy, policy_id, dependencies["login"]
+    )
     if not stored_policy:
         raise HTTPException(status_code=404, detail="Policy does not exist")
 
@@ -82,40 +193,40 @@ async def modify_policy(
     dependencies=Depends(TokenBearer()),
 ) -> dict:
     user = dependencies["login"]
-    if not database.exists(policy_id, user):
-        raise HTTPException(status_code=404, detail="Policy not found")
-
-    # Clean out fields which weren't updated.
-    rego_rule = {k: v for k, v in rego_rule.dict().items() if v is not None}
 
-    # Update database
-    database.update_policy(policy_name=policy_id, policy=rego_rule, owner=user)
-
-    # Retrieve updated policy
-    updated_policy = database.get_policy(policy_id, user)
-
-    policies = database.get_policies(user)
-
-    # Rewrite rego file and update Gitlab
-    if provider == "gitlab":
-        WriteRego(
-            access_token=dependencies["token"],
-            repo_url=updated_policy["repo_url"],
-            username=dependencies["login"],
-            provider=provider,
-            repo_id=updated_policy["repo_id"],
-        ).write_to_file(policies)
-        return {"status": 200, "message": "Updated successfully"}
-
-    # Rewrite rego file and update GitHub
-    WriteRego(
-        dependencies["token"],
-        rego_rule["repo_url"],
-        dependencies["login"],
+    # Clean out fields which weren't updated, a policy always stays with its owner
+    rego_rule = {
+        k: v for k, v in rego_rule.dict(exclude_unset=True).items() if v is not None
+    }
+    rego_rule.pop("owner", None)
+
+    # Update database, 404 if the policy doesn't exist, 409 if it is renamed onto another one
+    mutation = await storage_pool.run(
+        database.modify_policy, policy_name=policy_id, fields=rego_rule, owner=user
+    )
+    updated_policy, previous_policy = mutation.policy, mutation.previous
+
+    # The policy left its repository, which is published without it
+    if repo_key(previous_policy.get("repo_url")) != repo_key(
+        updated_policy.get("repo_url")
+    ):
+        schedule_publish(
+            database,
+            provider,
+            dependencies,
+            previous_policy.get("repo_url"),
+            previous_policy.get("repo_id"),
+        )
+
+    # Rewrite rego file and update the repository
+    job = schedule_publish(
+        database,
         provider,
-    ).write_to_file(policies)
-
-    return {"status": 200, "message": "Updated successfully"}
+        dependencies,
+        updated_policy["repo_url"],
+        updated_policy.get("repo_id"),
+    )
+    return await published(job, "Updated successfully")
 
 
 @router.delete("/{policy_id}")
@@ -127,29 +238,12 @@ async def remove_policy(
     dependencies=Depends(TokenBearer()),
 ) -> dict:
     user = dependencies["login"]
-    if not database.exists(policy_id, user):
-        raise HTTPException(status_code=404, detail="Policy not found")
 
-    repo_id = database.get_policy(policy_id, user)["repo_id"]
-    # Remove policy from database
-    database.delete_policy(policy_id, user, repo_url)
+    # Remove policy from database, 404 if it doesn't exist
+    mutation = await storage_pool.run(database.remove_policy, policy_id, user, repo_url)
 
     # Update the policy in the rego file
-    policies = database.get_policies(owner=user)
-    if provider == "gitlab":
-        WriteRego(
-            access_token=dependencies["token"],
-            repo_id=repo_id,
-            username=user,
-            provider=provider,
-            repo_url=repo_url,
-        ).write_to_file(policies)
-    WriteRego(
-        access_token=dependencies["token"],
-        repo_id=repo_id,
-        username=user,
-        provider=provider,
-        repo_url=repo_url,
-    ).write_to_file(policies)
-
-    return {"status": 200, "message": "Policy deleted successfully."}
+    job = schedule_publish(
+        database, provider, dependencies, repo_url, mutation.policy.get("repo_id")
+    )
+    return await published(job, "Policy deleted successfully.")
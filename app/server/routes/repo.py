@@ -1,11 +1,11 @@
 from dataclasses import dataclass
+from urllib.parse import quote
 
-import gitlab
-import requests as r
 from fastapi import APIRouter, Depends
 
 from app.server.auth.authorize_token import TokenBearer
 from app.config.config import settings
+from app.server.repo_cache import fetch_pages, listing_key, repo_cache
 
 router = APIRouter(tags=["Repo Management"], prefix="/user/repos")
 
@@ -15,6 +15,7 @@ class RepoStructure:
     """
     Represents the structure of a repository.
     """
+
     name: str
     id: int
     url: str
@@ -26,25 +27,33 @@ async def get_public_and_private_repo(
     dependencies=Depends(TokenBearer()),
 ) -> list:
     """
-    Get all public and private repositories from GitHub
+    Get all public and private repositories from GitHub.
+    The listing is served from memory and refreshed in the background, see repo_cache.
 
     :param dependencies:
     """
-    url = f"https://api.github.com/search/repositories?q=user:{dependencies['login']}"
-    repos = r.get(
-        url=url,
-        headers={"Authorization": f"token {dependencies['token']}"},
-    ).json()
-
-    repos = [
-        {
-            "name": repo["name"],
-            "id": repo["html_url"],
-            "owner": repo["owner"]["login"],
-        }
-        for repo in repos["items"]
-    ]
-    return repos
+    token = dependencies["token"]
+    key = listing_key("github", token)
+
+    async def load() -> list:
+        pages = await fetch_pages(
+            key,
+            token,
+            f"{settings.GITHUB_API_URL}/search/repositories",
+            {"q": f"user:{dependencies['login']}"},
+            {"Authorization": f"token {token}"},
+        )
+        return [
+            {
+                "name": repo["name"],
+                "id": repo["html_url"],
+                "owner": repo["owner"]["login"],
+            }
+            for page in pages
+            for repo in page["items"]
+        ]
+
+    return await repo_cache.get(key, load)
 
 
 @router.get("/gitlab")
@@ -53,27 +62,32 @@ async def get_public_and_private_repo_gitlab(
 ) -> list:
     """
     Get all public and private repositories from a GitLab organization.
+    The listing is served from memory and refreshed in the background, see repo_cache.
 
     :param dependencies: - token bearer object
     :returns: list of repositories
     """
-    gl = gitlab.Gitlab("https://gitlab.com", oauth_token=dependencies["token"])
-    gl.auth()
-
-    repos = []
-
+    token = dependencies["token"]
+    key = listing_key("gitlab", token)
     glab_org_name = settings.ORG_NAME
 
-    group = gl.groups.get(glab_org_name).asdict()
-
-    for project in group["projects"]:
-        repos.append(
+    async def load() -> list:
+        pages = await fetch_pages(
+            key,
+            token,
+            f"{settings.GITLAB_URL}/api/v4/groups/{quote(glab_org_name, safe='')}/projects",
+            {},
+            {"Authorization": f"Bearer {token}"},
+        )
+        return [
             RepoStructure(
                 name=project["name"],
                 id=project["id"],
                 url=project["web_url"],
                 owner=project["namespace"]["name"],
             )
-        )
+            for page in pages
+            for project in page
+        ]
 
-    return repos
+    return await repo_cache.get(key, load)
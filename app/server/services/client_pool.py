@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+from app.config.config import settings
+from app.server.auth.token_cache import token_key
+from app.server.services.github import GitHubOperations
+from app.server.services.gitlab import GitLabOperations
+
+ClientKey = Tuple[str, str, str]
+
+
+def client_key(provider: str, repo: Any, token: str) -> ClientKey:
+    """
+    Identify the client of a repository, as seen with an access token
+
+    :param provider: github or gitlab
+    :param repo: the repository url on github, the repository id on gitlab
+    :param token: the access token, only its hash is kept
+    :returns: the key of the client in the pool
+    """
+    return provider, str(repo), token_key(token)
+
+
+class _Entry:
+    def __init__(self) -> None:
+        self.client: Any = None
+        self.expires = 0.0
+        # Held while the client is built, so concurrent misses build it once
+        self.build = threading.Lock()
+        # Held by the publishes using the client, which keeps per publish state
+        self.lock = threading.Lock()
+
+
+class ClientPool:
+    """
+    Keeps the GitHub and GitLab clients of the recently published repositories,
+    keyed by provider, repository and token hash, with a TTL and LRU eviction.
+
+    Building a GitLab client authenticates and fetches the project,
+    so alternating between repositories or users no longer pays for it on every publish.
+    """
+
+    def __init__(
+        self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """
+        :param maxsize: the maximum number of clients kept
+        :param ttl: seconds a client is reused for before it is built again
+        :param clock: the monotonic clock the expiry times are read from
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[ClientKey, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, key: ClientKey) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            self._entries.move_to_end(key)
+            self._evict()
+            return entry
+
+    def get(self, key: ClientKey, factory: Callable[[], Any]) -> Any:
+        """
+        Get the client of a repository, building it on a miss or once it expired
+
+        :param key: the key of the client, see client_key
+        :param factory: builds the client
+        :returns: the client
+        """
+        entry = self._entry(key)
+        with entry.build:
+            if entry.client is not None and entry.expires > self.clock():
+                with self._lock:
+                    self.hits += 1
+                return entry.client
+            with self._lock:
+                self.misses += 1
+            entry.client = factory()
+            entry.expires = self.clock() + self.ttl
+            return entry.client
+
+    @contextmanager
+    def lock(self, key: ClientKey) -> Iterator[None]:
+        """
+        Use the client of a repository exclusively, publishes sharing a client wait for each other
+
+        :param key: the key of the client, see client_key
+        """
+        with self._entry(key).lock:
+            yield
+
+    def _evict(self) -> None:
+        # The most recently used entry is kept, and so are the entries in use
+        for key in list(self._entries)[:-1]:
+            if len(self._entries) <= self.maxsize:
+                break
+            entry = self._entries[key]
+            if entry.build.locked() or entry.lock.locked():
+                continue
+            del self._entries[key]
+            self.evictions += 1
+
+    def invalidate(self, token: str) -> int:
+        """
+        Drop every client built with a token, e.g once a provider rejects it
+
+        :param token: the access token
+        :returns: the number of clients dropped
+        """
+        hashed = token_key(token)
+        with self._lock:
+            keys = [key for key in self._entries if key[2] == hashed]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "clients": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+client_pool = ClientPool(settings.CLIENT_POOL_SIZE, settings.CLIENT_POOL_TTL)
+
+
+def github_client(repo_url: str, access_token: str, username: str) -> GitHubOperations:
+    return client_pool.get(
+        client_key("github", repo_url, access_token),
+        lambda: GitHubOperations(repo_url, access_token, username),
+    )
+
+
+def gitlab_client(repo_id: int, access_token: str) -> GitLabOperations:
+    return client_pool.get(
+        client_key("gitlab", repo_id, access_token),
+        lambda: GitLabOperations(repo_id, access_token),
+    )
+
+
+def client_lock(provider: str, repo: Optional[Any], access_token: str):
+    """Hold the client of a repository for the duration of a publish"""
+    return client_pool.lock(client_key(provider, repo, access_token))
@@ -0,0 +1,241 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from git import Repo
+
+from app.config.config import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, the pool is then only safe within a single worker
+    fcntl = None
+
+# The files a publish writes, everything else of the repository is left out of the working copy
+SPARSE_PATTERNS = ["/auth.rego", "/path_grants/", "/policies/"]
+
+
+def clone_key(repo_url: str) -> str:
+    """
+    Name the working copy of a repository, so the same repository always maps to the same directory
+
+    :param repo_url: the url of the repository, without credentials
+    :returns: the repository name followed by a hash of the url
+    """
+    url = repo_url.strip().rstrip("/").removesuffix(".git")
+    name = re.sub(r"[^A-Za-z0-9_-]+", "-", url.split("/")[-1]) or "repo"
+    return f"{name}-{hashlib.sha1(url.encode()).hexdigest()[:12]}"
+
+
+def directory_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def remote_branch(repo: Repo) -> Optional[str]:
+    """
+    Find the default branch of the remote
+
+    :param repo: the working copy
+    :returns: e.g origin/main, None if the remote has no commits yet
+    """
+    refs = {ref.name: ref for ref in repo.remote("origin").refs}
+    head = refs.get("origin/HEAD")
+    if head is not None:
+        return head.reference.name
+    try:
+        branch = f"origin/{repo.active_branch.name}"
+    except TypeError:
+        branch = None
+    if branch in refs:
+        return branch
+    return next(iter(refs), None)
+
+
+@contextmanager
+def clone_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    """
+    Hold a working copy exclusively, across the workers sharing the pool.
+    The lock file sits next to the working copy, so it outlives the copy being removed.
+
+    :param path: the directory of the working copy
+    :param blocking: wait for the lock, otherwise give up when another worker holds it
+    :returns: whether the lock is held
+    """
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(
+                    lock_file,
+                    fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB,
+                )
+            except BlockingIOError:
+                yield False
+                return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ClonePool:
+    """
+    Keeps shallow, sparse working copies of the policy repositories warm between publishes.
+
+    A repository is cloned once with a limited depth and only the published files checked out,
+    later publishes fetch the new commits up to the same depth.
+    The least recently used copies are removed past max_clones or the disk budget.
+    """
+
+    def __init__(
+        self, root: str, max_clones: int, disk_budget: int, depth: int = 1
+    ) -> None:
+        """
+        :param root: the directory the working copies are kept in
+        :param max_clones: the number of working copies kept
+        :param disk_budget: the bytes the working copies may use together
+        :param depth: the number of commits fetched
+        """
+        self.root = root
+        self.max_clones = max_clones
+        self.disk_budget = disk_budget
+        self.depth = depth
+        self.clones = 0
+        self.fetches = 0
+        self.evictions = 0
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._scanned = False
+
+    def path(self, repo_url: str) -> str:
+        return os.path.join(self.root, clone_key(repo_url))
+
+    @contextmanager
+    def lease(self, repo_url: str, auth_url: str = None) -> Iterator[Repo]:
+        """
+        Check a working copy out for the duration of a publish, up to date with the remote.
+        Publishes of the same repository wait for each other, in this worker and in the others,
+        and a leased copy is never evicted.
+
+        :param repo_url: the url of the repository, without credentials
+        :param auth_url: the url to clone and fetch from, with credentials
+        :returns: the repository
+        """
+        key = clone_key(repo_url)
+        with self._lock:
+            self._scan()
+            lock = self._locks.setdefault(key, threading.Lock())
+        os.makedirs(self.root, exist_ok=True)
+        with lock, clone_lock(self.path(repo_url)):
+            try:
+                yield self._checkout(self.path(repo_url), auth_url or repo_url)
+            finally:
+                size = directory_size(self.path(repo_url))
+                with self._lock:
+                    self._sizes[key] = size
+                    self._sizes.move_to_end(key)
+        self.evict()
+
+    def _checkout(self, path: str, auth_url: str) -> Repo:
+        if os.path.isdir(os.path.join(path, ".git")):
+            repo = Repo(path)
+            repo.remote("origin").set_url(auth_url)
+            repo.git.fetch("origin", depth=self.depth, prune=True)
+            self.fetches += 1
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+            repo = Repo.clone_from(
+                auth_url,
+                path,
+                depth=self.depth,
+                filter="blob:none",
+                no_checkout=True,
+            )
+            repo.git.sparse_checkout("set", "--no-cone", *SPARSE_PATTERNS)
+            self.clones += 1
+
+        # Start from the remote state, every publish rewrites the files it owns
+        upstream = remote_branch(repo)
+        if upstream is not None:
+            repo.git.checkout("--force", "-B", upstream.split("/", 1)[1], upstream)
+            repo.git.clean("-d", "--force")
+        return repo
+
+    def _scan(self) -> None:
+        """Pick up the working copies left by a previous process, oldest first"""
+        if self._scanned:
+            return
+        self._scanned = True
+        if not os.path.isdir(self.root):
+            return
+        paths = [
+            os.path.join(self.root, name)
+            for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name, ".git"))
+        ]
+        for path in sorted(paths, key=os.path.getmtime):
+            self._sizes[os.path.basename(path)] = directory_size(path)
+
+    def evict(self) -> List[str]:
+        """
+        Remove the least recently used working copies that aren't leased by any worker,
+        until the pool fits max_clones and the disk budget
+
+        :returns: the keys of the removed copies
+        """
+        evicted = []
+        with self._lock:
+            # The most recently used copy is kept whatever its size
+            for key in list(self._sizes)[:-1]:
+                if (
+                    len(self._sizes) <= self.max_clones
+                    and sum(self._sizes.values()) <= self.disk_budget
+                ):
+                    break
+                lock = self._locks.setdefault(key, threading.Lock())
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    path = os.path.join(self.root, key)
+                    with clone_lock(path, blocking=False) as held:
+                        if not held:
+                            continue
+                        shutil.rmtree(path, ignore_errors=True)
+                    del self._sizes[key]
+                    evicted.append(key)
+                finally:
+                    lock.release()
+            self.evictions += len(evicted)
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "clones": self.clones,
+                "fetches": self.fetches,
+                "evictions": self.evictions,
+                "working_copies": len(self._sizes),
+                "disk_usage": sum(self._sizes.values()),
+            }
+
+
+clone_pool = ClonePool(
+    os.path.join(settings.BASE_PATH or ".", "clones"),
+    settings.GIT_CLONE_POOL_SIZE,
+    settings.GIT_CLONE_DISK_BUDGET * 1024 * 1024,
+    settings.GIT_CLONE_DEPTH,
+)
@@ -1,16 +1,13 @@
-import os
-from functools import lru_cache
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
 from git import Repo
 
-from app.config.config import settings
+from app.server.services.clone_pool import clone_pool
 
 COMMIT_MESSAGE = "Policy update from from application"
 
-default_path = settings.BASE_PATH
 
-
-@lru_cache(maxsize=1)
 class GitHubOperations:
     """Performs all operations needed to push the changes to the remote repository on the github server"""
 
@@ -26,56 +23,65 @@ class GitHubOperations:
 
         self.username = username
         self.access_token = access_token
+        self.remote_url = repo_url
         self.repo_url = repo_url.lstrip("https://")
         self.complete_repo_url = (
             f"https://{self.username}:{self.access_token}@{self.repo_url}"
         )
         self.repo_name = repo_url.removesuffix(".git").split("/")[-1]
-        self.local_repo_path = f"{default_path}/{self.repo_name}"
+        self.local_repo_path = clone_pool.path(repo_url)
         self.repo_git_path = ""
 
-    def initialize(self) -> None:
-        """clones the remote repository if it doesn't exist, sets the local repository path for writing the changes.
+    @contextmanager
+    def working_copy(self) -> Iterator[Repo]:
+        """Lease the warm, shallow and sparse working copy of the repository from the clone pool,
+        up to date with the remote, and set the local repository path for writing the changes.
 
         :param: None
-        :returns: None
+        :returns: the repository
         """
+        with clone_pool.lease(self.remote_url, self.complete_repo_url) as repo:
+            self.local_repo_path = repo.working_tree_dir
+            self.repo_git_path = repo.git_dir
+            yield repo
 
-        # Check if the repo already exists
-        if os.path.exists(self.local_repo_path):
-            self.repo_git_path = f"{self.local_repo_path}/.git"
-            return
-
-        os.mkdir(self.local_repo_path)
-
-        # Clone the repo to the server
-        initialized_repo = Repo.clone_from(self.complete_repo_url, self.local_repo_path)
-
-        self.repo_git_path = initialized_repo.git_dir
+    def blob_sha(self, file_name: str) -> Optional[str]:
+        """
+        Look up the git blob id of a file as last pushed, from the remote tracking branch when there is one
 
-    def push(self) -> None:
+        :param file_name: the file, relative to the repository root
+        :returns: the blob id, None if the file isn't in the repository
+        """
+        repo = Repo(self.repo_git_path)
+        try:
+            upstream = repo.active_branch.tracking_branch()
+            commit = upstream.commit if upstream is not None else repo.head.commit
+            return (commit.tree / file_name).hexsha
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def identity(self) -> dict:
+        """The author and committer of the policy commits, so no git identity needs configuring on the server"""
+        email = f"{self.username}@users.noreply.github.com"
+        return {
+            "GIT_AUTHOR_NAME": self.username,
+            "GIT_AUTHOR_EMAIL": email,
+            "GIT_COMMITTER_NAME": self.username,
+            "GIT_COMMITTER_EMAIL": email,
+        }
+
+    def push(self, file_names: list = None) -> None:
         """
-        Initialize the rego file as a git repository, add the rego file,
-        commit changes to the rego file, create a remote if it doesn't exist,
-        pull commit history and push the changes to the remote repository.
+        Add the rego files and the deletions of tracked files,
+        commit them and push the commit to the remote repository.
+        The working copy was fetched when it was leased, so no fetch is needed here.
 
-        :param: None
+        :param file_names: the files to commit, relative to the repository root. Defaults to the rego file.
         :returns: None
+        :raises GitCommandError: when git fails, with the failing command and its output
         """
-        try:
-            target_url = self.complete_repo_url
-            repo = Repo(self.repo_git_path)
-            repo.git.add(update=True)
-            repo.index.add([f"{self.local_repo_path}/auth.rego"])
-            repo.index.commit(COMMIT_MESSAGE)
-            remotes = repo.remotes
-            if not remotes:
-                repo.create_remote("origin", target_url)
-            if remotes[0].name != "origin":
-                repo.create_remote("origin", target_url)
-            origin = repo.remote(name="origin")
-            origin.fetch()
-
-            origin.push()
-        except Exception:
-            raise Exception
+        repo = Repo(self.repo_git_path)
+        repo.git.add(update=True)
+        repo.git.add("--", *(file_names or ["auth.rego"]))
+        repo.git.commit("-m", COMMIT_MESSAGE, env=self.identity())
+        repo.git.push("origin", "HEAD", set_upstream=True)
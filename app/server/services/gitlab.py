@@ -1,10 +1,12 @@
-from functools import lru_cache
+import hashlib
+from typing import Dict, Optional
 
 import gitlab.exceptions
 from gitlab import Gitlab
 
+from app.config.config import settings
+
 
-@lru_cache(maxsize=1)
 class GitLabOperations:
     """Performs all operations needed to push the changes to the remote repository on the gitlab server"""
 
@@ -18,7 +20,7 @@ class GitLabOperations:
         self.access_token = access_token
         self.repo_id = repo_id
 
-        self.gitlab = Gitlab(url="https://gitlab.com", oauth_token=self.access_token)
+        self.gitlab = Gitlab(url=settings.GITLAB_URL, oauth_token=self.access_token)
 
         # Initialize Gitlab instance
         self.gitlab.auth()
@@ -26,45 +28,160 @@ class GitLabOperations:
         # Retrieve the repository
         self.repo = self.gitlab.projects.get(self.repo_id)
 
-    def prepare_data_and_commit(self, policy: str, action: str) -> bool:
+        # An empty repository has no default branch yet, the first commit creates it
+        self.default_branch = self.repo.default_branch or 'main'
+        # The blob id of every file on the default branch, as of the commit _head.
+        # Loaded with a single tree request and kept up to date by the commits made through this instance.
+        self._files: Optional[Dict[str, str]] = None
+        self._head: Optional[str] = None
+
+    def branch_head(self) -> Optional[str]:
+        """
+        Get the commit the default branch points to, with a single request
+
+        :returns: the commit id, None if the branch doesn't exist yet
+        """
+        try:
+            return self.repo.branches.get(self.default_branch).commit['id']
+        except gitlab.exceptions.GitlabGetError:
+            return None
+
+    def files(self, refresh: bool = False) -> Dict[str, str]:
+        """
+        List every file on the default branch, loading the tree of the repository once
+
+        :param refresh: - load the tree again, e.g once a commit was rejected because it changed elsewhere
+
+        :returns: the blob id of every file, keyed by the file path
+        """
+        if self._files is None or refresh:
+            self._load(self.branch_head())
+        return self._files
+
+    def sync(self) -> None:
+        """
+        Bring the tree up to date with the default branch, which other clients may have committed to.
+        The tree is only loaded again when the head of the branch moved since it was loaded.
+        """
+        head = self.branch_head()
+        if self._files is None or head != self._head:
+            self._load(head)
+
+    def _load(self, head: Optional[str]) -> None:
+        try:
+            # The tree of the head itself, so the blob ids match the commit they are kept for
+            tree = self.repo.repository_tree(
+                ref=head or self.default_branch, recursive=True, all=True
+            )
+        except gitlab.exceptions.GitlabGetError:
+            tree = []
+        self._files = {
+            item['path']: item['id'] for item in tree if item['type'] == 'blob'
+        }
+        self._head = head
+
+    def commit_actions(self, files: dict, removed: list = None) -> list:
+        """
+        Build the actions of a commit, creating the files the branch doesn't have yet and updating the others
+
+        :param files: - the content of every file to be written, keyed by the file path
+        :param removed: - paths of the files to delete in the same commit
+
+        :returns: the actions of the commit
+        """
+        existing = self.files()
+        return [
+            {
+                'action': 'update' if file_path in existing else 'create',
+                'file_path': file_path,
+                'content': content,
+            }
+            for file_path, content in files.items()
+        ] + [
+            {'action': 'delete', 'file_path': file_path}
+            for file_path in removed or []
+            if file_path in existing
+        ]
+
+    def prepare_data_and_commit(self, files: dict, removed: list = None) -> bool:
         """
-        prepare policy for commit and commit it
+        prepare policy for commit and commit it, every file goes up in the same request
 
-        :param policy: - policy string to be written to the file
-        :param action: - action to be performed on the policy
+        :param files: - the content of every file to be written, keyed by the file path
+        :param removed: - paths of the files to delete in the same commit
 
         :returns: True if a commit was successful, False otherwise
         """
         data = {
-            # Once this works, enable user set the branch or use default branch instead.
-            'branch': 'main',
+            'branch': self.default_branch,
             'commit_message': 'Policy update from the OPA Manager',
-            'actions': [
-                {
-                    'action': action,
-                    'file_path': 'auth.rego',
-                    'content': policy,
-                },
-            ]
+            'actions': self.commit_actions(files, removed),
         }
 
         try:
             # Commit the changes
-            self.repo.commits.create(data)
+            commit = self.repo.commits.create(data)
 
         except gitlab.exceptions.GitlabCreateError:
-            data['actions'][0]['action'] = 'create'
-
-            # Commit the changes
-            self.repo.commits.create(data)
-            return True
+            # The repository changed since its tree was loaded, load it again and retry once
+            self.files(refresh=True)
+            data['actions'] = self.commit_actions(files, removed)
+            try:
+                commit = self.repo.commits.create(data)
+            except gitlab.exceptions.GitlabError:
+                self._files = None
+                return False
 
         except gitlab.exceptions.GitlabError:
             return False
 
+        for file_path, content in files.items():
+            blob = content.encode()
+            self._files[file_path] = hashlib.sha1(
+                b'blob %d\0' % len(blob) + blob
+            ).hexdigest()
+        for file_path in removed or []:
+            self._files.pop(file_path, None)
+        # The tree is the one of the new commit only if nobody committed in between,
+        # otherwise the head is left behind and the next sync loads the tree again
+        if commit.parent_ids == [self._head]:
+            self._head = commit.id
+        return True
+
+    def file_exists(self, file_path: str) -> bool:
+        """
+        Check whether a file exists on the default branch of the repository
+
+        :param file_path: - path of the file, relative to the repository root
+
+        :returns: True if the file exists, False otherwise
+        """
+        return file_path in self.files()
+
+    def blob_sha(self, file_path: str) -> Optional[str]:
+        """
+        Get the git blob id of a file on the default branch of the repository
+
+        :param file_path: - path of the file, relative to the repository root
+
+        :returns: the blob id, None if the file doesn't exist
+        """
+        return self.files().get(file_path)
+
+    def list_files(self, directory: str) -> list:
+        """
+        List the files of a directory of the repository
+
+        :param directory: - path of the directory, relative to the repository root
+
+        :returns: the paths of the files, relative to the repository root
+        """
+        prefix = f"{directory.rstrip('/')}/"
+        return [file_path for file_path in self.files() if file_path.startswith(prefix)]
+
     def delete_policy(self) -> bool:
         data = {
-            "branch": "master",
+            "branch": self.default_branch,
             "commit_message": "Policy deleted by the OPA Manager",
             "actions": [
                 {
@@ -78,6 +195,7 @@ class GitLabOperations:
             self.repo.commits.create(data)
         except gitlab.exceptions.GitlabCreateError:
             return False
+        self._files = None
         return True
 
     def repo_url_from_id(self) -> str:
@@ -0,0 +1,201 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from git import Repo
+from gitdb import IStream
+
+from app.config.config import settings
+from app.server.services.clone_pool import clone_key
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, the store is then only safe within a single worker
+    fcntl = None
+
+REF_PREFIX = "refs/publish"
+
+
+@contextmanager
+def store_lock(path: str) -> Iterator[None]:
+    """
+    Hold the object store exclusively, across the threads and the workers sharing it.
+    Shallow fetches rewrite the shallow file of the store, so two at once fail on its lock.
+
+    :param path: the directory of the bare repository
+    """
+    with open(os.path.join(path, "publish-lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class Snapshot:
+    """The tip of a branch of a remote repository, fetched into the object store"""
+
+    def __init__(
+        self, repo: Repo, key: str, url: str, branch: str, parent: Optional[str]
+    ) -> None:
+        self.repo = repo
+        self.key = key
+        self.url = url
+        self.branch = branch
+        self.parent = parent
+
+    @property
+    def ref(self) -> str:
+        return f"{REF_PREFIX}/{self.key}/{self.branch}"
+
+    def list_files(self, directory: str) -> List[str]:
+        """
+        List the files of a directory of the tip, without checking it out
+
+        :param directory: path of the directory, relative to the repository root
+        :returns: the paths of the files, relative to the repository root
+        """
+        if self.parent is None:
+            return []
+        output = self.repo.git.ls_tree(
+            self.parent, f"{directory.rstrip('/')}/", name_only=True, r=True
+        )
+        return output.splitlines()
+
+    def commit(
+        self,
+        files: Dict[str, str],
+        removed: Iterable[str],
+        message: str,
+        env: dict = None,
+    ) -> Optional[str]:
+        """
+        Build the blobs, the tree and the commit of a publish directly in the object store
+
+        :param files: the content of every file to write, keyed by path
+        :param removed: the paths of the files to delete
+        :param message: the commit message
+        :param env: the author and committer of the commit
+        :returns: the commit id, None if the tree is the one of the tip
+        """
+        entries = []
+        for path, content in files.items():
+            data = content.encode()
+            blob = self.repo.odb.store(IStream("blob", len(data), BytesIO(data)))
+            entries.append(f"100644 {blob.hexsha.decode()}\t{path}\n")
+        # Mode 0 removes the path from the index
+        entries += [f"0 {'0' * 40}\t{path}\n" for path in removed]
+
+        # A throwaway index, the working tree and the shared index are never touched
+        with tempfile.TemporaryDirectory(dir=self.repo.git_dir) as directory:
+            index_env = {"GIT_INDEX_FILE": os.path.join(directory, "index")}
+            if self.parent is None:
+                self.repo.git.read_tree(empty=True, env=index_env)
+            else:
+                self.repo.git.read_tree(self.parent, env=index_env)
+            with tempfile.TemporaryFile(dir=directory) as index_info:
+                index_info.write("".join(entries).encode())
+                index_info.seek(0)
+                self.repo.git.update_index(
+                    index_info=True, istream=index_info, env=index_env
+                )
+            tree = self.repo.git.write_tree(env=index_env)
+
+        if self.parent is not None and tree == self.repo.git.rev_parse(
+            f"{self.parent}^{{tree}}"
+        ):
+            return None
+
+        parents = ["-p", self.parent] if self.parent else []
+        return self.repo.git.commit_tree(tree, *parents, "-m", message, env=env or {})
+
+    def push(self, commit: str) -> None:
+        """
+        Push a commit built on the tip to the branch, and move the tip to it
+
+        :param commit: the commit id
+        """
+        self.repo.git.push(self.url, f"{commit}:refs/heads/{self.branch}")
+        with store_lock(self.repo.git_dir):
+            self.repo.git.update_ref(self.ref, commit)
+        self.parent = commit
+
+
+class ObjectStore:
+    """
+    A bare repository the publishes of every repository share, fetching only branch tips
+    and building commits from git objects, without a working tree.
+    """
+
+    def __init__(self, path: str, depth: int = 1) -> None:
+        """
+        :param path: the directory of the bare repository
+        :param depth: the number of commits fetched
+        """
+        self.path = path
+        self.depth = depth
+        self.fetches = 0
+        self._repo: Optional[Repo] = None
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def repo(self) -> Repo:
+        with self._lock:
+            if self._repo is None:
+                if os.path.isdir(self.path):
+                    self._repo = Repo(self.path)
+                else:
+                    self._repo = Repo.init(self.path, bare=True, mkdir=True)
+            return self._repo
+
+    @contextmanager
+    def lease(self, repo_url: str, auth_url: str = None) -> Iterator[Snapshot]:
+        """
+        Fetch the tip of the default branch of a repository for the duration of a publish.
+        Publishes of the same repository wait for each other.
+
+        :param repo_url: the url of the repository, without credentials
+        :param auth_url: the url to fetch from and push to, with credentials
+        :returns: the tip of the branch
+        """
+        key = clone_key(repo_url)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            yield self.fetch(key, auth_url or repo_url)
+
+    def fetch(self, key: str, url: str) -> Snapshot:
+        repo = self.repo
+        branch, tip, parent = None, None, None
+        for line in repo.git.ls_remote("--symref", url, "HEAD").splitlines():
+            if line.startswith("ref: ") and line.endswith("\tHEAD"):
+                branch = line[len("ref: refs/heads/") : -len("\tHEAD")]
+            elif line.endswith("\tHEAD"):
+                tip = line.split("\t")[0]
+        if branch is not None and tip is not None:
+            ref = f"{REF_PREFIX}/{key}/{branch}"
+            with store_lock(repo.git_dir):
+                # Only fetch when the branch moved since the last publish
+                if tip not in repo.git.for_each_ref(ref, format="%(objectname)"):
+                    # The url is passed on the command line, so credentials are never stored in the config
+                    repo.git.fetch(
+                        url,
+                        f"+refs/heads/{branch}:{ref}",
+                        depth=self.depth,
+                        no_tags=True,
+                    )
+                    self.fetches += 1
+            parent = tip
+        return Snapshot(repo, key, url, branch or "main", parent)
+
+
+object_store = ObjectStore(
+    os.path.join(settings.BASE_PATH or ".", "objects.git"), settings.GIT_CLONE_DEPTH
+)
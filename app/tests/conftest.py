@@ -7,6 +7,8 @@ from app.config.config import settings
 from app.database.policy_database import PolicyDatabase, get_db
 from app.server.api import app
 
+from .git_remote import commit_file, git, serve
+
 default_path = settings.BASE_PATH
 
 
@@ -23,17 +25,23 @@ def init_dir() -> None:
 init_dir()
 
 
-def override_get_db() -> PolicyDatabase:
-    """Override the get_db function to return a fake database used for tests purpose"""
+def override_get_db(database: PolicyDatabase):
+    """Override the get_db function to return a fake database used for tests purpose,
+    shared by every request as get_db shares the database of the worker"""
 
-    return PolicyDatabase(f"{default_path}/test.json")
+    return lambda: database
 
 
 @pytest.fixture(scope="module")
 def client() -> TestClient:
-    app.dependency_overrides[get_db] = override_get_db
+    database = PolicyDatabase(f"{default_path}/test.json")
+    app.dependency_overrides[get_db] = override_get_db(database)
     yield TestClient(app=app)
-    os.remove(f"{default_path}/test.json")
+    database.backend.close()
+    # Only the modules that store policies leave the file behind, the store always leaves its lock file
+    for path in (f"{default_path}/test.json", f"{default_path}/test.json.lock"):
+        if os.path.exists(path):
+            os.remove(path)
 
 
 @pytest.fixture(scope="module")
@@ -45,3 +53,29 @@ def authorized_client(client: TestClient) -> TestClient:
         "Authorization": f"Bearer {settings.GITHUB_ACCESS_TOKEN}",
     }
     return client
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """A policy repository with some history and files the publish doesn't need"""
+    bare, seed = tmp_path / "remote.git", tmp_path / "seed"
+    git("init", "--bare", "-b", "main", str(bare), cwd=tmp_path)
+    git("clone", str(bare), str(seed), cwd=tmp_path)
+    for index in range(3):
+        commit_file(seed, "docs/notes.md", f"revision {index}")
+    commit_file(seed, "auth.rego", "package httpapi.authz\n")
+    return f"file://{bare}", seed
+
+
+@pytest.fixture
+def stand_in_server():
+    """Serves stand-in handlers of provider APIs, shut down with the test"""
+    servers = []
+
+    def start(handler: type) -> str:
+        servers.append(serve(handler))
+        return f"http://127.0.0.1:{servers[-1].server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
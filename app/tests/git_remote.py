@@ -0,0 +1,58 @@
+"""Helpers that stand in for the policy remotes: local git repositories, and local HTTP servers for the provider APIs"""
+import json
+import os
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IDENTITY = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+}
+
+
+def git(*args: str, cwd) -> str:
+    return subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        env={**os.environ, **IDENTITY},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+def commit_file(seed, path: str, content: str) -> None:
+    (seed / path).parent.mkdir(parents=True, exist_ok=True)
+    (seed / path).write_text(content)
+    git("add", path, cwd=seed)
+    git("commit", "-m", f"Update {path}", cwd=seed)
+    git("push", "origin", "HEAD", cwd=seed)
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Base of the request handlers standing in for a provider API, only the routes are left to subclasses"""
+
+    def reply(self, status: int, body=None, headers: dict = None) -> None:
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def serve(handler: type) -> ThreadingHTTPServer:
+    """Serve a handler on a free local port, from a daemon thread"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+
+from app.config.config import settings
+from app.server.auth.authorize_token import TokenBearer
+from app.server.auth.token_cache import token_cache
+
+from .git_remote import StandIn
+
+
+def stand_in(path: str, login_key: str, delay: float = 0) -> type:
+    """Handles the user endpoint of a provider, accepting only the token 'valid'"""
+
+    class Handler(StandIn):
+        calls = 0
+
+        def do_GET(self) -> None:
+            Handler.calls += 1
+            time.sleep(delay)
+            valid = "access_token=valid" in self.path or (
+                self.headers.get("Authorization") == "token valid"
+            )
+            status = 200 if self.path.startswith(path) and valid else 401
+            self.reply(status, {login_key: "octocat"})
+
+    return Handler
+
+
+@pytest.fixture
+def providers(monkeypatch, stand_in_server):
+    gitlab = stand_in("/api/v4/user", "username", delay=1)
+    github = stand_in("/user", "login")
+    monkeypatch.setattr(settings, "GITLAB_URL", stand_in_server(gitlab))
+    monkeypatch.setattr(settings, "GITHUB_API_URL", stand_in_server(github))
+    token_cache.clear()
+    yield gitlab, github
+    token_cache.clear()
+
+
+def test_first_provider_to_accept_wins(providers):
+    async def timed_verification() -> tuple:
+        started = time.monotonic()
+        verified = await TokenBearer().verify_token("valid")
+        return verified, time.monotonic() - started
+
+    verified, elapsed = asyncio.run(timed_verification())
+
+    # GitHub answers without waiting for the slow GitLab rejection
+    assert verified == (True, {"token": "valid", "login": "octocat"})
+    assert elapsed < 1
+    assert token_cache.provider("valid") == "github"
+
+
+def test_affinity_skips_the_other_provider(providers):
+    gitlab, github = providers
+    token_cache.set_provider("valid", "github")
+
+    assert asyncio.run(TokenBearer().verify_token("valid"))[0]
+    assert (gitlab.calls, github.calls) == (0, 1)
+
+
+def test_rejections_are_cached(providers):
+    gitlab, github = providers
+
+    assert not asyncio.run(TokenBearer().verify_token("invalid"))[0]
+    assert not asyncio.run(TokenBearer().verify_token("invalid"))[0]
+    assert (gitlab.calls, github.calls) == (1, 1)
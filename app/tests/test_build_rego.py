@@ -0,0 +1,124 @@
+import io
+import time
+
+from app.config.config import settings
+from app.utils.build_rego_file import build_rego, iter_rego
+from app.utils.write_rego import (
+    POLICY_FILE,
+    emit_policies,
+    initiate_rule,
+    render_files,
+    shard_path,
+    shard_rule,
+    stale_shards,
+)
+
+from .test_data import test_request_object
+
+
+def path_rules(count: int) -> list:
+    return [
+        [
+            {
+                "command": "input_prop_equals",
+                "properties": {
+                    "input_property": "request_path",
+                    "value": ["v1", "collections", f"collection-{index}"],
+                },
+            }
+        ]
+        for index in range(count)
+    ]
+
+
+def test_wildcard_with_exceptional_value():
+    rego = build_rego(test_request_object["rules"][:1])
+
+    assert rego == (
+        "allow {\n"
+        '  input.request_path[0] == "v1"\n'
+        '  input.request_path[1] == "collections"\n'
+        '  input.request_path[2] != "obs"\n'
+        "  input.company == data.items[_].company\n"
+        '  input.request_method == "GET"\n'
+        "}\n\n"
+    )
+
+
+def test_wildcard_without_exceptional_value():
+    rego = build_rego(test_request_object["rules"][1:2])
+
+    assert rego == (
+        "allow {\n"
+        '  input.request_path[0] == "v1"\n'
+        '  input.request_path[1] == "collections"\n'
+        '  input.request_path[2] == "obs"\n'
+        '  input.company == "geobeyond"\n'
+        "}\n\n"
+    )
+
+
+def test_emit_policies_streams_to_buffer():
+    buffer = io.StringIO()
+    emit_policies([test_request_object], buffer)
+
+    assert buffer.getvalue() == initiate_rule + build_rego(test_request_object["rules"])
+
+
+def test_emit_policies_without_policies_writes_nothing():
+    buffer = io.StringIO()
+    emit_policies([], buffer)
+
+    assert buffer.getvalue() == ""
+
+
+def test_emitter_scales_linearly_to_100k_rules():
+    def emit(count: int) -> float:
+        rules = path_rules(count)
+        buffer = io.StringIO()
+        start = time.perf_counter()
+        buffer.writelines(iter_rego(rules))
+        elapsed = time.perf_counter() - start
+        assert buffer.getvalue().count("allow {") == count
+        return elapsed
+
+    small, large = emit(10_000), emit(100_000)
+
+    # 10x the rules must stay far below the 100x a quadratic build would cost
+    assert large < small * 30
+
+
+def test_sharded_mode_writes_one_module_per_policy(monkeypatch):
+    monkeypatch.setattr(settings, "REGO_OUTPUT_MODE", "sharded")
+    other = {**test_request_object, "name": "Other policy"}
+
+    files = {
+        path: "".join(content)
+        for path, content in render_files([test_request_object, other]).items()
+    }
+
+    assert files[POLICY_FILE] == initiate_rule
+    shards = [path for path in files if path != POLICY_FILE]
+    assert shards == [shard_path(test_request_object), shard_path(other)]
+    assert shards[1].startswith("policies/Other_policy-")
+    assert files[shards[0]] == shard_rule + build_rego(test_request_object["rules"])
+    assert "default allow" not in files[shards[1]]
+
+
+def test_stale_shards_are_pruned(monkeypatch):
+    monkeypatch.setattr(settings, "REGO_OUTPUT_MODE", "sharded")
+    files = render_files([test_request_object])
+    current = shard_path(test_request_object)
+    deleted = shard_path({"name": "Deleted"})
+
+    assert stale_shards(
+        [current, deleted, "policies/README.md", "policies/handwritten.rego"], files
+    ) == [deleted]
+
+
+def test_single_mode_prunes_every_shard():
+    files = render_files([test_request_object])
+
+    assert stale_shards([shard_path(test_request_object)], files) == [
+        shard_path(test_request_object)
+    ]
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from app.server.services.client_pool import ClientPool, client_key
+
+
+def test_alternating_repositories_reuse_their_clients():
+    pool = ClientPool(maxsize=8, ttl=60)
+    built = []
+
+    def factory(repo):
+        return lambda: built.append(repo) or object()
+
+    keys = [client_key("gitlab", repo, "token") for repo in (1, 2)]
+    clients = [pool.get(key, factory(key[1])) for key in keys * 3]
+
+    assert built == ["1", "2"]
+    assert clients[0] is clients[2] is clients[4]
+    assert pool.stats() == {"clients": 2, "hits": 4, "misses": 2, "evictions": 0}
+
+
+def test_clients_expire_and_are_dropped_with_their_token():
+    now = [0.0]
+    pool = ClientPool(maxsize=8, ttl=10, clock=lambda: now[0])
+    key = client_key("github", "https://github.com/example/policies", "token")
+
+    first = pool.get(key, object)
+    now[0] = 11
+    second = pool.get(key, object)
+    assert first is not second
+
+    pool.get(client_key("github", "https://github.com/example/other", "other"), object)
+    assert pool.invalidate("token") == 1
+    assert pool.get(key, object) is not second
+    assert pool.stats()["clients"] == 2
+
+
+def test_clients_in_use_are_not_evicted():
+    pool = ClientPool(maxsize=1, ttl=60)
+    busy, idle, new = (client_key("gitlab", repo, "token") for repo in (1, 2, 3))
+    pool.get(busy, object)
+
+    with pool.lock(busy):
+        pool.get(idle, object)
+        pool.get(new, object)
+
+    assert pool.stats()["clients"] == 2
+    assert pool.stats()["evictions"] == 1
+
+
+def test_concurrent_misses_build_the_client_once():
+    pool = ClientPool(maxsize=8, ttl=60)
+    key = client_key("gitlab", 1, "token")
+    built = []
+
+    def factory():
+        built.append(1)
+        # Authenticating and fetching the project takes a while
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(pool.get(key, factory)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(built) == 1
+    assert all(client is results[0] for client in results)
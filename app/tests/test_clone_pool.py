@@ -0,0 +1,86 @@
+import os
+
+from app.server.services.clone_pool import ClonePool, clone_key
+from app.server.services.github import GitHubOperations
+
+from .git_remote import commit_file, git
+
+
+def test_clones_are_shallow_and_sparse(tmp_path, remote):
+    url, _ = remote
+    pool = ClonePool(str(tmp_path / "clones"), max_clones=2, disk_budget=10**9)
+
+    with pool.lease(url) as repo:
+        checkout = repo.working_tree_dir
+        assert os.path.exists(os.path.join(checkout, "auth.rego"))
+        assert not os.path.exists(os.path.join(checkout, "docs"))
+        assert git("rev-parse", "--is-shallow-repository", cwd=checkout) == "true"
+        assert git("rev-list", "--count", "HEAD", cwd=checkout) == "1"
+
+
+def test_warm_copies_fetch_new_commits(tmp_path, remote):
+    url, seed = remote
+    pool = ClonePool(str(tmp_path / "clones"), max_clones=2, disk_budget=10**9)
+
+    with pool.lease(url):
+        pass
+    commit_file(seed, "auth.rego", "package httpapi.authz\n\ndefault allow = false\n")
+    with pool.lease(url) as repo:
+        content = open(os.path.join(repo.working_tree_dir, "auth.rego")).read()
+
+    assert "default allow" in content
+    assert (pool.stats()["clones"], pool.stats()["fetches"]) == (1, 1)
+
+
+def test_policies_are_pushed_from_the_working_copy(tmp_path, remote):
+    url, seed = remote
+    pool = ClonePool(str(tmp_path / "clones"), max_clones=2, disk_budget=10**9)
+    github = GitHubOperations(url, "token", "octocat")
+
+    with pool.lease(url) as repo:
+        github.local_repo_path, github.repo_git_path = (
+            repo.working_tree_dir,
+            repo.git_dir,
+        )
+        with open(os.path.join(repo.working_tree_dir, "auth.rego"), "w") as file:
+            file.write("package httpapi.authz\nimport input\n")
+        github.push(["auth.rego"])
+
+    git("pull", cwd=seed)
+    assert (seed / "auth.rego").read_text() == "package httpapi.authz\nimport input\n"
+    assert (seed / "docs" / "notes.md").read_text() == "revision 2"
+    assert git("log", "-1", "--format=%an", cwd=seed) == "octocat"
+
+
+def test_least_recently_used_copies_are_evicted(tmp_path, remote):
+    url, _ = remote
+    pool = ClonePool(str(tmp_path / "clones"), max_clones=1, disk_budget=10**9)
+    git("clone", "--bare", url, str(tmp_path / "other.git"), cwd=tmp_path)
+    other = f"file://{tmp_path / 'other.git'}"
+
+    with pool.lease(url):
+        pass
+    with pool.lease(other):
+        pass
+
+    assert not os.path.exists(pool.path(url))
+    assert os.path.exists(pool.path(other))
+    assert pool.stats()["evictions"] == 1
+    assert clone_key(url) != clone_key(other)
+
+
+def test_copies_leased_by_another_worker_are_not_evicted(tmp_path, remote):
+    url, _ = remote
+    root = str(tmp_path / "clones")
+    git("clone", "--bare", url, str(tmp_path / "other.git"), cwd=tmp_path)
+    other = f"file://{tmp_path / 'other.git'}"
+
+    # Each pool stands in for the pool of a worker, sharing the directory
+    with ClonePool(root, max_clones=1, disk_budget=10**9).lease(url):
+        pool = ClonePool(root, max_clones=1, disk_budget=10**9)
+        with pool.lease(other):
+            pass
+        assert os.path.exists(pool.path(url))
+
+    assert pool.evict() == [clone_key(url)]
+    assert not os.path.exists(pool.path(url))
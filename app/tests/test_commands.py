@@ -0,0 +1,40 @@
+import pytest
+
+from app.utils.commands import InputPropEquals, InputPropIn, parse_command, parse_rules
+
+from .test_data import test_request_object
+
+
+def test_commands_are_compiled_once_and_immutable():
+    command = parse_command(test_request_object["rules"][0][0])
+
+    assert isinstance(command, InputPropEquals)
+    assert command.conditions == (
+        'input.request_path[0] == "v1"',
+        'input.request_path[1] == "collections"',
+        'input.request_path[2] != "obs"',
+    )
+    assert not hasattr(command, "__dict__")
+    with pytest.raises(AttributeError):
+        command.value = ("v2",)
+
+
+def test_exact_paths_do_not_mutate_the_rule_object():
+    properties = {"input_property": "request_path", "value": ["v1", "lakes"]}
+
+    assert InputPropEquals.from_properties(properties).rego == (
+        'input.request_path == ["v1", "lakes", ""]'
+    )
+    assert properties["value"] == ["v1", "lakes"]
+
+
+def test_indexed_datasource_commands():
+    command = parse_command(test_request_object["rules"][0][1], indexed=True)
+
+    assert isinstance(command, InputPropIn)
+    assert command.rego == 'data.indexes.items["company"][input.company]'
+
+
+def test_unknown_commands_are_rejected():
+    with pytest.raises(ValueError):
+        parse_rules([[{"command": "deny_everything", "properties": {}}]])
@@ -0,0 +1,120 @@
+from app.config.config import settings
+from app.utils.datasource_index import (
+    build_datasource_index,
+    build_index_document,
+    required_indexes,
+)
+from app.utils.write_rego import iter_policies
+
+membership_policy = {
+    "name": "Membership",
+    "rules": [
+        [
+            {
+                "command": "allow_if_object_in_database",
+                "properties": {
+                    "datasource_name": "usergroups",
+                    "datasource_variables": ["name", "groupname"],
+                },
+            },
+            {
+                "command": "input_prop_in",
+                "properties": {
+                    "input_property": "company",
+                    "datasource_name": "items",
+                    "datasource_loop_variable": "name",
+                },
+            },
+        ]
+    ],
+}
+
+datasources = {
+    "usergroups": [
+        {"name": "admin", "groupname": "EDITOR_ATAC"},
+        {"name": "admin", "groupname": "VIEWER"},
+        {"name": "guest", "groupname": "VIEWER", "disabled": True},
+    ],
+    "items": [{"company": "geobeyond", "name": "lakes"}, {"name": "obs"}],
+}
+
+
+def test_required_indexes():
+    assert required_indexes([membership_policy]) == {
+        "usergroups": {(("name", "groupname"), True)},
+        "items": {(("company",), False)},
+    }
+
+
+def test_composite_index_nests_fields_in_order():
+    index = build_datasource_index(datasources["usergroups"], ("name", "groupname"))
+
+    assert index == {
+        "admin": {"EDITOR_ATAC": True, "VIEWER": True},
+        "guest": {"VIEWER": True},
+    }
+
+
+def test_index_document_keeps_object_equality_semantics():
+    assert build_index_document([membership_policy], datasources) == {
+        "indexes": {
+            "usergroups": {
+                "exact:name,groupname": {"admin": {"EDITOR_ATAC": True, "VIEWER": True}}
+            },
+            "items": {"company": {"geobeyond": True}},
+        }
+    }
+
+
+def test_indexed_mode_emits_keyed_lookups(monkeypatch):
+    monkeypatch.setattr(settings, "REGO_INDEXED_DATASOURCES", True)
+
+    rego = "".join(iter_policies([membership_policy]))
+
+    assert (
+        'data.indexes.usergroups["exact:name,groupname"][input.name][input.groupname]'
+        in rego
+    )
+    assert 'data.indexes.items["company"][input.company]' in rego
+    assert "[_]" not in rego
+
+
+def test_exact_and_plain_indexes_of_the_same_fields_are_kept_apart():
+    policies = [
+        {
+            "rules": [
+                [
+                    {
+                        "command": "input_prop_in",
+                        "properties": {
+                            "input_property": "name",
+                            "datasource_name": "usergroups",
+                        },
+                    }
+                ],
+                [
+                    {
+                        "command": "allow_if_object_in_database",
+                        "properties": {
+                            "datasource_name": "usergroups",
+                            "datasource_variables": ["name"],
+                        },
+                    }
+                ],
+            ]
+        }
+    ]
+
+    document = build_index_document(
+        policies, {"usergroups": [{"name": "alice", "groupname": "x"}]}
+    )
+
+    assert document == {
+        "indexes": {"usergroups": {"name": {"alice": True}, "exact:name": {}}}
+    }
+
+
+def test_only_string_values_are_indexed():
+    rows = [{"id": 5}, {"id": "6"}, {"id": True}]
+
+    assert build_datasource_index(rows, ("id",)) == {"6": True}
@@ -0,0 +1,91 @@
+from app.server.auth.token_cache import token_cache
+from app.server.executors import compute_pool
+from app.utils.evaluator import PolicyEvaluator
+
+from .test_data import test_request_object
+
+data = {
+    "items": [{"company": "geobeyond"}],
+    "usergroups": [{"name": "admin", "groupname": "EDITOR_ATAC"}],
+}
+
+
+def decide(request: dict, policies: list = None) -> dict:
+    return PolicyEvaluator(policies or [test_request_object]).evaluate(request, data)
+
+
+def test_wildcard_with_exceptional_value():
+    request = {
+        "request_path": ["v1", "collections", "lakes"],
+        "request_method": "GET",
+        "company": "geobeyond",
+    }
+
+    assert decide(request) == {"allow": True, "policy": "Example", "rule": 0}
+    assert not decide({**request, "company": "other"})["allow"]
+    # The exempted collection is only granted by the rule on its own sub paths
+    obs = {**request, "request_path": ["v1", "collections", "obs"]}
+    assert decide(obs)["rule"] == 1
+
+
+def test_exact_path_requires_trailing_segment():
+    request = {"request_path": ["v1", "collections", "lakes", ""], "groupname": "admin"}
+
+    assert decide(request)["rule"] == 4
+    assert not decide({**request, "request_path": ["v1", "collections", "lakes"]})[
+        "allow"
+    ]
+
+
+def test_full_access_ignores_the_path():
+    assert decide({"groupname": "EDITOR_ATAC"})["rule"] == 2
+    assert decide({}) == {"allow": False, "policy": None, "rule": None}
+
+
+def test_object_in_database_requires_an_equal_object():
+    policy = {
+        "name": "Members",
+        "rules": [
+            [
+                {
+                    "command": "allow_if_object_in_database",
+                    "properties": {
+                        "datasource_name": "usergroups",
+                        "datasource_variables": ["name", "groupname"],
+                    },
+                }
+            ]
+        ],
+    }
+    member = {"name": "admin", "groupname": "EDITOR_ATAC"}
+
+    assert decide(member, [policy])["allow"]
+    assert not decide({**member, "groupname": "VIEWER"}, [policy])["allow"]
+    assert not decide({"name": "admin"}, [policy])["allow"]
+
+
+def test_batch_decisions_keep_input_order():
+    evaluator = PolicyEvaluator([test_request_object])
+    requests = [{"groupname": "EDITOR_ATAC"}, {"groupname": "VIEWER"}] * 1000
+
+    decisions = evaluator.evaluate_batch(requests, data)
+
+    assert [d["allow"] for d in decisions[:2]] == [True, False]
+    assert len(decisions) == 2000
+
+
+def test_evaluation_runs_in_the_compute_pool(client):
+    completed = compute_pool.metrics()["completed"]
+    token_cache.set("evaluate-token", True, "octocat")
+    try:
+        response = client.post(
+            "/policies/evaluate",
+            json={"inputs": [{"request_path": ["v1", ""]}]},
+            headers={"Authorization": "Bearer evaluate-token"},
+        )
+    finally:
+        token_cache.invalidate("evaluate-token")
+
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 1
+    assert compute_pool.metrics()["completed"] == completed + 1
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.server.executors import BoundedExecutor, ExecutorSaturated
+
+
+def test_blocking_work_runs_off_the_event_loop():
+    pool = BoundedExecutor("test", max_workers=2, max_queue=4)
+
+    async def run() -> tuple:
+        return threading.get_ident(), await pool.run(threading.get_ident)
+
+    loop_thread, worker_thread = asyncio.run(run())
+
+    assert loop_thread != worker_thread
+    assert pool.metrics()["completed"] == 1
+    pool.shutdown()
+
+
+def test_full_queue_is_rejected_and_reported():
+    pool = BoundedExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block() -> None:
+        started.set()
+        release.wait()
+
+    running = pool.submit(block)
+    started.wait()
+    waiting = pool.submit(block)
+    with pytest.raises(ExecutorSaturated):
+        pool.submit(block)
+
+    metrics = pool.metrics()
+    assert (metrics["active"], metrics["queued"], metrics["rejected"]) == (1, 1, 1)
+    assert metrics["saturation"] == metrics["queue_saturation"] == 1.0
+
+    release.set()
+    running.result(), waiting.result()
+    assert pool.metrics()["completed"] == 2
+    pool.shutdown()
+
+
+def test_failures_are_counted_and_raised():
+    pool = BoundedExecutor("test", max_workers=1, max_queue=1)
+
+    with pytest.raises(ZeroDivisionError):
+        pool.submit(lambda: 1 / 0).result()
+
+    assert pool.metrics()["failed"] == 1
+    pool.shutdown()
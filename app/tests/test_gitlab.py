@@ -0,0 +1,139 @@
+import hashlib
+import json
+
+import pytest
+
+from app.config.config import settings
+from app.server.services.client_pool import client_pool
+from app.server.services.gitlab import GitLabOperations
+from app.utils.write_rego import WriteRego, git_blob_sha, render_contents
+
+from .git_remote import StandIn
+
+PROJECT = "/api/v4/projects/7"
+
+
+def head(files: dict) -> str:
+    """A commit id that moves whenever the files change, however they were changed"""
+    return hashlib.sha1(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+
+def stand_in(branch: str, files: dict) -> type:
+    """Handles the project, branch, tree and commit endpoints of a GitLab repository holding files"""
+
+    class Handler(StandIn):
+        requests = []
+
+        def do_GET(self) -> None:
+            path = self.path.split("?")[0]
+            Handler.requests.append(("GET", path))
+            if path == "/api/v4/user":
+                self.reply(200, {"username": "octocat"})
+            elif path == PROJECT:
+                self.reply(200, {"id": 7, "default_branch": branch})
+            elif path == f"{PROJECT}/repository/branches/{branch}":
+                self.reply(200, {"name": branch, "commit": {"id": head(files)}})
+            elif path == f"{PROJECT}/repository/tree":
+                tree = [
+                    {"path": name, "type": "blob", "id": git_blob_sha(content)}
+                    for name, content in files.items()
+                ]
+                self.reply(200, tree)
+            else:
+                self.reply(404, {"message": "404 Not Found"})
+
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            Handler.requests.append(("POST", self.path, body))
+            for action in body["actions"]:
+                exists = action["file_path"] in files
+                if body["branch"] != branch or exists != (action["action"] != "create"):
+                    return self.reply(
+                        400, {"message": "A file with this name doesn't exist"}
+                    )
+            parent = head(files)
+            for action in body["actions"]:
+                if action["action"] == "delete":
+                    del files[action["file_path"]]
+                else:
+                    files[action["file_path"]] = action["content"]
+            self.reply(201, {"id": head(files), "parent_ids": [parent]})
+
+    return Handler
+
+
+@pytest.fixture
+def gitlab(monkeypatch, stand_in_server):
+    files = {"auth.rego": "package a", "policies/old.rego": "package a"}
+    handler = stand_in("trunk", files)
+    monkeypatch.setattr(settings, "GITLAB_URL", stand_in_server(handler))
+    yield handler, files
+
+
+def commits(handler) -> list:
+    return [request[2] for request in handler.requests if request[0] == "POST"]
+
+
+def test_first_publish_is_a_single_commit_on_the_default_branch(gitlab):
+    handler, files = gitlab
+    operations = GitLabOperations(7, "token")
+
+    assert operations.blob_sha("auth.rego") == git_blob_sha("package a")
+    assert operations.list_files("policies") == ["policies/old.rego"]
+    assert operations.prepare_data_and_commit(
+        {"auth.rego": "package b", "policies/new.rego": "package b"},
+        removed=["policies/old.rego"],
+    )
+
+    (commit,) = commits(handler)
+    assert commit["branch"] == "trunk"
+    assert [action["action"] for action in commit["actions"]] == [
+        "update",
+        "create",
+        "delete",
+    ]
+    assert files == {"auth.rego": "package b", "policies/new.rego": "package b"}
+    # The tree was loaded once, the commit kept it up to date
+    tree = [request for request in handler.requests if "tree" in request[1]]
+    assert len(tree) == 1
+    assert operations.file_exists("policies/new.rego")
+    assert not operations.file_exists("policies/old.rego")
+
+
+def test_stale_tree_is_reloaded_once(gitlab):
+    handler, files = gitlab
+    operations = GitLabOperations(7, "token")
+    operations.files()
+    # Someone else removed the file since the tree was loaded
+    del files["auth.rego"]
+
+    assert operations.prepare_data_and_commit({"auth.rego": "package b"})
+    assert [commit["actions"][0]["action"] for commit in commits(handler)] == [
+        "update",
+        "create",
+    ]
+
+
+def test_publishes_are_skipped_while_the_branch_head_stands(gitlab):
+    handler, files = gitlab
+    policies = [{"name": "a", "rules": []}]
+    writer = WriteRego("token", None, "octocat", "gitlab", 7)
+    try:
+        assert writer.write_to_file(policies)
+        # The commit kept the cached tree up to date, only the head is checked
+        published = len(handler.requests)
+        assert not writer.write_to_file(policies)
+        assert handler.requests[published:] == [
+            ("GET", f"{PROJECT}/repository/branches/trunk")
+        ]
+
+        # Another worker committed through its own client since
+        files["auth.rego"] = "package a"
+        assert writer.write_to_file(policies)
+    finally:
+        client_pool.clear()
+
+    assert len(commits(handler)) == 2
+    # Loaded for the first publish, and again once the head moved
+    assert sum("tree" in request[1] for request in handler.requests) == 2
+    assert files["auth.rego"] == render_contents(policies)["auth.rego"]
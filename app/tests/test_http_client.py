@@ -0,0 +1,22 @@
+import asyncio
+
+from app.server.http_client import close_http_client, get_http_client
+
+
+def test_client_is_shared_within_an_event_loop():
+    async def clients() -> tuple:
+        first, second = get_http_client(), get_http_client()
+        await close_http_client()
+        return first, second
+
+    first, second = asyncio.run(clients())
+
+    assert first is second
+    assert first.is_closed
+
+
+def test_client_is_not_shared_across_event_loops():
+    async def client():
+        return get_http_client()
+
+    assert asyncio.run(client()) is not asyncio.run(client())
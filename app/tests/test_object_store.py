@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+
+from app.server.services.clone_pool import ClonePool
+from app.server.services.github import GitHubOperations
+from app.server.services.object_store import ObjectStore
+from app.utils.write_rego import render_contents
+
+from .git_remote import git
+from .test_data import test_request_object
+
+IDENTITY = GitHubOperations("https://github.com/a/b", "token", "octocat").identity()
+
+
+def test_commits_are_built_without_a_working_tree(tmp_path, remote):
+    url, seed = remote
+    store = ObjectStore(str(tmp_path / "objects.git"))
+    contents = render_contents([test_request_object])
+
+    with store.lease(url) as snapshot:
+        commit = snapshot.commit(
+            {**contents, "policies/new-0123abcd.rego": "package httpapi.authz\n"},
+            [],
+            "Policy update",
+            IDENTITY,
+        )
+        snapshot.push(commit)
+
+    git("pull", cwd=seed)
+    assert (seed / "auth.rego").read_text() == contents["auth.rego"]
+    assert (seed / "policies" / "new-0123abcd.rego").exists()
+    assert (seed / "docs" / "notes.md").read_text() == "revision 2"
+    assert git("log", "-1", "--format=%an", cwd=seed) == "octocat"
+    assert not os.path.exists(tmp_path / "objects.git" / "auth.rego")
+
+
+def test_removed_files_and_unchanged_trees(tmp_path, remote):
+    url, seed = remote
+    store = ObjectStore(str(tmp_path / "objects.git"))
+
+    with store.lease(url) as snapshot:
+        snapshot.push(
+            snapshot.commit({"policies/old-0123abcd.rego": "x"}, [], "Add", IDENTITY)
+        )
+    with store.lease(url) as snapshot:
+        assert snapshot.list_files("policies") == ["policies/old-0123abcd.rego"]
+        assert snapshot.commit({"auth.rego": "package httpapi.authz\n"}, [], "") is None
+        snapshot.push(
+            snapshot.commit({}, ["policies/old-0123abcd.rego"], "Remove", IDENTITY)
+        )
+
+    git("pull", cwd=seed)
+    assert not (seed / "policies").exists()
+    # The tip the store pushed itself is not fetched again
+    assert store.fetches == 1
+
+
+def test_empty_remotes_get_a_first_commit(tmp_path):
+    bare = tmp_path / "empty.git"
+    git("init", "--bare", "-b", "main", str(bare), cwd=tmp_path)
+    store = ObjectStore(str(tmp_path / "objects.git"))
+
+    with store.lease(f"file://{bare}") as snapshot:
+        assert snapshot.parent is None
+        snapshot.push(
+            snapshot.commit({"auth.rego": "package a\n"}, [], "First", IDENTITY)
+        )
+
+    assert git("show", "main:auth.rego", cwd=bare) == "package a"
+
+
+def test_both_engines_publish_the_same_tree(tmp_path, remote):
+    """Run with --durations to compare the cost of the two publish paths"""
+    url, _ = remote
+    git("clone", "--bare", url, str(tmp_path / "other.git"), cwd=tmp_path)
+    other = f"file://{tmp_path / 'other.git'}"
+    contents = render_contents([test_request_object])
+    pool = ClonePool(str(tmp_path / "clones"), max_clones=2, disk_budget=10**9)
+    github = GitHubOperations(url, "token", "octocat")
+
+    with pool.lease(url) as repo:
+        github.local_repo_path, github.repo_git_path = (
+            repo.working_tree_dir,
+            repo.git_dir,
+        )
+        for path, content in contents.items():
+            with open(os.path.join(repo.working_tree_dir, path), "w") as file:
+                file.write(content)
+        github.push(list(contents))
+
+    store = ObjectStore(str(tmp_path / "objects.git"))
+    with store.lease(other) as snapshot:
+        snapshot.push(snapshot.commit(contents, [], "Policy update", IDENTITY))
+
+    tree = "main^{tree}"
+    assert git("rev-parse", tree, cwd=tmp_path / "remote.git") == git(
+        "rev-parse", tree, cwd=tmp_path / "other.git"
+    )
+
+
+def fetch_tip(path: str, url: str) -> None:
+    with ObjectStore(path).lease(url) as snapshot:
+        assert snapshot.parent is not None
+
+
+def test_workers_sharing_the_store_fetch_one_at_a_time(tmp_path, remote):
+    url, _ = remote
+    urls = []
+    for index in range(6):
+        git("clone", "--bare", url, str(tmp_path / f"copy-{index}.git"), cwd=tmp_path)
+        urls.append(f"file://{tmp_path / f'copy-{index}.git'}")
+    path = str(tmp_path / "objects.git")
+    ObjectStore(path).repo
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=fetch_tip, args=(path, url)) for url in urls]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [worker.exitcode for worker in workers] == [0] * 6
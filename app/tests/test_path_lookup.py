@@ -0,0 +1,93 @@
+import json
+
+from app.config.config import settings
+from app.utils.path_lookup import (
+    DATA_FILE,
+    build_path_grants,
+    lookup_rules,
+    split_path_grants,
+)
+from app.utils.write_rego import POLICY_FILE, render_files
+
+from .test_data import test_request_object
+
+path_policy = {
+    "name": "Paths",
+    "rules": [
+        [
+            {
+                "command": "input_prop_equals",
+                "properties": {
+                    "input_property": "request_path",
+                    "value": ["v1", "collections", "lakes"],
+                },
+            }
+        ],
+        [
+            {
+                "command": "input_prop_equals",
+                "properties": {
+                    "input_property": "request_path",
+                    "value": ["v1", "collections", "*"],
+                    "exceptional_value": "obs",
+                },
+            },
+            {
+                "command": "input_prop_equals",
+                "properties": {"input_property": "request_method", "value": "GET"},
+            },
+        ],
+        [
+            {
+                "command": "input_prop_equals",
+                "properties": {
+                    "input_property": "request_path",
+                    "value": ["v1", "items", "*"],
+                },
+            }
+        ],
+    ],
+}
+
+
+def test_only_path_and_method_rules_become_grants():
+    grants, remaining = split_path_grants(test_request_object["rules"])
+
+    assert grants == []
+    assert remaining == test_request_object["rules"]
+
+    grants, remaining = split_path_grants(path_policy["rules"])
+
+    assert grants == [
+        ("exact", "v1/collections/lakes/", "*", None),
+        ("prefix", "v1/collections", "GET", "obs"),
+        ("prefix", "v1/items", "*", None),
+    ]
+    assert remaining == []
+
+
+def test_data_document_is_keyed_by_path_prefix():
+    assert build_path_grants([path_policy]) == {
+        "exact": {"v1/collections/lakes/": {"*": True}},
+        "prefix": {
+            "v1/collections": {"GET": {"any": False, "exceptions": ["obs"]}},
+            "v1/items": {"*": {"any": True, "exceptions": []}},
+        },
+    }
+
+
+def test_lookup_mode_renders_data_document(monkeypatch):
+    monkeypatch.setattr(settings, "REGO_PATH_LOOKUP", True)
+
+    files = render_files([path_policy, test_request_object])
+    rego = "".join(files[POLICY_FILE])
+
+    assert lookup_rules in rego
+    assert 'input.request_path[1] == "items"' not in rego
+    assert rego.count("allow {") == 3 + len(test_request_object["rules"])
+    assert DATA_FILE == "path_grants/data.json"
+    assert json.loads("".join(files[DATA_FILE])) == build_path_grants([path_policy])
+
+
+def test_lookup_mode_is_disabled_by_default():
+    assert list(render_files([path_policy])) == [POLICY_FILE]
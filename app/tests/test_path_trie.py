@@ -0,0 +1,100 @@
+from app.utils.path_trie import (
+    PathGrant,
+    PathTrie,
+    PathTrieCache,
+    find_overlaps,
+    intersects,
+    split_path,
+)
+
+from .test_data import test_request_object
+
+
+def grant(value: list, exceptional_value: str = None) -> PathGrant:
+    return PathGrant("New", 0, tuple(value), exceptional_value)
+
+
+def test_paths_are_matched_with_wildcards_and_exceptions():
+    trie = PathTrie.from_policies([test_request_object])
+
+    def granted(path: str) -> list:
+        return sorted(g.rule for g in trie.match(split_path(path)))
+
+    assert granted("/v1/collections/lakes") == [0]
+    assert granted("/v1/collections/lakes/") == [0, 4]
+    # The exempted collection is only granted by the rule on its own sub paths
+    assert granted("/v1/collections/obs") == [1]
+    assert granted("/v1/collections") == []
+    assert granted("/v2/collections/lakes") == []
+
+
+def test_overlaps_with_stored_policies():
+    trie = PathTrie.from_policies([test_request_object])
+
+    def overlapping(new: PathGrant) -> list:
+        return sorted(g.rule for g in trie.overlaps(new))
+
+    assert overlapping(grant(["v1", "collections", "lakes"])) == [0, 4]
+    assert overlapping(grant(["v1", "collections", "obs", "items"])) == [1]
+    assert overlapping(grant(["v1", "*", "obs"])) == [1]
+    assert overlapping(grant(["v1", "collections", "*"], "lakes")) == [0, 1]
+    assert overlapping(grant(["v2", "*"])) == []
+
+
+def test_wildcards_do_not_overlap_on_their_exceptions():
+    assert not intersects(
+        grant(["v1", "collections", "*"], "obs"), grant(["v1", "collections", "obs"])
+    )
+    assert intersects(
+        grant(["v1", "collections", "*"], "obs"), grant(["v1", "*", "lakes", "*"])
+    )
+
+
+def test_find_overlaps_skips_the_policy_being_replaced():
+    policy = {**test_request_object, "name": "Copy"}
+
+    trie = PathTrie.from_policies([test_request_object])
+
+    overlaps = find_overlaps(trie, policy)
+
+    assert {"rule": 4, "policy": "Example", "policy_rule": 4} in overlaps
+    assert find_overlaps(trie, test_request_object) == []
+
+
+def test_sync_only_indexes_the_changed_policies():
+    copy = {**test_request_object, "name": "Copy"}
+    trie = PathTrie.from_policies([test_request_object, copy])
+    lakes = split_path("/v1/collections/lakes/")
+
+    narrowed = {**copy, "rules": test_request_object["rules"][:1]}
+    assert trie.sync([test_request_object, narrowed]) == 1
+    assert sorted((g.policy, g.rule) for g in trie.match(lakes)) == [
+        ("Copy", 0),
+        ("Example", 0),
+        ("Example", 4),
+    ]
+
+    assert trie.sync([narrowed]) == 1
+    assert [(g.policy, g.rule) for g in trie.match(lakes)] == [("Copy", 0)]
+
+    assert trie.sync([]) == 1
+    assert trie.root.empty()
+
+
+def test_cached_tries_are_synced_when_the_store_version_changes():
+    cache = PathTrieCache(maxsize=2)
+    loads = []
+
+    def load(policies: list):
+        return lambda: loads.append(1) or policies
+
+    def granted(version, policies: list) -> list:
+        with cache.use("Example", version, load(policies)) as trie:
+            return sorted(
+                g.rule for g in trie.match(split_path("/v1/collections/lakes/"))
+            )
+
+    assert granted(1, [test_request_object]) == [0, 4]
+    assert granted(1, []) == [0, 4]
+    assert granted(2, []) == []
+    assert len(loads) == 2
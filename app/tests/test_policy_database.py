@@ -0,0 +1,244 @@
+import json
+import multiprocessing
+
+import pytest
+from fastapi import HTTPException
+
+from app.database.policy_database import PolicyDatabase
+from app.database.policy_store import SQLiteStore, TinyDBStore, open_store
+
+
+@pytest.fixture(params=["tinydb", "sqlite"])
+def backend(request) -> str:
+    return request.param
+
+
+@pytest.fixture
+def database(backend, tmp_path) -> PolicyDatabase:
+    return PolicyDatabase(backend=open_store(backend, str(tmp_path / "policies.json")))
+
+
+def policy(name: str, owner: str, repo_url: str) -> dict:
+    return {"name": name, "owner": owner, "repo_url": repo_url, "rules": []}
+
+
+def test_repo_policies_are_partitioned_by_owner_and_repo(database):
+    database.add_policy(policy("a", "alice", "https://github.com/x/one"), "alice")
+    database.add_policy(policy("b", "alice", "https://github.com/x/two"), "alice")
+    database.add_policy(policy("c", "bob", "https://github.com/x/one"), "bob")
+    database.add_policy(policy("d", "alice", "https://github.com/x/one.git"), "alice")
+
+    names = [
+        p["name"]
+        for p in database.get_repo_policies("alice", "https://github.com/x/one/")
+    ]
+
+    assert names == ["a", "d"]
+    assert database.get_repo_policies("carol", "https://github.com/x/one") == []
+
+
+def test_repo_index_is_refreshed_after_writes(database):
+    database.add_policy(policy("a", "alice", "https://github.com/x/one"), "alice")
+    assert len(database.get_repo_policies("alice", "https://github.com/x/one")) == 1
+
+    database.delete_policy("a", "alice", "https://github.com/x/one")
+    assert database.get_repo_policies("alice", "https://github.com/x/one") == []
+
+
+def test_updates_merge_into_the_stored_policy(database):
+    database.add_policy(policy("a", "alice", "https://github.com/x/one"), "alice")
+    database.backend.update("a", "alice", {"repo_url": "https://github.com/x/two"})
+
+    assert database.get_policy("a", "alice")["rules"] == []
+    assert [p["name"] for p in database.get_repo_policies("alice", "x/two")] == []
+    assert [
+        p["name"]
+        for p in database.get_repo_policies("alice", "https://github.com/x/two")
+    ] == ["a"]
+
+
+def test_tinydb_policies_are_migrated_once(tmp_path):
+    json_path, sqlite_path = str(tmp_path / "db.json"), str(tmp_path / "db.sqlite")
+    legacy = PolicyDatabase(json_path)
+    legacy.add_policy(policy("a", "alice", "https://github.com/x/one"), "alice")
+    legacy.add_policy(policy("b", "bob", "https://github.com/x/one"), "bob")
+
+    database = PolicyDatabase(backend=open_store("sqlite", json_path))
+    assert isinstance(database.backend, SQLiteStore)
+    assert database.get_policies("bob") == [
+        policy("b", "bob", "https://github.com/x/one")
+    ]
+
+    # The SQLite file exists now, later writes to the JSON file are not copied again
+    legacy.add_policy(policy("c", "carol", "https://github.com/x/one"), "carol")
+    assert open_store("sqlite", json_path, sqlite_path).by_owner("carol") == []
+
+
+def test_writes_of_other_workers_are_seen_without_reload(tmp_path):
+    path = str(tmp_path / "db.json")
+    worker, other_worker = TinyDBStore(path), TinyDBStore(path)
+    worker.insert(policy("a", "alice", "https://github.com/x/one"))
+
+    assert [p["name"] for p in other_worker.by_owner("alice")] == ["a"]
+    reads = other_worker.reads
+    other_worker.get("a", "alice")
+    other_worker.by_repo("alice", "https://github.com/x/one")
+    assert other_worker.reads == reads
+
+    worker.update("a", "alice", {"rules": ["changed"]})
+    worker.insert(policy("b", "alice", "https://github.com/x/one"))
+    assert other_worker.get("a", "alice")["rules"] == ["changed"]
+    assert [p["name"] for p in other_worker.by_owner("alice")] == ["a", "b"]
+
+
+def open_migrated(json_path: str, count: int) -> None:
+    assert len(open_store("sqlite", json_path).all()) == count
+
+
+def test_workers_starting_together_migrate_once(tmp_path):
+    json_path = str(tmp_path / "db.json")
+    with open(json_path, "w") as file:
+        json.dump(
+            {
+                "_default": {
+                    str(index): policy(f"p{index}", "alice", "https://github.com/x/one")
+                    for index in range(1, 3001)
+                }
+            },
+            file,
+        )
+
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=open_migrated, args=(json_path, 3000)) for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [worker.exitcode for worker in workers] == [0] * 4
+    assert not (tmp_path / "db.sqlite.migrating").exists()
+
+
+def insert_policies(path: str, owner: str) -> None:
+    store = TinyDBStore(path)
+    for index in range(20):
+        store.insert(policy(f"{owner}-{index}", owner, "https://github.com/x/one"))
+
+
+def test_concurrent_workers_do_not_lose_writes(tmp_path):
+    path = str(tmp_path / "db.json")
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=insert_policies, args=(path, owner))
+        for owner in ("alice", "bob", "carol")
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(TinyDBStore(path).all()) == 60
+
+
+def test_writes_return_the_policy_before_and_after(database):
+    database.insert_policy(policy("a", "alice", "https://github.com/x/one"), "alice")
+    added = database.insert_policy(
+        policy("b", "alice", "https://github.com/x/one.git"), "alice"
+    )
+    assert added.policy["name"] == "b"
+    assert added.previous is None
+    with pytest.raises(HTTPException) as conflict:
+        database.insert_policy(
+            policy("a", "alice", "https://github.com/x/two"), "alice"
+        )
+    assert conflict.value.status_code == 409
+
+    moved = database.modify_policy(
+        "b", {"repo_url": "https://github.com/x/two"}, "alice"
+    )
+    assert moved.previous["repo_url"] == "https://github.com/x/one.git"
+    assert moved.policy["repo_url"] == "https://github.com/x/two"
+
+    removed = database.remove_policy("a", "alice", "https://github.com/x/one")
+    assert removed.policy["name"] == "a"
+    assert database.get_repo_policies("alice", "https://github.com/x/one") == []
+    with pytest.raises(HTTPException) as missing:
+        database.remove_policy("a", "alice", "https://github.com/x/one")
+    assert missing.value.status_code == 404
+
+
+def test_removing_from_another_repository_is_not_found(database):
+    database.add_policy(policy("a", "alice", "https://github.com/x/one"), "alice")
+
+    with pytest.raises(HTTPException) as missing:
+        database.remove_policy("a", "alice", "https://github.com/x/two")
+    assert missing.value.status_code == 404
+    assert database.get_policy("a", "alice")["name"] == "a"
+
+
+def test_renaming_onto_another_policy_is_a_conflict(database):
+    database.add_policy(policy("a", "alice", "https://github.com/x/one"), "alice")
+    database.add_policy(policy("b", "alice", "https://github.com/x/two"), "alice")
+    database.add_policy(policy("c", "bob", "https://github.com/x/one"), "bob")
+
+    with pytest.raises(HTTPException) as conflict:
+        database.modify_policy("b", {"name": "a", "rules": [["changed"]]}, "alice")
+    assert conflict.value.status_code == 409
+    assert [p["name"] for p in database.get_policies("alice")] == ["a", "b"]
+    assert database.get_policy("b", "alice")["rules"] == []
+
+    assert database.modify_policy("b", {"name": "b"}, "alice").policy["name"] == "b"
+    assert database.modify_policy("b", {"name": "c"}, "alice").policy["name"] == "c"
+    assert [p["name"] for p in database.get_policies("alice")] == ["a", "c"]
+
+
+def test_update_policy_applies_the_new_fields(database):
+    database.add_policy(policy("a", "alice", "https://github.com/x/one"), "alice")
+    database.update_policy("a", {"rules": [["changed"]]}, "alice")
+
+    assert database.get_policy("a", "alice")["rules"] == [["changed"]]
+
+
+def test_writes_refresh_the_snapshot_without_parsing_the_file(tmp_path):
+    store = TinyDBStore(str(tmp_path / "db.json"))
+    store.add(policy("a", "alice", "https://github.com/x/one"), "alice")
+    reads = store.reads
+
+    assert store.get("a", "alice")["name"] == "a"
+    assert store.by_owner("alice") == [policy("a", "alice", "https://github.com/x/one")]
+    assert store.reads == reads
+
+
+def test_path_tries_follow_the_writes_of_other_workers(database, backend, tmp_path):
+    other_worker = PolicyDatabase(
+        backend=open_store(backend, str(tmp_path / "policies.json"))
+    )
+    lakes = {
+        **policy("lakes", "alice", "https://github.com/x/one"),
+        "rules": [
+            [
+                {
+                    "command": "input_prop_equals",
+                    "properties": {
+                        "input_property": "request_path",
+                        "value": ["v1", "collections", "lakes"],
+                    },
+                }
+            ]
+        ],
+    }
+
+    def granted() -> list:
+        with database.path_trie("alice", "https://github.com/x/one") as trie:
+            return [g.policy for g in trie.match(["v1", "collections", "lakes", ""])]
+
+    assert granted() == []
+    other_worker.add_policy(lakes, "alice")
+    assert granted() == ["lakes"]
+    assert granted() == ["lakes"]
+    assert database.path_tries.hits == 1
+
+    other_worker.remove_policy("lakes", "alice", "https://github.com/x/one")
+    assert granted() == []
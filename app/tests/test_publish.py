@@ -0,0 +1,80 @@
+import subprocess
+
+import pytest
+from git import GitCommandError, Repo
+
+from app.server.services import github
+from app.server.services.client_pool import client_pool
+from app.server.services.clone_pool import ClonePool
+from app.server.services.github import GitHubOperations
+from app.utils.write_rego import WriteRego, git_blob_sha, render_contents
+
+from .git_remote import commit_file, git
+from .test_data import test_request_object
+
+
+def test_blob_ids_match_git(tmp_path):
+    content = render_contents([test_request_object])["auth.rego"]
+    (tmp_path / "auth.rego").write_text(content)
+
+    expected = subprocess.run(
+        ["git", "hash-object", str(tmp_path / "auth.rego")],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+    assert git_blob_sha(content) == expected
+
+
+def test_pushed_blobs_are_looked_up_in_the_repository(tmp_path):
+    repo = Repo.init(tmp_path)
+    content = render_contents([test_request_object])["auth.rego"]
+    (tmp_path / "auth.rego").write_text(content)
+    repo.index.add([str(tmp_path / "auth.rego")])
+    repo.index.commit("Add policies")
+
+    github = GitHubOperations("https://github.com/example/policies", "token", "user")
+    github.repo_git_path = repo.git_dir
+
+    assert github.blob_sha("auth.rego") == git_blob_sha(content)
+    assert github.blob_sha("policies/missing.rego") is None
+
+
+def test_failed_pushes_keep_the_git_error(tmp_path):
+    repo = Repo.init(tmp_path)
+    (tmp_path / "auth.rego").write_text("package httpapi.authz\n")
+    repo.create_remote("origin", str(tmp_path / "missing.git"))
+
+    github = GitHubOperations("https://github.com/example/policies", "token", "user")
+    github.repo_git_path = repo.git_dir
+
+    with pytest.raises(GitCommandError) as error:
+        github.push()
+    assert "push" in error.value.command
+
+
+def test_files_are_only_pushed_when_the_remote_lacks_them(
+    tmp_path, remote, monkeypatch
+):
+    url, seed = remote
+    pool = ClonePool(str(tmp_path / "clones"), max_clones=2, disk_budget=10**9)
+    monkeypatch.setattr(github, "clone_pool", pool)
+    content = render_contents([test_request_object])["auth.rego"]
+
+    writer = WriteRego("token", url, "octocat")
+    writer.github.complete_repo_url = url
+    try:
+        assert writer.write_to_file([test_request_object])
+        assert not writer.write_to_file([test_request_object])
+
+        # Another worker published other policies since, so the same files go up again
+        git("pull", cwd=seed)
+        commit_file(seed, "auth.rego", "package httpapi.authz\n")
+        assert writer.write_to_file([test_request_object])
+    finally:
+        client_pool.clear()
+
+    git("pull", cwd=seed)
+    assert (seed / "auth.rego").read_text() == content
+    assert git("rev-list", "--count", "HEAD", "--", "auth.rego", cwd=seed) == "4"
@@ -0,0 +1,172 @@
+import threading
+import time
+
+import pytest
+
+from app.server.auth.token_cache import token_cache
+from app.server.executors import BoundedExecutor
+from app.server import publish_queue as publish_queue_module
+from app.server.publish_queue import PublishQueue
+
+
+def make_queue(
+    publisher, window: float = 0.05, max_delay: float = 1, **options
+) -> PublishQueue:
+    return PublishQueue(
+        window,
+        max_delay,
+        publisher,
+        BoundedExecutor("git-test", 2, 16),
+        BoundedExecutor("storage-test", 1, 16),
+        **options,
+    )
+
+
+def test_mutations_of_a_repository_share_one_publish():
+    published = []
+    lock = threading.Lock()
+
+    def publisher(policies: list, **options) -> None:
+        with lock:
+            published.append((options["repo_url"], policies))
+
+    queue = make_queue(publisher)
+    policies = []
+    jobs = []
+    for index in range(50):
+        policies.append({"name": f"policy-{index}"})
+        jobs.append(queue.enqueue("repo-a", lambda: list(policies), repo_url="a"))
+    other = queue.enqueue("repo-b", lambda: [], repo_url="b")
+
+    for job in jobs + [other]:
+        job.wait(timeout=5)
+
+    assert sorted(url for url, _ in published) == ["a", "b"]
+    assert dict(published)["a"] == policies
+    assert queue.batches == 2
+    assert queue.pending() == 0
+
+
+def test_batches_of_a_busy_repository_wait_without_holding_a_worker():
+    release = threading.Event()
+    started = threading.Event()
+    published = []
+
+    def publisher(policies: list, **options) -> None:
+        published.append((options["repo_url"], policies))
+        if len(published) == 1:
+            started.set()
+            release.wait(5)
+
+    queue = make_queue(publisher)
+    first = queue.enqueue("repo-a", lambda: ["a1"], repo_url="a")
+    assert started.wait(5)
+    # Both batches are flushed while the first publish runs, and wait for it together
+    second = queue.enqueue("repo-a", lambda: ["a2"], repo_url="a")
+    time.sleep(0.2)
+    third = queue.enqueue("repo-a", lambda: ["a3"], repo_url="a")
+    time.sleep(0.2)
+
+    # The other worker is free for the other repositories
+    queue.enqueue("repo-b", lambda: ["b"], repo_url="b").wait(timeout=2)
+    release.set()
+    for job in (first, second, third):
+        job.wait(timeout=5)
+
+    assert published == [("a", ["a1"]), ("b", ["b"]), ("a", ["a3"])]
+    assert queue.batches == 3
+    assert queue._running == {}
+
+
+def test_failed_publish_fails_every_job_of_the_batch():
+    def publisher(policies: list, **options) -> None:
+        raise RuntimeError("push rejected")
+
+    queue = make_queue(publisher)
+    jobs = [queue.enqueue("repo", lambda: []) for _ in range(3)]
+
+    for job in jobs:
+        with pytest.raises(RuntimeError, match="push rejected"):
+            job.wait(timeout=5)
+
+
+def test_a_busy_repository_is_published_within_the_max_delay():
+    published = threading.Event()
+    queue = make_queue(lambda policies, **options: published.set(), 0.5, 0.3)
+
+    started = time.monotonic()
+    job = queue.enqueue("repo", lambda: [])
+    # Every mutation restarts the window, but not past the max delay
+    while not published.is_set() and time.monotonic() - started < 2:
+        queue.enqueue("repo", lambda: [])
+        time.sleep(0.05)
+    job.wait(timeout=2)
+
+    assert time.monotonic() - started < 0.5
+
+
+def test_jobs_report_every_stage_with_timings():
+    def publisher(policies: list, progress, **options) -> None:
+        progress("compiling")
+        progress("pushing")
+
+    queue = make_queue(publisher)
+    job = queue.enqueue("repo", lambda: [], owner="octocat")
+    assert queue.get_job(job.id).status == "queued"
+
+    job.wait(timeout=5)
+
+    status = job.as_dict()
+    assert status["status"] == "done"
+    assert list(status["timings"]) == ["queued", "compiling", "pushing", "done"]
+    assert status["duration"] >= 0
+
+
+def test_unknown_jobs_are_not_found(client):
+    token_cache.set("job-token", True, "octocat")
+    try:
+        response = client.get(
+            "/jobs/unknown", headers={"Authorization": "Bearer job-token"}
+        )
+    finally:
+        token_cache.invalidate("job-token")
+
+    assert response.status_code == 404
+
+
+def test_jobs_are_found_by_every_worker_sharing_the_jobs_directory(tmp_path):
+    jobs = str(tmp_path / "jobs")
+    worker = make_queue(lambda policies, **options: None, history=1, jobs_path=jobs)
+    other_worker = make_queue(lambda policies, **options: None, jobs_path=jobs)
+
+    job = worker.enqueue("repo", lambda: [], owner="octocat")
+    job.wait(timeout=5)
+
+    assert other_worker.get_job(job.id) is None
+    assert other_worker.job_status(job.id) == {**job.as_dict(), "owner": "octocat"}
+    assert other_worker.job_status("../jobs") is None
+
+    # Past its history the worker removes the records of its old jobs
+    worker.enqueue("repo", lambda: [], owner="octocat").wait(timeout=5)
+    assert other_worker.job_status(job.id) is None
+
+
+def test_jobs_of_another_worker_are_served(client, tmp_path, monkeypatch):
+    jobs = str(tmp_path / "jobs")
+    monkeypatch.setattr(publish_queue_module.publish_queue, "jobs_path", jobs)
+    job = make_queue(lambda policies, **options: None, jobs_path=jobs).enqueue(
+        "repo", lambda: [], owner="octocat"
+    )
+    job.wait(timeout=5)
+
+    token_cache.set("job-token", True, "octocat")
+    try:
+        response = client.get(
+            f"/jobs/{job.id}", headers={"Authorization": "Bearer job-token"}
+        )
+    finally:
+        token_cache.invalidate("job-token")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
+    assert "owner" not in response.json()
@@ -0,0 +1,42 @@
+from app.utils.build_rego_file import build_rego
+from app.utils.rego_cache import FragmentCache, rules_hash
+
+from .test_data import test_request_object
+
+
+def test_fragment_is_compiled_once():
+    cache = FragmentCache(maxsize=4)
+    rules = test_request_object["rules"]
+
+    first = cache.get_or_compile(rules)
+    second = cache.get_or_compile(rules)
+
+    assert first == second == build_rego(rules)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changed_rules_are_recompiled():
+    cache = FragmentCache(maxsize=4)
+    rules = test_request_object["rules"]
+    changed = rules[:1]
+
+    cache.get_or_compile(rules)
+    assert cache.get_or_compile(changed) == build_rego(changed)
+    assert rules_hash(rules) != rules_hash(changed)
+    assert cache.misses == 2
+
+
+def test_least_recently_used_fragment_is_evicted():
+    cache = FragmentCache(maxsize=2)
+    rules = test_request_object["rules"]
+
+    cache.get_or_compile(rules[:1])
+    cache.get_or_compile(rules[:2])
+    cache.get_or_compile(rules[:1])
+    cache.get_or_compile(rules[:3])
+
+    assert len(cache) == 2
+    cache.get_or_compile(rules[:1])
+    assert cache.hits == 2
+    cache.get_or_compile(rules[:2])
+    assert cache.misses == 4
@@ -0,0 +1,88 @@
+from app.utils.rego_ir import (
+    AllowRule,
+    Condition,
+    dedupe,
+    drop_subsumed,
+    iter_program,
+    lower_rules,
+    optimize,
+)
+
+from .test_data import test_request_object
+
+
+def rule(*expressions: str) -> AllowRule:
+    return AllowRule(tuple(Condition(expression) for expression in expressions))
+
+
+def test_lower_rules_splits_wildcard_into_conditions():
+    lowered = lower_rules(test_request_object["rules"][:1])
+
+    assert lowered == [
+        rule(
+            'input.request_path[0] == "v1"',
+            'input.request_path[1] == "collections"',
+            'input.request_path[2] != "obs"',
+            "input.company == data.items[_].company",
+            'input.request_method == "GET"',
+        )
+    ]
+
+
+def test_dedupe_ignores_condition_order():
+    rules = [rule("a", "b"), rule("b", "a"), rule("c")]
+
+    assert dedupe(rules) == [rule("a", "b"), rule("c")]
+
+
+def test_full_access_subsumes_rules_checking_the_same_property():
+    lowered = lower_rules(test_request_object["rules"])
+    admin = rule('input.groupname == "admin"')
+
+    optimized = drop_subsumed(dedupe(lowered + [admin]))
+
+    assert admin in optimized
+    assert not any(
+        Condition('input.groupname == "admin"') in r.body and r != admin
+        for r in optimized
+    )
+    assert len(optimized) == len(lowered)
+
+
+def test_shared_prefixes_are_factored_into_helpers():
+    program = optimize(
+        [
+            rule('input.request_path[0] == "v1"', 'input.request_path[1] == "a"'),
+            rule('input.request_path[0] == "v1"', 'input.request_path[1] == "b"'),
+            rule('input.request_method == "GET"'),
+        ]
+    )
+
+    assert [h.body for h in program.helpers] == [
+        (Condition('input.request_path[0] == "v1"'),)
+    ]
+    assert program.rules[0] == rule("allow_prefix_1", 'input.request_path[1] == "a"')
+    assert program.rules[2] == rule('input.request_method == "GET"')
+    assert "".join(iter_program(program)).startswith(
+        'allow_prefix_1 {\n  input.request_path[0] == "v1"\n}\n\n'
+    )
+
+
+def test_nested_prefixes_reference_their_parent_helper():
+    program = optimize(
+        [
+            rule("v1", "collections", "a"),
+            rule("v1", "collections", "b"),
+            rule("v1", "items"),
+        ]
+    )
+
+    assert [(h.name, h.body) for h in program.helpers] == [
+        ("allow_prefix_1", (Condition("v1"),)),
+        ("allow_prefix_2", (Condition("allow_prefix_1"), Condition("collections"))),
+    ]
+    assert program.rules == [
+        rule("allow_prefix_2", "a"),
+        rule("allow_prefix_2", "b"),
+        rule("allow_prefix_1", "items"),
+    ]
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app.server import repo_cache as repo_cache_module
+from app.server.http_client import close_http_client
+from app.server.repo_cache import RepoCache, fetch_pages, listing_key
+
+from .git_remote import StandIn
+
+PAGES = 3
+
+
+def stand_in(delay: float) -> type:
+    """Handles a paginated search, with an ETag per page"""
+
+    class Handler(StandIn):
+        requests = []
+
+        def do_GET(self) -> None:
+            page = int(parse_qs(urlparse(self.path).query)["page"][0])
+            etag = f'"page-{page}"'
+            Handler.requests.append((page, time.monotonic()))
+            time.sleep(delay)
+            if self.headers.get("If-None-Match") == etag:
+                return self.reply(304)
+            last = f'<http://{self.headers["Host"]}/search?page={PAGES}>; rel="last"'
+            self.reply(
+                200,
+                {"items": [{"name": f"repo-{page}"}]},
+                {"ETag": etag, "Link": last},
+            )
+
+    return Handler
+
+
+@pytest.fixture
+def search(monkeypatch, stand_in_server):
+    now = [0.0]
+    cache = RepoCache(maxsize=8, ttl=60, stale_ttl=600, clock=lambda: now[0])
+    monkeypatch.setattr(repo_cache_module, "repo_cache", cache)
+    handler = stand_in(delay=0.1)
+    yield f"{stand_in_server(handler)}/search", handler, cache, now
+
+
+def test_pages_are_fetched_concurrently_and_revalidated(search):
+    url, handler, cache, now = search
+    key = listing_key("github", "token")
+
+    async def load() -> list:
+        pages = await fetch_pages(key, "token", url, {"q": "user:octocat"}, {})
+        return [repo["name"] for page in pages for repo in page["items"]]
+
+    async def scenario() -> tuple:
+        started = time.monotonic()
+        first = await cache.get(key, load)
+        elapsed = time.monotonic() - started
+        cached = await cache.get(key, load)
+        # Past the ttl the stale listing is served while it is fetched again
+        now[0] = 61
+        stale = await cache.get(key, load)
+        await cache.drain()
+        await close_http_client()
+        return first, elapsed, cached, stale
+
+    first, elapsed, cached, stale = asyncio.run(scenario())
+
+    assert first == cached == stale == ["repo-1", "repo-2", "repo-3"]
+    # The first page, then the two others together
+    assert elapsed < 0.1 * PAGES
+    assert len(handler.requests) == 2 * PAGES
+    assert cache.stats() == {
+        "listings": 1,
+        "hits": 1,
+        "stale_hits": 1,
+        "misses": 1,
+        "not_modified": PAGES,
+    }
+
+
+def test_concurrent_misses_share_one_fetch(search):
+    url, handler, cache, _ = search
+    key = listing_key("github", "token")
+
+    async def load() -> list:
+        return await fetch_pages(key, "token", url, {}, {})
+
+    async def scenario() -> list:
+        results = await asyncio.gather(*(cache.get(key, load) for _ in range(5)))
+        await close_http_client()
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert all(result == results[0] for result in results)
+    assert len(handler.requests) == PAGES
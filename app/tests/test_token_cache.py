@@ -0,0 +1,62 @@
+import asyncio
+
+from app.server.auth.authorize_token import TokenBearer
+from app.server.auth.token_cache import TokenCache, token_cache, token_key
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_identities_expire_after_their_ttl():
+    clock = Clock()
+    cache = TokenCache(maxsize=4, ttl=60, negative_ttl=5, clock=clock)
+
+    cache.set("good", True, "octocat")
+    cache.set("bad", False)
+    clock.now = 10
+
+    assert cache.get("good") == (True, "octocat")
+    assert cache.get("bad") is None
+    clock.now = 61
+    assert cache.get("good") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_token_is_evicted():
+    cache = TokenCache(maxsize=2, ttl=60, negative_ttl=5)
+
+    cache.set("first", True, "a")
+    cache.set("second", True, "b")
+    cache.get("first")
+    cache.set("third", True, "c")
+
+    assert cache.get("second") is None
+    assert cache.get("first") == (True, "a")
+    assert len(cache) == 2
+
+
+def test_tokens_are_stored_hashed_and_can_be_invalidated():
+    cache = TokenCache(maxsize=2, ttl=60, negative_ttl=5)
+
+    cache.set("secret", True, "octocat")
+
+    assert "secret" not in cache._entries
+    assert token_key("secret") in cache._entries
+    cache.invalidate("secret")
+    assert cache.get("secret") is None
+
+
+def test_verified_tokens_skip_the_providers():
+    token_cache.set("cached-token", True, "octocat")
+    try:
+        assert asyncio.run(TokenBearer().verify_token("cached-token")) == (
+            True,
+            {"token": "cached-token", "login": "octocat"},
+        )
+    finally:
+        token_cache.invalidate("cached-token")
@@ -1,24 +1,29 @@
-from .map_commands import commands_map
+from typing import Iterator
 
+from .commands import parse_rules
 
-def build_rego(data) -> str:
+
+def iter_rego(data, indexed: bool = False) -> Iterator[str]:
     """
-    Maps each rule object to the corresponding function and builds the rego file
+    Compiles each rule object and yields the rego fragments one by one
 
     param: policy object
-    return string: rules, to be written to the rego file
+    param indexed: compile datasource checks to lookups in the indexed data document
+    return iterator: fragments of the rules, to be written to the rego file in order
     """
-    output = ""
-    for rule in data:
-        output += "allow {\n"
+    for rule in parse_rules(data, indexed):
+        yield "allow {\n"
         for command in rule:
-            func = commands_map[command["command"]]
-            output += "  " + func(command["properties"]) + "\n"
+            yield f"  {command.rego}\n"
+        yield "}\n\n"
 
-        if "full_access" in command["command"]:
-            output += "}\n\n"
-            continue
 
-        output += "}\n\n"
+def build_rego(data, indexed: bool = False) -> str:
+    """
+    Compiles each rule object and builds the rego file
 
-    return output
+    param: policy object
+    param indexed: compile datasource checks to lookups in the indexed data document
+    return string: rules, to be written to the rego file
+    """
+    return "".join(iter_rego(data, indexed))
@@ -0,0 +1,208 @@
+import json
+from typing import ClassVar, Optional, Tuple, Union
+
+
+def index_key(fields: Tuple[str, ...], exact: bool = False) -> str:
+    """
+    Names an index in the data document, exact indexes get their own key
+    so they never share one with a plain index of the same fields
+
+    param fields: the indexed fields, in lookup order
+    param exact: whether the index only holds objects with exactly those fields
+    return str: e.g "name,groupname", or "exact:name,groupname"
+    """
+    key = ",".join(fields)
+    return f"exact:{key}" if exact else key
+
+
+class Command:
+    """
+    A validated, immutable rule object, compiled to its rego conditions once when it is created
+    """
+
+    __slots__ = ("conditions", "rego")
+    command: ClassVar[str] = ""
+
+    def __init__(self, conditions: Tuple[str, ...]) -> None:
+        object.__setattr__(self, "conditions", conditions)
+        object.__setattr__(self, "rego", "\n  ".join(conditions))
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.rego!r})"
+
+
+class InputPropEquals(Command):
+    """Allow if the 'key on the request' equals the 'value assigned' to it"""
+
+    __slots__ = ("input_property", "value", "exceptional_value")
+    command = "input_prop_equals"
+
+    def __init__(
+        self,
+        input_property: str,
+        value: Union[str, Tuple[str, ...]],
+        exceptional_value: Optional[str] = None,
+    ) -> None:
+        object.__setattr__(self, "input_property", input_property)
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "exceptional_value", exceptional_value)
+
+        if type(value) == str:
+            # Logic that handles equality checks e.g input.company == "geobeyond"
+            conditions = (f'input.{input_property} == "{value}"',)
+        elif "*" in value:
+            # Allows all the paths, except the base path, and the exempted path variable
+            conditions = tuple(
+                f'input.{input_property}[{index}] == "{path_variable}"'
+                for index, path_variable in enumerate(value)
+                # Logic that handles the wildcard flag
+                if path_variable != "*"
+            )
+            if exceptional_value:
+                # Logic that handles the exempted path variable input.request_path[index] != "obs"
+                conditions += (
+                    f'input.{input_property}[{len(value) - 1}] != "{exceptional_value}"',
+                )
+        else:
+            # Logic that handles a unique path input.request_path == ["v1", "collections", "obs", ""]
+            conditions = (f"input.{input_property} == {json.dumps([*value, ''])}",)
+        super().__init__(conditions)
+
+    @classmethod
+    def from_properties(cls, properties: dict, indexed: bool = False) -> "Command":
+        value = properties["value"]
+        return cls(
+            properties["input_property"],
+            value if type(value) == str else tuple(value),
+            properties.get("exceptional_value"),
+        )
+
+
+class InputPropIn(Command):
+    """Allow if the 'key on the request' is present as a 'key in any of the objects' in the database(data)"""
+
+    __slots__ = ("input_property", "datasource_name", "indexed")
+    command = "input_prop_in"
+
+    def __init__(
+        self, input_property: str, datasource_name: str, indexed: bool = False
+    ) -> None:
+        object.__setattr__(self, "input_property", input_property)
+        object.__setattr__(self, "datasource_name", datasource_name)
+        object.__setattr__(self, "indexed", indexed)
+
+        if indexed:
+            # data.indexes.usergroups["groupname"][input.groupname]
+            condition = (
+                f'data.indexes.{datasource_name}["{input_property}"]'
+                f"[input.{input_property}]"
+            )
+        else:
+            # input.groupname == data.usergroups[_].groupname
+            condition = (
+                f"input.{input_property} == data.{datasource_name}[_].{input_property}"
+            )
+        super().__init__((condition,))
+
+    @classmethod
+    def from_properties(cls, properties: dict, indexed: bool = False) -> "Command":
+        return cls(properties["input_property"], properties["datasource_name"], indexed)
+
+
+class AllowFullAccess(Command):
+    """Allow full access to the API, if a property is present on the request"""
+
+    __slots__ = ("input_property", "value")
+    command = "allow_full_access"
+
+    def __init__(self, input_property: str, value: str) -> None:
+        object.__setattr__(self, "input_property", input_property)
+        object.__setattr__(self, "value", value)
+        super().__init__((f'input.{input_property} == "{value}"',))
+
+    @classmethod
+    def from_properties(cls, properties: dict, indexed: bool = False) -> "Command":
+        return cls(properties["input_property"], properties["value"])
+
+
+class AllowIfObjectInDatabase(Command):
+    """Allow if the properties on the input object match an object in the database"""
+
+    __slots__ = ("datasource_name", "datasource_variables", "indexed")
+    command = "allow_if_object_in_database"
+
+    def __init__(
+        self,
+        datasource_name: str,
+        datasource_variables: Tuple[str, ...],
+        indexed: bool = False,
+    ) -> None:
+        object.__setattr__(self, "datasource_name", datasource_name)
+        object.__setattr__(self, "datasource_variables", datasource_variables)
+        object.__setattr__(self, "indexed", indexed)
+
+        if indexed:
+            # data.indexes.groups["exact:name,groupname"][input.name][input.groupname]
+            lookups = "".join(f"[input.{v}]" for v in datasource_variables)
+            condition = (
+                f"data.indexes.{datasource_name}"
+                f'["{index_key(datasource_variables, exact=True)}"]{lookups}'
+            )
+        else:
+            # {"name": input.name,"groupname": input.groupname} == data.groups[_]
+            fields = ",".join(f'"{v}": input.{v}' for v in datasource_variables)
+            condition = f"{{{fields}}} == data.{datasource_name}[_]"
+        super().__init__((condition,))
+
+    @classmethod
+    def from_properties(cls, properties: dict, indexed: bool = False) -> "Command":
+        return cls(
+            properties["datasource_name"],
+            tuple(properties["datasource_variables"]),
+            indexed,
+        )
+
+
+command_types = {
+    command_type.command: command_type
+    for command_type in (
+        InputPropEquals,
+        InputPropIn,
+        AllowFullAccess,
+        AllowIfObjectInDatabase,
+    )
+}
+
+
+def parse_command(command: dict, indexed: bool = False) -> Command:
+    """
+    Validates a rule object and compiles it
+
+    param command: rule object
+    param indexed: compile datasource checks to lookups in the indexed data document
+    return Command: the compiled rule object
+    """
+    try:
+        command_type = command_types[command["command"]]
+    except KeyError:
+        raise ValueError(f"Unknown command {command.get('command')!r}")
+    return command_type.from_properties(command["properties"], indexed)
+
+
+def parse_rules(rules: list, indexed: bool = False) -> Tuple[Tuple[Command, ...], ...]:
+    """
+    Validates and compiles the rules of a policy
+
+    param rules: the rules of a policy
+    param indexed: compile datasource checks to lookups in the indexed data document
+    return tuple: one tuple of compiled rule objects per allow block
+    """
+    return tuple(
+        tuple(parse_command(command, indexed) for command in rule) for rule in rules
+    )
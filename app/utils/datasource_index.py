@@ -0,0 +1,78 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+from .commands import AllowIfObjectInDatabase, InputPropIn, index_key, parse_rules
+
+# The key of the indexed data document, the indexes are available at data.indexes
+DATA_KEY = "indexes"
+
+
+def required_indexes(policies: list) -> Dict[str, Set[Tuple[Tuple[str, ...], bool]]]:
+    """
+    Lists the datasource indexes the rules of the policies look up in indexed mode
+
+    param list: list of policies
+    return dict: the fields of every index, keyed by datasource name. The flag tells whether
+        datasource objects must have exactly those fields, as the object equality of
+        allow_if_object_in_database requires
+    """
+    indexes = {}
+    for policy in policies:
+        if not policy:
+            continue
+        for rule in parse_rules(policy["rules"]):
+            for command in rule:
+                if isinstance(command, InputPropIn):
+                    fields, exact = (command.input_property,), False
+                elif isinstance(command, AllowIfObjectInDatabase):
+                    fields, exact = command.datasource_variables, True
+                else:
+                    continue
+                indexes.setdefault(command.datasource_name, set()).add((fields, exact))
+    return indexes
+
+
+def build_datasource_index(
+    rows: Iterable[dict], fields: Tuple[str, ...], exact: bool = False
+) -> dict:
+    """
+    Nests the values of the datasource objects by field, so a membership check is one key lookup per field.
+    JSON object keys are strings, so only objects whose indexed values are all strings are indexed,
+    a number or boolean would otherwise be found by its string form.
+
+    param rows: the objects of the datasource
+    param fields: the fields to index, in lookup order
+    param exact: only index objects that have no fields besides the indexed ones
+    return dict: e.g {"admin": {"EDITOR_ATAC": true}} for the fields name and groupname
+    """
+    index = {}
+    for row in rows:
+        if not all(isinstance(row.get(field), str) for field in fields):
+            continue
+        if exact and len(row) != len(fields):
+            continue
+        node = index
+        for field in fields[:-1]:
+            node = node.setdefault(row[field], {})
+        node[row[fields[-1]]] = True
+    return index
+
+
+def build_index_document(policies: list, datasources: Dict[str, List[dict]]) -> dict:
+    """
+    Builds the indexed data document the indexed datasource lookups read from
+
+    param list: list of policies
+    param datasources: the objects of every datasource, keyed by datasource name
+    return dict: {"indexes": {datasource: {index_key: index}}}
+    """
+    document = {}
+    for datasource, indexes in required_indexes(policies).items():
+        rows = datasources.get(datasource, [])
+        if isinstance(rows, dict):
+            # rego iterates over the values of an object datasource the same way
+            rows = list(rows.values())
+        document[datasource] = {
+            index_key(fields, exact): build_datasource_index(rows, fields, exact)
+            for fields, exact in indexes
+        }
+    return {DATA_KEY: document}
@@ -0,0 +1,164 @@
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .commands import (
+    AllowFullAccess,
+    AllowIfObjectInDatabase,
+    Command,
+    InputPropEquals,
+    InputPropIn,
+    parse_rules,
+)
+from .path_trie import PathGrant, PathTrie, path_grants
+
+PATH_PROPERTY = "request_path"
+
+# Stands for an undefined reference, which makes a rego expression fail
+UNDEFINED = object()
+
+
+def lookup(document: Any, key: str) -> Any:
+    """Returns document[key] as rego resolves it, UNDEFINED if the key is missing"""
+    if isinstance(document, dict) and key in document:
+        return document[key]
+    return UNDEFINED
+
+
+def element(value: Any, index: int) -> Any:
+    """Returns value[index] as rego resolves it, UNDEFINED if the index is out of range"""
+    if isinstance(value, list) and 0 <= index < len(value):
+        return value[index]
+    return UNDEFINED
+
+
+def equal(left: Any, right: Any) -> bool:
+    """Compares two values with rego semantics, where booleans never equal numbers"""
+    if left is UNDEFINED or right is UNDEFINED:
+        return False
+    if isinstance(left, bool) != isinstance(right, bool):
+        return False
+    return left == right
+
+
+def iterate(datasource: Any) -> Iterable[Any]:
+    """Yields the values data.datasource[_] iterates over"""
+    if isinstance(datasource, list):
+        return datasource
+    if isinstance(datasource, dict):
+        return datasource.values()
+    return ()
+
+
+def holds(command: Command, request: dict, data: dict) -> bool:
+    """
+    Evaluates the rego conditions of a compiled command against a request
+
+    param command: the compiled rule object
+    param request: the input document of the decision
+    param data: the data document, holding the datasources
+    return bool: True if every condition of the command holds
+    """
+    if isinstance(command, AllowFullAccess):
+        return equal(lookup(request, command.input_property), command.value)
+
+    if isinstance(command, InputPropEquals):
+        value = lookup(request, command.input_property)
+        if type(command.value) == str:
+            return equal(value, command.value)
+        if "*" not in command.value:
+            return equal(value, [*command.value, ""])
+        for index, path_variable in enumerate(command.value):
+            if path_variable != "*" and not equal(element(value, index), path_variable):
+                return False
+        if command.exceptional_value:
+            exempted = element(value, len(command.value) - 1)
+            return exempted is not UNDEFINED and not equal(
+                exempted, command.exceptional_value
+            )
+        return True
+
+    if isinstance(command, InputPropIn):
+        value = lookup(request, command.input_property)
+        return any(
+            equal(value, lookup(row, command.input_property))
+            for row in iterate(lookup(data, command.datasource_name))
+        )
+
+    if isinstance(command, AllowIfObjectInDatabase):
+        obj = {v: lookup(request, v) for v in command.datasource_variables}
+        if UNDEFINED in obj.values():
+            return False
+        return any(
+            isinstance(row, dict)
+            and row.keys() == obj.keys()
+            and all(equal(row[key], value) for key, value in obj.items())
+            for row in iterate(lookup(data, command.datasource_name))
+        )
+
+    raise ValueError(f"Cannot evaluate {command!r}")
+
+
+class PolicyEvaluator:
+    """Evaluates decisions of the rego generated for a set of policies, without OPA"""
+
+    def __init__(self, policies: list) -> None:
+        """
+        Compiles the policies and indexes their allow blocks by the request path they require
+
+        param list: list of policies
+        return: None
+        """
+        self.paths = PathTrie()
+        self.by_grant: Dict[PathGrant, List[Tuple[int, str, int, tuple]]] = {}
+        self.any_path: List[Tuple[str, int, tuple]] = []
+        position = 0
+        for policy in policies:
+            if not policy:
+                continue
+            grants = {grant.rule: grant for grant in path_grants(policy)}
+            for index, rule in enumerate(parse_rules(policy["rules"])):
+                entry = (policy["name"], index, rule)
+                grant = grants.get(index)
+                if grant is None:
+                    self.any_path.append(entry)
+                    continue
+                if grant not in self.by_grant:
+                    self.paths.insert(grant)
+                self.by_grant.setdefault(grant, []).append((position, *entry))
+                position += 1
+
+    def candidates(self, request: dict) -> Iterable[Tuple[str, int, tuple]]:
+        """Yields the allow blocks that may match the request path of the input"""
+        path = lookup(request, PATH_PROPERTY)
+        if isinstance(path, list):
+            matches = [
+                entry
+                for grant in self.paths.match(path)
+                for entry in self.by_grant[grant]
+            ]
+            for _, *entry in sorted(matches, key=lambda match: match[0]):
+                yield tuple(entry)
+        yield from self.any_path
+
+    def evaluate(self, request: dict, data: dict = None) -> dict:
+        """
+        Decides a single request
+
+        param request: the input document of the decision
+        param data: the data document, holding the datasources
+        return dict: the decision, and the policy and allow block that granted it
+        """
+        data = data or {}
+        for name, index, rule in self.candidates(request):
+            if all(holds(command, request, data) for command in rule):
+                return {"allow": True, "policy": name, "rule": index}
+        return {"allow": False, "policy": None, "rule": None}
+
+    def evaluate_batch(self, requests: List[dict], data: dict = None) -> List[dict]:
+        """
+        Decides many requests against the same data document
+
+        param requests: the input documents of the decisions
+        param data: the data document, holding the datasources
+        return list: one decision per request, in order
+        """
+        return [self.evaluate(request, data) for request in requests]
@@ -0,0 +1,130 @@
+import json
+from typing import Dict, Iterator, Optional, Tuple
+
+from .commands import Command, InputPropEquals, parse_rules
+
+PATH_PROPERTY = "request_path"
+METHOD_PROPERTY = "request_method"
+ANY_METHOD = "*"
+
+# OPA loads a data.json under the directory of its key, so the grants are available at data.path_grants
+# without touching the data.json a policy repository keeps at its root
+DATA_KEY = "path_grants"
+DATA_FILE = f"{DATA_KEY}/data.json"
+
+lookup_rules = f"""path_grant_methods["{ANY_METHOD}"] {{
+  true
+}}
+
+path_grant_methods[method] {{
+  method := input.{METHOD_PROPERTY}
+}}
+
+allow {{
+  data.{DATA_KEY}.exact[concat("/", input.{PATH_PROPERTY})][path_grant_methods[_]]
+}}
+
+allow {{
+  length := numbers.range(0, count(input.{PATH_PROPERTY}))[_]
+  prefix := concat("/", array.slice(input.{PATH_PROPERTY}, 0, length))
+  data.{DATA_KEY}.prefix[prefix][path_grant_methods[_]].any
+}}
+
+allow {{
+  some index
+  segment := input.{PATH_PROPERTY}[index]
+  prefix := concat("/", array.slice(input.{PATH_PROPERTY}, 0, index))
+  segment != data.{DATA_KEY}.prefix[prefix][path_grant_methods[_]].exceptions[_]
+}}
+
+"""
+
+
+def path_grant(
+    rule: Tuple[Command, ...]
+) -> Optional[Tuple[str, str, str, Optional[str]]]:
+    """
+    Recognizes rules that only grant access to a request path, optionally for a single request method
+
+    param rule: the compiled rule objects of an allow block
+    return tuple: the kind of grant (exact or prefix), the path key, the method and the exempted path variable,
+        None if the rule can't be expressed as a lookup
+    """
+    paths, methods = [], []
+    for command in rule:
+        if not isinstance(command, InputPropEquals):
+            return None
+        if command.input_property == PATH_PROPERTY and type(command.value) != str:
+            paths.append(command)
+        elif command.input_property == METHOD_PROPERTY and type(command.value) == str:
+            methods.append(command.value)
+        else:
+            return None
+
+    if len(paths) != 1 or len(methods) > 1:
+        return None
+
+    value, method = paths[0].value, methods[0] if methods else ANY_METHOD
+    if "*" not in value:
+        # input.request_path == ["v1", "collections", "obs", ""]
+        return "exact", "/".join([*value, ""]), method, None
+    if value.index("*") != len(value) - 1:
+        return None
+    # input.request_path[0] == "v1", input.request_path[1] == "collections", optionally input.request_path[2] != "obs"
+    return "prefix", "/".join(value[:-1]), method, paths[0].exceptional_value
+
+
+def split_path_grants(rules: list) -> Tuple[list, list]:
+    """
+    Separates the rules that can be moved to the data document from the rules that stay in rego
+
+    param rules: the rules of a policy
+    return tuple: the path grants, and the remaining rules
+    """
+    grants, remaining = [], []
+    for rule, commands in zip(rules, parse_rules(rules)):
+        grant = path_grant(commands)
+        if grant:
+            grants.append(grant)
+        else:
+            remaining.append(rule)
+    return grants, remaining
+
+
+def build_path_grants(policies: list) -> Dict[str, dict]:
+    """
+    Builds the data document the lookup rules read from, keyed by path and path prefix
+
+    param list: list of policies
+    return dict: {"exact": {path: {method: true}}, "prefix": {prefix: {method: {"any": bool, "exceptions": []}}}}
+    """
+    exact, prefix = {}, {}
+    for policy in policies:
+        if not policy:
+            continue
+        for kind, key, method, exception in split_path_grants(policy["rules"])[0]:
+            if kind == "exact":
+                exact.setdefault(key, {})[method] = True
+                continue
+            grant = prefix.setdefault(key, {}).setdefault(
+                method, {"any": False, "exceptions": []}
+            )
+            if not exception:
+                grant["any"] = True
+            elif exception not in grant["exceptions"]:
+                grant["exceptions"].append(exception)
+
+    return {"exact": exact, "prefix": prefix}
+
+
+def iter_path_grants(policies: list) -> Iterator[str]:
+    """
+    Yields the JSON data document of the path grants fragment by fragment
+
+    param list: list of policies
+    return iterator: the JSON encoded data document
+    """
+    yield from json.JSONEncoder(indent=2, sort_keys=True).iterencode(
+        build_path_grants(policies)
+    )
+    yield "\n"
@@ -0,0 +1,364 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from .commands import InputPropEquals, parse_rules
+
+PATH_PROPERTY = "request_path"
+WILDCARD = "*"
+
+
+class PathGrant(NamedTuple):
+    """The request_path condition of an allow block"""
+
+    policy: str
+    rule: int
+    value: Tuple[str, ...]
+    exceptional_value: Optional[str] = None
+
+    @property
+    def exact(self) -> bool:
+        return WILDCARD not in self.value
+
+    def matches(self, path: List[str]) -> bool:
+        """
+        Checks the condition against a request path, as the generated rego does
+
+        param path: the request path segments, e.g ["v1", "collections", "lakes", ""]
+        return bool: True if the condition holds
+        """
+        if self.exact:
+            return list(path) == [*self.value, ""]
+        for index, segment in enumerate(self.value):
+            if segment != WILDCARD and (index >= len(path) or path[index] != segment):
+                return False
+        if self.exceptional_value:
+            index = len(self.value) - 1
+            return index < len(path) and path[index] != self.exceptional_value
+        return True
+
+    def segments(self) -> List[Optional[str]]:
+        """The segments the grant is stored under in the trie, None standing for a wildcard"""
+        if self.exact:
+            return [*self.value, ""]
+        value = list(self.value)
+        while value and value[-1] == WILDCARD:
+            value.pop()
+        return [None if segment == WILDCARD else segment for segment in value]
+
+
+class _TrieNode:
+    __slots__ = ("children", "wildcard", "exact", "prefix")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.wildcard: Optional["_TrieNode"] = None
+        self.exact: List[PathGrant] = []
+        self.prefix: List[PathGrant] = []
+
+    def child(self, segment: Optional[str]) -> "_TrieNode":
+        """Get the child of a segment, creating it, None standing for a wildcard"""
+        if segment is None:
+            if self.wildcard is None:
+                self.wildcard = _TrieNode()
+            return self.wildcard
+        if segment not in self.children:
+            self.children[segment] = _TrieNode()
+        return self.children[segment]
+
+    def find(self, segment: Optional[str]) -> Optional["_TrieNode"]:
+        """Get the child of a segment, None if there is none"""
+        if segment is None:
+            return self.wildcard
+        return self.children.get(segment)
+
+    def empty(self) -> bool:
+        return not (self.children or self.wildcard or self.exact or self.prefix)
+
+    def subtree(self) -> Iterator[PathGrant]:
+        yield from self.exact
+        yield from self.prefix
+        for child in self.children.values():
+            yield from child.subtree()
+        if self.wildcard:
+            yield from self.wildcard.subtree()
+
+
+class PathTrie:
+    """
+    Indexes the request_path conditions of the stored policies by path segment,
+    to answer which allow blocks grant a path and which ones overlap a new policy.
+
+    Rego is not generated from the trie: every command compiles its conditions once
+    and the fragment cache keeps the compiled rules of unchanged policies, see rego_cache.
+    """
+
+    def __init__(self) -> None:
+        self.root = _TrieNode()
+        # The rules and the grants of every policy in the trie, keyed by policy name
+        self.rules: Dict[str, list] = {}
+        self.grants: Dict[str, List[PathGrant]] = {}
+
+    @classmethod
+    def from_policies(cls, policies: list) -> "PathTrie":
+        """
+        Builds the trie from the request_path conditions of every allow block of the policies
+
+        param list: list of policies
+        return PathTrie: the index
+        """
+        trie = cls()
+        trie.sync(policies)
+        return trie
+
+    def sync(self, policies: list) -> int:
+        """
+        Brings the trie up to date with the policies, only the policies whose rules changed are indexed again
+
+        param list: list of policies, the policies missing from it are removed from the trie
+        return int: the number of policies indexed again or removed
+        """
+        rules = {}
+        for policy in policies:
+            if policy:
+                rules.setdefault(policy["name"], []).append(policy["rules"])
+        changed = [name for name in self.rules if name not in rules] + [
+            name for name, value in rules.items() if self.rules.get(name) != value
+        ]
+        for name in changed:
+            for grant in self.grants.pop(name, []):
+                self.remove(grant)
+            self.rules.pop(name, None)
+            if name not in rules:
+                continue
+            self.rules[name] = rules[name]
+            self.grants[name] = [
+                grant
+                for policy_rules in rules[name]
+                for grant in path_grants({"name": name, "rules": policy_rules})
+            ]
+            for grant in self.grants[name]:
+                self.insert(grant)
+        return len(changed)
+
+    def insert(self, grant: PathGrant) -> None:
+        node = self.root
+        for segment in grant.segments():
+            node = node.child(segment)
+        (node.exact if grant.exact else node.prefix).append(grant)
+
+    def remove(self, grant: PathGrant) -> None:
+        """Removes a grant, and the nodes it leaves empty"""
+        nodes = [self.root]
+        segments = grant.segments()
+        for segment in segments:
+            node = nodes[-1].find(segment)
+            if node is None:
+                return
+            nodes.append(node)
+        grants = nodes[-1].exact if grant.exact else nodes[-1].prefix
+        if grant in grants:
+            grants.remove(grant)
+        for parent, node, segment in reversed(list(zip(nodes, nodes[1:], segments))):
+            if not node.empty():
+                break
+            if segment is None:
+                parent.wildcard = None
+            else:
+                del parent.children[segment]
+
+    def match(self, path: List[str]) -> List[PathGrant]:
+        """
+        Finds the grants whose request_path condition holds for a path,
+        in time proportional to the path length rather than the number of grants
+
+        param path: the request path segments
+        return list: the matching grants
+        """
+        matches = []
+        nodes = [(self.root, 0)]
+        while nodes:
+            node, depth = nodes.pop()
+            matches += [grant for grant in node.prefix if grant.matches(path)]
+            if depth == len(path):
+                matches += node.exact
+                continue
+            segment = path[depth]
+            if isinstance(segment, str) and segment in node.children:
+                nodes.append((node.children[segment], depth + 1))
+            if node.wildcard:
+                nodes.append((node.wildcard, depth + 1))
+        return matches
+
+    def overlaps(self, grant: PathGrant) -> List[PathGrant]:
+        """
+        Finds the stored grants that allow at least one path the given grant allows
+
+        param grant: the request_path condition of a new allow block
+        return list: the overlapping grants
+        """
+        segments = grant.segments()
+        candidates = []
+        nodes = [(self.root, 0)]
+        while nodes:
+            node, depth = nodes.pop()
+            candidates += node.prefix
+            if depth == len(segments):
+                candidates += node.exact if grant.exact else node.subtree()
+                continue
+            segment = segments[depth]
+            if segment is None:
+                nodes += [(child, depth + 1) for child in node.children.values()]
+            elif segment in node.children:
+                nodes.append((node.children[segment], depth + 1))
+            if node.wildcard:
+                nodes.append((node.wildcard, depth + 1))
+
+        return list(
+            dict.fromkeys(c for c in candidates if c != grant and intersects(grant, c))
+        )
+
+
+class _CachedTrie:
+    def __init__(self) -> None:
+        self.trie = PathTrie()
+        self.version: Any = _UNSYNCED
+        # Held while the trie is synced or queried
+        self.lock = threading.Lock()
+
+
+_UNSYNCED = object()
+
+
+class PathTrieCache:
+    """
+    Keeps the path trie of the policies of every owner and repository, with LRU eviction.
+    A trie is used as is while the version of the store it was synced at holds,
+    past it only the policies that changed since are indexed again.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        """
+        :param maxsize: the maximum number of tries kept
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.syncs = 0
+        self._entries: "OrderedDict[Hashable, _CachedTrie]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def use(
+        self, key: Hashable, version: Any, load: Callable[[], list]
+    ) -> Iterator[PathTrie]:
+        """
+        Use the trie of a set of policies, exclusively
+
+        :param key: identifies the set, e.g (owner, repository)
+        :param version: the version of the store, None if the store has none and the trie is always synced
+        :param load: reads the policies of the set from the store
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _CachedTrie()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        with entry.lock:
+            if version is None or entry.version != version:
+                entry.trie.sync(load())
+                entry.version = version
+                self.syncs += 1
+            else:
+                self.hits += 1
+            yield entry.trie
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def path_grants(policy: dict) -> Iterator[PathGrant]:
+    """
+    Yields the request_path conditions of the allow blocks of a policy
+
+    param dict: the policy
+    return iterator: one grant per allow block with a list valued request_path condition
+    """
+    for index, rule in enumerate(parse_rules(policy["rules"])):
+        for command in rule:
+            if (
+                isinstance(command, InputPropEquals)
+                and command.input_property == PATH_PROPERTY
+                and type(command.value) != str
+            ):
+                yield PathGrant(
+                    policy["name"], index, command.value, command.exceptional_value
+                )
+                break
+
+
+def intersects(first: PathGrant, second: PathGrant) -> bool:
+    """
+    Checks whether some request path satisfies both request_path conditions
+
+    param first: a request_path condition
+    param second: another request_path condition
+    return bool: True if the conditions overlap
+    """
+    if first.exact:
+        return second.matches([*first.value, ""])
+    if second.exact:
+        return first.matches([*second.value, ""])
+
+    # Build the least constrained path both wildcards could match, and check it
+    length = max(len(first.value), len(second.value))
+    witness = []
+    for index in range(length):
+        fixed = {
+            grant.value[index]
+            for grant in (first, second)
+            if index < len(grant.value) and grant.value[index] != WILDCARD
+        }
+        if len(fixed) > 1:
+            return False
+        witness.append(fixed.pop() if fixed else "\0")
+    return first.matches(witness) and second.matches(witness)
+
+
+def split_path(path: str) -> List[str]:
+    """
+    Splits a request path the way the input document carries it
+
+    param path: e.g /v1/collections/lakes/
+    return list: e.g ["v1", "collections", "lakes", ""]
+    """
+    return path.lstrip("/").split("/")
+
+
+def find_overlaps(trie: PathTrie, policy: dict) -> List[dict]:
+    """
+    Finds the allow blocks of the stored policies whose request paths overlap those of a new policy
+
+    param trie: the trie of the stored policies
+    param policy: the policy being created, its stored version is skipped
+    return list: one entry per overlapping pair of allow blocks
+    """
+    return [
+        {"rule": grant.rule, "policy": existing.policy, "policy_rule": existing.rule}
+        for grant in path_grants(policy)
+        for existing in trie.overlaps(grant)
+        if existing.policy != policy["name"]
+    ]
@@ -0,0 +1,81 @@
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable
+
+from app.config.config import settings
+
+from .build_rego_file import build_rego
+
+
+def rules_hash(rules: list) -> str:
+    """
+    Computes a stable hash of a policy's rules
+
+    param rules: the rules of a policy
+    return string: sha256 hex digest of the canonical JSON form of the rules
+    """
+    canonical = json.dumps(rules, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class FragmentCache:
+    """Caches compiled rego fragments keyed by the hash of the rules they were built from"""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        """
+        Initializes the cache
+
+        param maxsize: the maximum number of fragments kept, least recently used are evicted first
+        return: None
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fragments: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get_or_compile(
+        self,
+        rules: list,
+        compile_rules: Callable[[list], Any] = build_rego,
+        namespace: str = "rego",
+    ) -> Any:
+        """
+        Returns the compiled form of the rules, compiling them only on a cache miss
+
+        param rules: the rules of a policy
+        param compile_rules: the function that compiles the rules
+        param namespace: separates entries produced by different compile functions
+        return: the compiled rules
+        """
+        key = (namespace, rules_hash(rules))
+        with self._lock:
+            if key in self._fragments:
+                self.hits += 1
+                self._fragments.move_to_end(key)
+                return self._fragments[key]
+            self.misses += 1
+
+        fragment = compile_rules(rules)
+
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self) -> None:
+        """Removes every cached fragment and resets the statistics"""
+        with self._lock:
+            self._fragments.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+
+fragment_cache = FragmentCache(settings.REGO_FRAGMENT_CACHE_SIZE)
@@ -0,0 +1,191 @@
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .commands import parse_rules
+
+
+@dataclass(frozen=True)
+class Condition:
+    """A single expression in the body of a rego rule, e.g input.company == "geobeyond" """
+
+    expression: str
+
+
+@dataclass(frozen=True)
+class AllowRule:
+    """An allow block, satisfied when every condition of its body holds"""
+
+    body: Tuple[Condition, ...]
+
+
+@dataclass(frozen=True)
+class HelperRule:
+    """A named rule holding conditions shared by several allow blocks"""
+
+    name: str
+    body: Tuple[Condition, ...]
+
+
+@dataclass
+class Program:
+    """The rules of a rego module, before they are rendered to text"""
+
+    rules: List[AllowRule]
+    helpers: List[HelperRule] = field(default_factory=list)
+
+
+def lower_rules(rules: list, indexed: bool = False) -> List[AllowRule]:
+    """
+    Translates the rules of a policy to allow blocks
+
+    param rules: the rules of a policy
+    param indexed: compile datasource checks to lookups in the indexed data document
+    return list: one allow block per rule, conditions repeated within a rule are dropped
+    """
+    lowered = []
+    for rule in parse_rules(rules, indexed):
+        body = dict.fromkeys(
+            Condition(condition) for command in rule for condition in command.conditions
+        )
+        lowered.append(AllowRule(tuple(body)))
+    return lowered
+
+
+def dedupe(rules: List[AllowRule]) -> List[AllowRule]:
+    """
+    Drops allow blocks whose conditions are the same as an earlier block's
+
+    param rules: allow blocks
+    return list: the first allow block of every distinct set of conditions
+    """
+    seen = set()
+    unique = []
+    for rule in rules:
+        key = frozenset(rule.body)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(rule)
+    return unique
+
+
+def drop_subsumed(rules: List[AllowRule]) -> List[AllowRule]:
+    """
+    Drops allow blocks that a less restrictive block already covers,
+    e.g a block checking input.groupname == "admin" makes every other block with that check redundant.
+    Expects the blocks to be deduplicated.
+
+    param rules: allow blocks
+    return list: the allow blocks that grant something no other block grants
+    """
+    bodies = [frozenset(rule.body) for rule in rules]
+    containing = {}
+    for index, body in enumerate(bodies):
+        for condition in body:
+            containing.setdefault(condition, set()).add(index)
+
+    removed = set()
+    for index in sorted(range(len(rules)), key=lambda i: len(bodies[i])):
+        if index in removed or not bodies[index]:
+            continue
+        candidates = sorted((containing[c] for c in bodies[index]), key=len)
+        supersets = set.intersection(*candidates)
+        supersets.discard(index)
+        removed |= supersets
+
+    return [rule for index, rule in enumerate(rules) if index not in removed]
+
+
+class _PrefixNode:
+    __slots__ = ("children", "count")
+
+    def __init__(self) -> None:
+        self.children = {}
+        self.count = 0
+
+
+def factor_shared_prefixes(
+    program: Program, helper_prefix: str = "allow_prefix", min_rules: int = 2
+) -> Program:
+    """
+    Moves leading conditions shared by several allow blocks into helper rules,
+    so OPA evaluates them once per query instead of once per block
+
+    param program: the rules to factor
+    param helper_prefix: the name the helper rules are numbered after
+    param min_rules: the number of blocks that must share a prefix for it to be factored
+    return Program: the allow blocks referencing the helper rules
+    """
+    root = _PrefixNode()
+    for rule in program.rules:
+        node = root
+        for condition in rule.body:
+            node = node.children.setdefault(condition, _PrefixNode())
+            node.count += 1
+
+    helpers = list(program.helpers)
+    helper_names = {}
+
+    def assign(node: _PrefixNode, pending: list, parent: Optional[str]) -> None:
+        for condition, child in node.children.items():
+            segment = [*pending, condition]
+            diverges = all(c.count != child.count for c in child.children.values())
+            if child.count >= min_rules and diverges:
+                name = f"{helper_prefix}_{len(helpers) + 1}"
+                body = ([Condition(parent)] if parent else []) + segment
+                helpers.append(HelperRule(name, tuple(body)))
+                helper_names[id(child)] = name
+                assign(child, [], name)
+            else:
+                assign(child, segment, parent)
+
+    assign(root, [], None)
+
+    rules = []
+    for rule in program.rules:
+        node, cut, helper = root, 0, None
+        for index, condition in enumerate(rule.body):
+            node = node.children[condition]
+            if id(node) in helper_names:
+                cut, helper = index + 1, helper_names[id(node)]
+        if helper:
+            rules.append(AllowRule((Condition(helper), *rule.body[cut:])))
+        else:
+            rules.append(rule)
+
+    return Program(rules, helpers)
+
+
+RULE_PASSES: Tuple[Callable[[List[AllowRule]], List[AllowRule]], ...] = (
+    dedupe,
+    drop_subsumed,
+)
+
+
+def optimize(rules: List[AllowRule], helper_prefix: str = "allow_prefix") -> Program:
+    """
+    Runs the optimization passes over the allow blocks
+
+    param rules: allow blocks
+    param helper_prefix: the name helper rules are numbered after, unique per rego package
+    return Program: the optimized rules
+    """
+    for optimization in RULE_PASSES:
+        rules = optimization(rules)
+    return factor_shared_prefixes(Program(rules), helper_prefix)
+
+
+def iter_program(program: Program) -> Iterator[str]:
+    """
+    Yields the rego text of the program fragment by fragment
+
+    param program: the rules to render
+    return iterator: helper rules followed by allow blocks
+    """
+    blocks = [(helper.name, helper.body) for helper in program.helpers]
+    blocks += [("allow", rule.body) for rule in program.rules]
+    for name, body in blocks:
+        yield f"{name} {{\n"
+        for condition in body:
+            yield f"  {condition.expression}\n"
+        yield "}\n\n"
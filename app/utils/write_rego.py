@@ -1,9 +1,181 @@
-from app.server.services.github import GitHubOperations
+import glob
+import hashlib
+import os
+import re
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, TextIO, Tuple
 
-from app.server.services.gitlab import GitLabOperations
+from app.config.config import settings
+from app.server.services.client_pool import client_lock, github_client, gitlab_client
+from app.server.services.github import COMMIT_MESSAGE
+from app.server.services.object_store import object_store
 from .build_rego_file import build_rego
+from .path_lookup import DATA_FILE, iter_path_grants, lookup_rules, split_path_grants
+from .rego_cache import fragment_cache
+from .rego_ir import iter_program, lower_rules, optimize
 
 initiate_rule = "package httpapi.authz\nimport input\ndefault allow = false\n\n\n\n"
+shard_rule = "package httpapi.authz\nimport input\n\n\n\n"
+POLICY_FILE = "auth.rego"
+SHARD_DIRECTORY = "policies"
+SHARD_PATTERN = re.compile(rf"{SHARD_DIRECTORY}/[A-Za-z0-9_-]*-[0-9a-f]{{8}}\.rego")
+
+
+def compile_mode() -> Tuple[bool, str]:
+    """
+    Reads the configured datasource compile mode
+
+    return tuple: whether datasource checks are indexed, and the fragment cache namespace of the mode
+    """
+    if settings.REGO_INDEXED_DATASOURCES:
+        return True, "indexed"
+    return False, "plain"
+
+
+def iter_policies(policies: list) -> Iterator[str]:
+    """
+    Yields the content of the rego file fragment by fragment, without building the whole file
+
+    param list: list of policies
+    return iterator: the package header followed by the compiled rules of every policy
+    """
+    if not policies:
+        return
+
+    yield from iter_aggregator()
+    yield from iter_rules(policies)
+
+
+def iter_aggregator() -> Iterator[str]:
+    """
+    Yields the package header, and the rules shared by every policy of the package
+
+    return iterator: the fragments of the module holding the default decision
+    """
+    yield initiate_rule
+    if settings.REGO_PATH_LOOKUP:
+        # Path grants are served from the data document by the lookup rules
+        yield lookup_rules
+
+
+def iter_shard(policy: dict) -> Iterator[str]:
+    """
+    Yields the module of a single policy, in the same package as the aggregator module
+
+    param dict: the policy
+    return iterator: the package header followed by the compiled rules of the policy
+    """
+    yield shard_rule
+    yield from iter_rules([policy], f"allow_prefix_{policy_digest(policy)}")
+
+
+def iter_rules(policies: list, helper_prefix: str = "allow_prefix") -> Iterator[str]:
+    """
+    Yields the compiled rules of the policies, in the configured compile mode
+
+    param list: list of policies
+    param helper_prefix: the name the optimizer's helper rules are numbered after
+    return iterator: the allow blocks of every policy
+    """
+    policies = [policy for policy in policies if policy]
+    if settings.REGO_PATH_LOOKUP:
+        policies = [
+            {**policy, "rules": split_path_grants(policy["rules"])[1]}
+            for policy in policies
+        ]
+
+    if settings.REGO_OPTIMIZE:
+        yield from iter_program(optimize(lower_policies(policies), helper_prefix))
+        return
+
+    indexed, namespace = compile_mode()
+    for policy in policies:
+        yield fragment_cache.get_or_compile(
+            policy["rules"], partial(build_rego, indexed=indexed), f"rego-{namespace}"
+        )
+
+
+def policy_digest(policy: dict) -> str:
+    """
+    Derives a short identifier from the name of a policy, unique within an owner's repository
+
+    param dict: the policy
+    return string: the first characters of the sha1 digest of the policy name
+    """
+    return hashlib.sha1(policy["name"].encode("utf-8")).hexdigest()[:8]
+
+
+def shard_path(policy: dict) -> str:
+    """
+    Maps a policy to the path of its module in sharded output mode
+
+    param dict: the policy
+    return string: e.g policies/Example-0a4d55a8.rego
+    """
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", policy["name"]).strip("_")
+    return f"{SHARD_DIRECTORY}/{slug}-{policy_digest(policy)}.rego"
+
+
+def lower_policies(policies: list) -> list:
+    """
+    Translates the policies to allow blocks for the optimizer, reusing the cached translation of unchanged policies
+
+    param list: list of policies
+    return list: the allow blocks of every policy, in order
+    """
+    indexed, namespace = compile_mode()
+    rules = []
+    for policy in policies:
+        if not policy:
+            continue
+        rules += fragment_cache.get_or_compile(
+            policy["rules"], partial(lower_rules, indexed=indexed), f"ir-{namespace}"
+        )
+    return rules
+
+
+def emit_policies(policies: list, stream: TextIO) -> None:
+    """
+    Streams the rego file to a writable text file or buffer
+
+    param list: list of policies
+    param stream: the file or buffer the rego file is written to
+    return: None
+    """
+    stream.writelines(iter_policies(policies))
+
+
+def render_files(policies: list) -> Dict[str, Iterable[str]]:
+    """
+    Maps every file published to the repository to the fragments of its content
+
+    param list: list of policies
+    return dict: file path relative to the repository root, and the fragments of the file
+    """
+    if settings.REGO_OUTPUT_MODE == "sharded":
+        files = {POLICY_FILE: iter_aggregator()}
+        for policy in policies:
+            if policy:
+                files[shard_path(policy)] = iter_shard(policy)
+    else:
+        files = {POLICY_FILE: iter_policies(policies)}
+
+    if settings.REGO_PATH_LOOKUP:
+        files[DATA_FILE] = iter_path_grants(policies)
+    return files
+
+
+def stale_shards(existing: Iterable[str], files: Dict[str, object]) -> list:
+    """
+    Lists the policy modules left in the repository by policies that no longer exist
+
+    param existing: paths of the files in the shard directory of the repository
+    param files: the files about to be published
+    return list: the paths of the modules to delete
+    """
+    return [
+        path for path in existing if SHARD_PATTERN.fullmatch(path) and path not in files
+    ]
 
 
 class WriteRego:
@@ -30,45 +202,177 @@ class WriteRego:
         self.repo_id = repo_id
         self.provider = provider
 
+        # The clients are reused across publishes, see client_pool
         if self.provider == "github":
-            self.github = GitHubOperations(
-                self.repo_url, self.access_token, self.username
-            )
+            self.github = github_client(self.repo_url, self.access_token, self.username)
 
         if self.provider == "gitlab":
-            self.gitlab = GitLabOperations(self.repo_id, self.access_token)
+            self.gitlab = gitlab_client(self.repo_id, self.access_token)
 
-    def write_to_file(self, policies: list) -> None:
+    def write_to_file(
+        self, policies: list, progress: Callable[[str], None] = None
+    ) -> bool:
         """
-        Write the rego file to the local git repository
+        Write the rego file to the local git repository.
+        Only policies whose rules changed since they were last compiled are rebuilt,
+        the others are taken from the fragment cache.
 
         param list: list of policies
-        return: None
+        param progress: called with "pushing" once the files are compiled
+        return bool: False if the repository already held the same files, so nothing was pushed
         """
+        return self.write_files(render_files(policies), progress)
 
-        result = "" if not policies else initiate_rule
-        for policy in policies:
-            if not policy:
-                continue
-            result += build_rego(policy["rules"])
+    def write_files(
+        self, files: Dict[str, Iterable[str]], progress: Callable[[str], None] = None
+    ) -> bool:
+        """
+        Publish rendered files, unless the repository already holds them byte for byte
+
+        param files: the fragments of every file, keyed by the path relative to the repository root
+        param progress: called with "pushing" before the files are committed
+        return bool: False if nothing changed, so no commit was made
+        """
+        repo = self.repo_id if self.provider == "gitlab" else self.repo_url
+        # The client keeps the state of the publish, so publishes sharing it take turns
+        with client_lock(self.provider, repo, self.access_token):
+            return self._write_files(files, progress)
 
-        if not policies:
-            result = ""
+    def _write_files(
+        self, files: Dict[str, Iterable[str]], progress: Callable[[str], None] = None
+    ) -> bool:
+        progress = progress or (lambda stage: None)
 
         if self.provider == "gitlab":
-            self.gitlab.prepare_data_and_commit(result, "update")
-            return
+            # The commit request carries every file whole
+            contents = join_files(files)
+            # The pooled client outlives the commits of other workers, its cached
+            # tree is loaded again only when the head of the branch moved since
+            self.gitlab.sync()
+            removed = stale_shards(self.gitlab.list_files(SHARD_DIRECTORY), contents)
+            if not removed and all(
+                self.gitlab.blob_sha(path) == git_blob_sha(content)
+                for path, content in contents.items()
+            ):
+                return False
+
+            # A single commit request, creating or updating every file as the tree says
+            progress("pushing")
+            if not self.gitlab.prepare_data_and_commit(contents, removed=removed):
+                raise RuntimeError("GitLab rejected the policy commit")
+            return True
+
+        if self.provider == "github" and settings.GIT_PUBLISH_ENGINE == "objects":
+            return self.write_objects(join_files(files), progress)
 
         if self.provider == "github":
-            # Define file path
-            file_path = f"{self.github.local_repo_path}/auth.rego"
+            # Lease the working copy of the repository, fetched up to date
+            with self.github.working_copy() as repo:
+                local_path = self.github.local_repo_path
+                existing = glob.glob(
+                    "*.rego", root_dir=f"{local_path}/{SHARD_DIRECTORY}"
+                )
+                removed = stale_shards(
+                    [f"{SHARD_DIRECTORY}/{name}" for name in existing], files
+                )
 
-            # Initialize repository
-            self.github.initialize()
+                # The files are streamed to the working copy fragment by fragment,
+                # git then hashes them from the disk
+                for path, fragments in files.items():
+                    os.makedirs(os.path.dirname(f"{local_path}/{path}"), exist_ok=True)
+                    with open(f"{local_path}/{path}", "w+") as file:
+                        file.writelines(fragments)
+                blobs = repo.git.hash_object("--", *files).split()
+                if not removed and all(
+                    self.github.blob_sha(path) == blob
+                    for path, blob in zip(files, blobs)
+                ):
+                    return False
 
-            with open(file_path, "w+") as file:
-                file.write(result)
-            # Update GitHub
-            self.github.push()
+                # Remove the modules of deleted policies, the push stages the deletion
+                for path in removed:
+                    os.remove(f"{local_path}/{path}")
 
-        return
+                # Update GitHub
+                progress("pushing")
+                self.github.push(list(files))
+            return True
+
+        return False
+
+    def write_objects(
+        self, contents: Dict[str, str], progress: Callable[[str], None] = None
+    ) -> bool:
+        """
+        Publish rendered files to GitHub without a working tree,
+        the commit is built from git objects in the shared object store
+
+        param contents: the content of every file, keyed by the path relative to the repository root
+        param progress: called with "pushing" before the commit is pushed
+        return bool: False if the tree didn't change, so no commit was made
+        """
+        with object_store.lease(
+            self.github.remote_url, self.github.complete_repo_url
+        ) as snapshot:
+            removed = stale_shards(snapshot.list_files(SHARD_DIRECTORY), contents)
+            commit = snapshot.commit(
+                contents, removed, COMMIT_MESSAGE, self.github.identity()
+            )
+            if commit is None:
+                return False
+
+            if progress:
+                progress("pushing")
+            snapshot.push(commit)
+        return True
+
+
+def join_files(files: Dict[str, Iterable[str]]) -> Dict[str, str]:
+    """
+    Join the fragments of rendered files, for the publish paths that send every file whole
+
+    param files: the fragments of every file, keyed by path
+    return dict: file path relative to the repository root, and the content of the file
+    """
+    return {path: "".join(fragments) for path, fragments in files.items()}
+
+
+def render_contents(policies: list) -> Dict[str, str]:
+    """
+    Render every file published to the repository
+
+    param list: list of policies
+    return dict: file path relative to the repository root, and the content of the file
+    """
+    return join_files(render_files(policies))
+
+
+def git_blob_sha(content: str) -> str:
+    """The id git gives a file with this content, to compare it with a blob of the repository"""
+    data = content.encode()
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def publish(
+    policies: list,
+    access_token: str,
+    repo_url: str,
+    username: str,
+    provider: str = "github",
+    repo_id: int = None,
+    progress: Callable[[str], None] = None,
+) -> bool:
+    """
+    Connect to the provider and write the policies of a repository.
+    Every step blocks on the network or the disk, so it is run in the git pool.
+    Nothing is sent when the repository already holds the rendered files.
+
+    params: policies, access token, repo url, username, repo provider, repo id
+    param progress: called with "compiling", then "pushing"
+    return bool: False if the repository was left untouched
+    """
+    if progress:
+        progress("compiling")
+    return WriteRego(access_token, repo_url, username, provider, repo_id).write_to_file(
+        policies, progress
+    )